@@ -0,0 +1,837 @@
+# Нагрузочные тесты бота без живого сервера Discord.
+# HTTP API и шлюз подменяются заглушкой внутри процесса с настраиваемой задержкой и ответами 429,
+# обработчики бота (форма заявки, кнопки администрации, тикеты, on_ready) вызываются как есть.
+#
+# Запуск: python bench_bot.py
+#         python bench_bot.py --scenario applicants --applicants 500 --latency-ms 80 --rate-limit 0.05
+#         python bench_bot.py --json bench.json --fail-p99-ms 2000
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import math
+import os
+import random
+import re
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+# Хранилище бенчмарка создается во временном каталоге, рабочая база бота не затрагивается
+BENCH_DIR = tempfile.mkdtemp(prefix="bench_bot_")
+os.environ["DB_PATH"] = os.path.join(BENCH_DIR, "bench_state.db")
+os.environ["TRANSCRIPT_DIR"] = os.path.join(BENCH_DIR, "transcripts")
+
+import discord
+import ticket_bot as bot
+
+snowflakes = itertools.count(10 ** 17)
+
+def snowflake():
+    return next(snowflakes)
+
+# Заглушка Discord: общий счетчик запросов, задержка и ответы 429 для всех вызовов API
+class FakeDiscord:
+    def __init__(self, latency, jitter, rate_limit, retry_after, max_wait, seed):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        # discord.py 2.x не принимает max_ratelimit_timeout меньше 30 с, заглушка повторяет это ограничение
+        self.max_wait = max(30.0, max_wait)
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.http_429 = 0
+        self.channels = {}
+        self.users = {}
+        self.guilds = []
+        self.user = FakeMember(self, None, "bench-bot", bot=True)
+        # Обработчики исходящих сообщений: сценарий отвечает на них как пользователь
+        self.on_dm = None
+        self.on_send = None
+
+    async def request(self, route):
+        while True:
+            self.requests += 1
+            await asyncio.sleep(max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter)))
+            if self.random.random() >= self.rate_limit:
+                return
+            self.http_429 += 1
+            bot.rest_scheduler.counters["http_429"] += 1
+            # Как discord.py: короткие 429 пережидаются внутри, длинные возвращаются вызывающему
+            if self.retry_after > self.max_wait:
+                raise discord.RateLimited(self.retry_after)
+            await asyncio.sleep(self.retry_after)
+
+    # Методы discord.Client, которые использует бот
+    def get_channel(self, channel_id):
+        return self.channels.get(channel_id)
+
+    def get_user(self, user_id):
+        return self.users.get(user_id)
+
+    async def fetch_user(self, user_id):
+        await self.request("users")
+        user = self.users.get(user_id)
+        if user is None:
+            raise not_found()
+        return user
+
+    def get_guild(self, guild_id):
+        return discord.utils.get(self.guilds, id=guild_id)
+
+    async def fetch_channel(self, channel_id):
+        await self.request("channels")
+        channel = self.channels.get(channel_id)
+        if channel is None:
+            raise not_found()
+        return channel
+
+    def get_partial_messageable(self, channel_id, guild_id=None):
+        channel = self.channels.get(channel_id)
+        if channel is None:
+            channel = FakeTextChannel(self, None, f"канал-{channel_id}", channel_id=channel_id)
+        return channel
+
+def not_found():
+    return discord.NotFound(SimpleNamespace(status=404, reason="Not Found"), "Unknown")
+
+class FakeRole:
+    def __init__(self, guild, name, permissions=None):
+        self.id = snowflake()
+        self.guild = guild
+        self.name = name
+        self.permissions = permissions or discord.Permissions.none()
+        self.mention = f"<@&{self.id}>"
+
+class FakeMember:
+    def __init__(self, api, guild, name, bot=False, admin=False):
+        self.api = api
+        self.id = snowflake()
+        self.guild = guild
+        self.name = name
+        self.display_name = name
+        self.bot = bot
+        self.mention = f"<@{self.id}>"
+        self.roles = []
+        self.guild_permissions = discord.Permissions(administrator=True) if admin else discord.Permissions.none()
+        self.dm_channel = FakeDMChannel(self)
+        api.users[self.id] = self
+
+    async def send(self, content=None, **kwargs):
+        await self.api.request("dm")
+        message = FakeMessage(self.api, self.dm_channel, self.api.user, content, **kwargs)
+        if self.api.on_dm is not None:
+            self.api.on_dm(self, message)
+        return message
+
+    async def add_roles(self, *roles, reason=None):
+        await self.api.request("roles")
+        self.roles.extend(roles)
+
+# Бот проверяет isinstance(message.channel, discord.DMChannel), поэтому заглушка наследует DMChannel
+class FakeDMChannel(discord.DMChannel):
+    def __init__(self, recipient):
+        self.id = snowflake()
+        self.recipient = recipient
+
+class FakeAttachment:
+    def __init__(self, filename):
+        self.filename = filename
+        self.url = f"https://cdn.invalid/{filename}"
+
+class FakeMessage:
+    def __init__(self, api, channel, author, content=None, embed=None, view=None, file=None, message_id=None, **kwargs):
+        self.api = api
+        self.id = message_id or snowflake()
+        self.channel = channel
+        self.author = author
+        self.content = content
+        self.embeds = [embed] if embed else []
+        self.components = [view] if view else []
+        self.attachments = [FakeAttachment(file.filename)] if file else []
+        self.created_at = datetime.now(timezone.utc)
+
+    async def edit(self, content=None, embed=None, view=None, attachments=None, **kwargs):
+        await self.api.request("messages")
+        if content is not None:
+            self.content = content
+        if embed is not None:
+            self.embeds = [embed]
+        if attachments is not None:
+            self.attachments = [FakeAttachment(file.filename) for file in attachments]
+        self.components = [view] if view else []
+        return self
+
+class FakeTextChannel:
+    def __init__(self, api, guild, name, category=None, topic=None, channel_id=None):
+        self.api = api
+        self.id = channel_id or snowflake()
+        self.guild = guild
+        self.name = name
+        self.category = category
+        self.topic = topic
+        self.mention = f"<#{self.id}>"
+        self.messages = {}
+
+    def post(self, author, content=None, **kwargs):
+        # Сообщение без запроса к API (подготовка данных сценария)
+        message = FakeMessage(self.api, self, author, content, **kwargs)
+        self.messages[message.id] = message
+        return message
+
+    async def send(self, content=None, **kwargs):
+        await self.api.request("messages")
+        message = self.post(self.api.user, content, **kwargs)
+        if self.api.on_send is not None:
+            self.api.on_send(self, message)
+        return message
+
+    def get_partial_message(self, message_id):
+        return self.messages.get(message_id) or FakeMessage(self.api, self, self.api.user, message_id=message_id)
+
+    async def fetch_message(self, message_id):
+        await self.api.request("messages")
+        message = self.messages.get(message_id)
+        if message is None:
+            raise not_found()
+        return message
+
+    async def history(self, limit=100, oldest_first=False):
+        messages = list(self.messages.values())
+        if not oldest_first:
+            messages.reverse()
+        if limit is not None:
+            messages = messages[:limit]
+        # Одна страница истории - один запрос на каждые 100 сообщений
+        for start in range(0, max(len(messages), 1), 100):
+            await self.api.request("messages")
+            for message in messages[start:start + 100]:
+                yield message
+
+    async def edit(self, name=None, overwrites=None, topic=None, **kwargs):
+        await self.api.request("channels")
+        if name is not None:
+            self.name = name
+        if topic is not None:
+            self.topic = topic
+        return self
+
+    async def delete(self):
+        await self.api.request("channels")
+        self.api.channels.pop(self.id, None)
+
+class FakeCategory:
+    def __init__(self, guild, name):
+        self.id = snowflake()
+        self.guild = guild
+        self.name = name
+        self.text_channels = []
+
+class FakeGuild:
+    def __init__(self, api, name="bench"):
+        self.api = api
+        self.id = snowflake()
+        self.name = name
+        self.default_role = FakeRole(self, "@everyone")
+        self.roles = [self.default_role, FakeRole(self, "Админ", discord.Permissions(administrator=True))]
+        self.categories = []
+        self.channels = {}
+        self.all_members = {}
+        self.cached_members = {}
+        self.chunked = False
+        api.guilds.append(self)
+
+    @property
+    def members(self):
+        return list(self.cached_members.values())
+
+    @property
+    def member_count(self):
+        return len(self.all_members)
+
+    async def chunk(self, cache=True):
+        # Список участников приходит через шлюз: один запрос на каждую 1000 участников
+        for _ in range(0, max(len(self.all_members), 1), 1000):
+            await self.api.request("gateway")
+        self.cached_members = dict(self.all_members)
+        self.chunked = True
+        return self.members
+
+    def add_member(self, name, cached=True, admin=False):
+        member = FakeMember(self.api, self, name, admin=admin)
+        self.all_members[member.id] = member
+        if cached:
+            self.cached_members[member.id] = member
+        return member
+
+    def add_role(self, role_id, name):
+        role = FakeRole(self, name)
+        role.id = role_id
+        self.roles.append(role)
+        return role
+
+    def get_member(self, user_id):
+        return self.cached_members.get(user_id)
+
+    async def fetch_member(self, user_id):
+        await self.api.request("members")
+        member = self.all_members.get(user_id)
+        if member is None:
+            raise not_found()
+        return member
+
+    def get_role(self, role_id):
+        return discord.utils.get(self.roles, id=role_id)
+
+    def get_channel(self, channel_id):
+        return self.channels.get(channel_id)
+
+    def add_channel(self, name, channel_id=None, category=None, topic=None):
+        channel = FakeTextChannel(self.api, self, name, category, topic, channel_id)
+        self.channels[channel.id] = channel
+        self.api.channels[channel.id] = channel
+        if category is not None:
+            category.text_channels.append(channel)
+        return channel
+
+    async def create_category(self, name):
+        await self.api.request("channels")
+        category = FakeCategory(self, name)
+        self.categories.append(category)
+        self.channels[category.id] = category
+        return category
+
+    async def create_text_channel(self, name, overwrites=None, category=None, topic=None):
+        await self.api.request("channels")
+        return self.add_channel(name, category=category, topic=topic)
+
+class FakeResponse:
+    def __init__(self, api):
+        self.api = api
+
+    async def send_message(self, *args, **kwargs):
+        await self.api.request("interactions")
+
+    async def defer(self, *args, **kwargs):
+        await self.api.request("interactions")
+
+    async def send_modal(self, modal):
+        await self.api.request("interactions")
+
+class FakeFollowup:
+    def __init__(self, api, channel):
+        self.api = api
+        self.channel = channel
+
+    async def send(self, content=None, **kwargs):
+        await self.api.request("webhooks")
+        return FakeMessage(self.api, self.channel, self.api.user, content)
+
+class FakeInteraction:
+    def __init__(self, api, guild, user, channel=None, message=None):
+        self.id = snowflake()
+        self.guild = guild
+        self.guild_id = guild.id
+        self.user = user
+        self.channel = channel
+        self.message = message
+        self.created_at = datetime.now(timezone.utc)
+        self.response = FakeResponse(api)
+        self.followup = FakeFollowup(api, channel)
+
+# Результат сценария: задержки отдельных операций и общее время
+class Result:
+    def __init__(self, name, latencies, wall, api):
+        self.name = name
+        self.latencies = sorted(latencies)
+        self.wall = wall
+        self.requests = api.requests
+        self.http_429 = api.http_429
+
+    def percentile(self, p):
+        if not self.latencies:
+            return 0.0
+        return self.latencies[max(0, math.ceil(p / 100 * len(self.latencies)) - 1)]
+
+    def to_dict(self):
+        return {
+            "scenario": self.name,
+            "count": len(self.latencies),
+            "wall_seconds": round(self.wall, 4),
+            "throughput": round(len(self.latencies) / self.wall, 2) if self.wall else 0.0,
+            "p50_ms": round(self.percentile(50) * 1000, 2),
+            "p99_ms": round(self.percentile(99) * 1000, 2),
+            "max_ms": round(self.percentile(100) * 1000, 2),
+            "requests": self.requests,
+            "http_429": self.http_429,
+        }
+
+async def measure(latencies, coro):
+    started = time.perf_counter()
+    await coro
+    latencies.append(time.perf_counter() - started)
+
+def make_api(args):
+    api = FakeDiscord(args.latency_ms / 1000, args.jitter_ms / 1000, args.rate_limit, args.retry_after, args.max_ratelimit_wait, args.seed)
+    bot.client = api
+    return api
+
+def make_guild(api):
+    guild = FakeGuild(api)
+    for channel_id, name in (
+        (bot.config.ticket_channel_id, "заявки"),
+        (bot.config.staff_channel_id, "заявки-администрация"),
+        (bot.config.report_channel_id, "жалобы"),
+        (bot.config.approved_channel_id, "одобренные"),
+        (bot.config.info_channel_id, "информация"),
+    ):
+        guild.add_channel(name, channel_id)
+    guild.add_role(bot.config.player_role_id, "Игрок")
+    return guild
+
+# Заполненная форма заявки от имени игрока
+def ticket_form(api, guild, user, nickname):
+    interaction = FakeInteraction(api, guild, user, guild.get_channel(bot.config.ticket_channel_id))
+    modal = bot.TicketModal()
+    values = [nickname, "18", "Да", "10", "Строить и общаться"]
+    modal._refresh(interaction, [{"type": 4, "custom_id": item.custom_id, "value": value} for item, value in zip(modal.children, values)])
+    return interaction, modal
+
+# N игроков одновременно отправляют форму и отвечают на вопросы в ЛС
+async def scenario_applicants(args):
+    api = make_api(args)
+    guild = make_guild(api)
+    questions = {question for _, question in bot.INTERVIEW_QUESTIONS}
+    submitted = {}
+    submit_latencies = []
+    answer_latencies = []
+    total_latencies = []
+    answers = set()
+    done = asyncio.Event()
+
+    async def answer(user):
+        await asyncio.sleep(args.think_ms / 1000)
+        message = FakeMessage(api, user.dm_channel, user, "Ответ на вопрос")
+        await measure(answer_latencies, bot.on_message(message))
+
+    def on_dm(user, message):
+        # Шлюз доставляет ответ пользователя на каждый вопрос опроса
+        if message.content in questions:
+            task = asyncio.create_task(answer(user))
+            answers.add(task)
+            task.add_done_callback(answers.discard)
+
+    def on_send(channel, message):
+        if channel.id == bot.config.staff_channel_id:
+            match = re.match(r"<@(\d+)>", message.content or "")
+            if match and int(match.group(1)) in submitted:
+                total_latencies.append(time.perf_counter() - submitted[int(match.group(1))])
+                if len(total_latencies) == args.applicants:
+                    done.set()
+
+    api.on_dm = on_dm
+    api.on_send = on_send
+    applicants = [guild.add_member(f"игрок{i}") for i in range(args.applicants)]
+
+    async def apply(user):
+        interaction, modal = ticket_form(api, guild, user, user.name)
+        submitted[user.id] = time.perf_counter()
+        await measure(submit_latencies, modal.on_submit(interaction))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(apply(user) for user in applicants))
+    try:
+        await asyncio.wait_for(done.wait(), args.timeout)
+    except asyncio.TimeoutError:
+        print(f"  ! дошло до администрации {len(total_latencies)} из {args.applicants} заявок", file=sys.stderr)
+    wall = time.perf_counter() - started
+    return [
+        Result("applicants: on_submit", submit_latencies, wall, api),
+        Result("applicants: ответ в ЛС", answer_latencies, wall, api),
+        Result("applicants: форма -> администрация", total_latencies, wall, api),
+    ]
+
+# N игроков многократно нажимают кнопку заявки и отправляют форму дважды, каждый второй - с чужим ником.
+# Лишние попытки должны отсеиваться одним ответом на взаимодействие, без ЛС и сообщений администрации
+async def scenario_spam(args):
+    api = make_api(args)
+    guild = make_guild(api)
+    ticket_channel = guild.get_channel(bot.config.ticket_channel_id)
+    users = [guild.add_member(f"спамер{i}") for i in range(args.spam_users)]
+    # Новые корзины: нажатия из предыдущих запусков не влияют на результат
+    bot.application_limiter = bot.SubmissionLimiter(bot.APPLICATION_USER_BURST, bot.APPLICATION_USER_PER_MINUTE, bot.APPLICATION_GLOBAL_BURST, bot.APPLICATION_GLOBAL_PER_MINUTE)
+    click_latencies = []
+    submit_latencies = []
+
+    async def click(user):
+        interaction = FakeInteraction(api, guild, user, ticket_channel)
+        await measure(click_latencies, bot.TicketView().ticket_button.callback(interaction))
+
+    async def submit(user, nickname):
+        interaction, modal = ticket_form(api, guild, user, nickname)
+        await measure(submit_latencies, modal.on_submit(interaction))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(click(user) for user in users for _ in range(args.spam_clicks)))
+    clicks = Result("spam: нажатия кнопки", click_latencies, time.perf_counter() - started, api)
+
+    requests, http_429 = api.requests, api.http_429
+    started = time.perf_counter()
+    await asyncio.gather(*(submit(user, users[i - i % 2].name.upper()) for i, user in enumerate(users) for _ in range(2)))
+    forms = Result("spam: повторные формы", submit_latencies, time.perf_counter() - started, api)
+    forms.requests = api.requests - requests
+    forms.http_429 = api.http_429 - http_429
+
+    for user in users:
+        bot.interview_dispatcher.discard(user.id)
+    return [clicks, forms]
+
+# Администраторы одновременно принимают и отклоняют N заявок
+async def scenario_decisions(args):
+    api = make_api(args)
+    guild = make_guild(api)
+    staff_channel = guild.get_channel(bot.config.staff_channel_id)
+    admin = guild.add_member("админ", admin=True)
+    rng = random.Random(args.seed)
+    clicks = []
+    for i in range(args.decisions):
+        applicant = guild.add_member(f"заявитель{i}", cached=rng.random() < args.member_cache_hit)
+        message = staff_channel.post(api.user, f"<@{applicant.id}> подал заявку:", view=True)
+        bot.application_store.add(message.id, staff_channel.id, applicant.id, applicant.name, "18")
+        clicks.append((message, "accept" if i % 2 == 0 else "reject"))
+
+    latencies = {"accept": [], "reject": []}
+
+    async def click(message, decision):
+        view = bot.ApplicationActionView()
+        button = view.accept_application_button if decision == "accept" else view.reject_application_button
+        interaction = FakeInteraction(api, guild, admin, staff_channel, message)
+        await measure(latencies[decision], button.callback(interaction))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(click(message, decision) for message, decision in clicks))
+    wall = time.perf_counter() - started
+    return [
+        Result("decisions: принять", latencies["accept"], wall, api),
+        Result("decisions: отклонить", latencies["reject"], wall, api),
+    ]
+
+# N пользователей одновременно открывают тикеты через панель жалоб
+async def scenario_tickets(args):
+    api = make_api(args)
+    guild = make_guild(api)
+    report_channel = guild.get_channel(bot.config.report_channel_id)
+    view = bot.ReportTypeView()
+    latencies = []
+
+    async def click(i):
+        user = guild.add_member(f"жалобщик{i}")
+        interaction = FakeInteraction(api, guild, user, report_channel)
+        button = view.children[i % len(view.children)]
+        await measure(latencies, button.callback(interaction))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(click(i) for i in range(args.tickets)))
+    wall = time.perf_counter() - started
+    return [Result("tickets: открытие тикета", latencies, wall, api)]
+
+# Запуск бота: восстановление индекса тикетов и панелей, с сохраненными ID панелей и без них
+async def scenario_on_ready(args):
+    api = make_api(args)
+    guild = make_guild(api)
+    category = FakeCategory(guild, bot.TICKET_CATEGORY_NAME)
+    guild.categories.append(category)
+    guild.channels[category.id] = category
+    ticket_types = list(bot.TICKET_TYPES)
+    for i in range(args.open_tickets):
+        user = guild.add_member(f"игрок{i}")
+        ticket_type = ticket_types[i % len(ticket_types)]
+        guild.add_channel(f"тикет-{ticket_type}-{user.name}", category=category, topic=bot.ticket_topic(ticket_type, user.id))
+
+    # Панели уже есть в каналах, но не на последнем месте в истории; их ID сохраняются при первом запуске
+    for channel_id in (bot.config.ticket_channel_id, bot.config.report_channel_id, bot.config.info_channel_id):
+        channel = guild.get_channel(channel_id)
+        image = SimpleNamespace(filename=bot.INFO_IMAGE_NAME) if channel_id == bot.config.info_channel_id else None
+        channel.post(api.user, view=True, file=image)
+        for i in range(10):
+            channel.post(guild.add_member(f"гость{channel_id}-{i}"), "сообщение")
+
+    # Запуск процесса восстанавливает индексы и панели; повторный on_ready после переподключения к шлюзу
+    # ничего не повторяет - именно эти запросы экономятся при сбоях Discord
+    results = []
+    started = time.perf_counter()
+    for name, restart in (("on_ready: запуск процесса", True), ("on_ready: переподключение к шлюзу", False)):
+        latencies = []
+        requests, http_429 = api.requests, api.http_429
+        for _ in range(args.repeat):
+            if restart:
+                bot.panels_restored = False
+                bot.interview_dispatcher.resumed = False
+            await measure(latencies, bot.on_ready())
+        result = Result(name, latencies, time.perf_counter() - started, api)
+        result.requests = api.requests - requests
+        result.http_429 = api.http_429 - http_429
+        results.append(result)
+        started = time.perf_counter()
+    return results
+
+# Minecraft-сервер, отвечающий на Server List Ping: статус в JSON и пинг, с задержкой ответа
+class FakeSLPServer:
+    def __init__(self, latency, players=17, max_players=100, version="Paper 1.21.1", motd="§aMineStory §7- ванильное выживание"):
+        self.latency = latency
+        self.status = {
+            "version": {"name": version, "protocol": 767},
+            "players": {"max": max_players, "online": players},
+            "description": {"text": "", "extra": [motd]},
+        }
+        self.server = None
+        self.port = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    def stop(self):
+        # Новые подключения отклоняются, как у выключенного сервера
+        self.server.close()
+
+    async def handle(self, reader, writer):
+        try:
+            await bot.slp_read_packet(reader)  # рукопожатие
+            await bot.slp_read_packet(reader)  # запрос статуса
+            await asyncio.sleep(self.latency)
+            writer.write(bot.slp_packet(0x00, bot.slp_string(json.dumps(self.status, ensure_ascii=False))))
+            await writer.drain()
+            packet_id, payload = await bot.slp_read_packet(reader)
+            await asyncio.sleep(self.latency)
+            writer.write(bot.slp_packet(packet_id, payload))
+            await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+# Опрос Minecraft-сервера и N нажатий кнопки статистики: пока сервер доступен и после его остановки.
+# Нажатия обслуживаются из памяти, поэтому их задержка - только ответ на взаимодействие
+async def scenario_server_stats(args):
+    api = make_api(args)
+    guild = make_guild(api)
+    info_channel = guild.get_channel(bot.config.info_channel_id)
+    slp = FakeSLPServer(args.latency_ms / 1000)
+    await slp.start()
+    address = f"127.0.0.1:{slp.port}"
+    bot.guild_settings.update(guild.id, "server_ip", address)
+    bot.server_status = bot.ServerStatusPoller(0, bot.SERVER_STATUS_TTL, 1.0, bot.SERVER_STATUS_FAILURES, bot.SERVER_STATUS_COOLDOWN)
+    user = guild.add_member("игрок")
+
+    async def clicks(name):
+        latencies = []
+        requests, http_429 = api.requests, api.http_429
+
+        async def click():
+            interaction = FakeInteraction(api, guild, user, info_channel)
+            await measure(latencies, bot.InfoView().server_stats_button.callback(interaction))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(click() for _ in range(args.stats_clicks)))
+        result = Result(name, latencies, time.perf_counter() - started, api)
+        result.requests = api.requests - requests
+        result.http_429 = api.http_429 - http_429
+        return result
+
+    results = []
+    try:
+        polls = []
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            await measure(polls, bot.server_status.poll(address))
+        results.append(Result("server_stats: опрос SLP", polls, time.perf_counter() - started, api))
+        results.append(await clicks("server_stats: кнопка, сервер доступен"))
+
+        # Сервер выключен: опросы завершаются ошибкой до размыкания автомата, затем пропускаются
+        slp.stop()
+        polls = []
+        requests, http_429 = api.requests, api.http_429
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            await measure(polls, bot.server_status.poll(address))
+        result = Result("server_stats: опрос, сервер выключен", polls, time.perf_counter() - started, api)
+        result.requests = api.requests - requests
+        result.http_429 = api.http_429 - http_429
+        results.append(result)
+        results.append(await clicks("server_stats: кнопка, сервер выключен"))
+    finally:
+        bot.guild_settings.reset(guild.id)
+    return results
+
+SCENARIOS = {
+    "applicants": scenario_applicants,
+    "decisions": scenario_decisions,
+    "tickets": scenario_tickets,
+    "spam": scenario_spam,
+    "on_ready": scenario_on_ready,
+    "server_stats": scenario_server_stats,
+}
+
+def print_results(results):
+    header = f"{'сценарий':<40} {'кол-во':>7} {'оп/с':>9} {'p50, мс':>9} {'p99, мс':>9} {'макс, мс':>9} {'запросы':>8} {'429':>5}"
+    print(header)
+    print("-" * len(header))
+    for result in results:
+        row = result.to_dict()
+        print(f"{row['scenario']:<40} {row['count']:>7} {row['throughput']:>9.1f} {row['p50_ms']:>9.1f} {row['p99_ms']:>9.1f} {row['max_ms']:>9.1f} {row['requests']:>8} {row['http_429']:>5}")
+
+# Redis-совместимый сервер для проверки RedisStateStore без настоящего Redis: команды хэшей по RESP.
+# Работает в отдельном потоке, потому что клиент бота синхронный
+class FakeRedisHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                args = self.read_command()
+            except ConnectionError:
+                return
+            if args is None:
+                return
+            self.wfile.write(self.server.execute(args))
+
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            raise ConnectionError("ожидается массив RESP")
+        args = []
+        for _ in range(int(line[1:-2])):
+            length = int(self.rfile.readline()[1:-2])
+            args.append(self.rfile.read(length + 2)[:-2].decode("utf-8"))
+        return args
+
+class FakeRedisServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakeRedisHandler)
+        self.hashes = {}
+        self.lock = threading.Lock()
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        host, port = self.server_address
+        return f"redis://{host}:{port}/0"
+
+    def execute(self, args):
+        command, args = args[0].upper(), args[1:]
+        with self.lock:
+            if command in ("PING", "AUTH", "SELECT"):
+                return b"+OK\r\n" if command != "PING" else b"+PONG\r\n"
+            if command == "HSET":
+                fields = self.hashes.setdefault(args[0], {})
+                added = sum(1 for i in range(1, len(args), 2) if args[i] not in fields)
+                fields.update(zip(args[1::2], args[2::2]))
+                return b":%d\r\n" % added
+            if command == "HGET":
+                return bulk(self.hashes.get(args[0], {}).get(args[1]))
+            if command == "HDEL":
+                fields = self.hashes.get(args[0], {})
+                return b":%d\r\n" % sum(1 for field in args[1:] if fields.pop(field, None) is not None)
+            if command == "HGETALL":
+                items = [item for pair in self.hashes.get(args[0], {}).items() for item in pair]
+                return b"*%d\r\n" % len(items) + b"".join(bulk(item) for item in items)
+        return f"-ERR unknown command '{command}'\r\n".encode("utf-8")
+
+def bulk(value):
+    if value is None:
+        return b"$-1\r\n"
+    data = value.encode("utf-8")
+    return b"$%d\r\n%s\r\n" % (len(data), data)
+
+# Подмена хранилища состояния бота выбранным в аргументах
+def use_state_store(args):
+    if args.state_backend == "redis":
+        url = args.redis_url or FakeRedisServer().url
+        store = bot.RedisStateStore(url, f"bench{os.getpid()}")
+    else:
+        store = bot.make_state_store(args.state_backend)
+    bot.state_store = store
+    bot.application_store.state = store
+    bot.open_tickets.state = store
+    bot.interview_dispatcher.state = store
+    bot.guild_settings.state = store
+
+async def run(args):
+    use_state_store(args)
+    bot.state_store.open()
+    bot.application_history.open()
+    bot.application_store.load()
+    bot.guild_settings.load()
+    bot.open_tickets.load()
+    bot.interview_dispatcher.start()
+    results = []
+    try:
+        for name in args.scenario or SCENARIOS:
+            results.extend(await SCENARIOS[name](args))
+    finally:
+        bot.application_history.close()
+        bot.state_store.close()
+    return results
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Нагрузочные тесты бота на заглушке Discord API")
+    parser.add_argument("--scenario", action="append", choices=list(SCENARIOS), help="сценарий (можно указать несколько раз, по умолчанию все)")
+    parser.add_argument("--applicants", type=int, default=500, help="одновременных заявок")
+    parser.add_argument("--decisions", type=int, default=200, help="решений администрации по заявкам")
+    parser.add_argument("--tickets", type=int, default=100, help="одновременно открываемых тикетов")
+    parser.add_argument("--spam-users", type=int, default=100, help="игроков, многократно нажимающих кнопку заявки")
+    parser.add_argument("--spam-clicks", type=int, default=10, help="нажатий кнопки каждым игроком")
+    parser.add_argument("--stats-clicks", type=int, default=200, help="нажатий кнопки статистики сервера")
+    parser.add_argument("--open-tickets", type=int, default=100, help="открытых тикетов при запуске бота")
+    parser.add_argument("--repeat", type=int, default=20, help="повторов on_ready")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="средняя задержка запроса к API")
+    parser.add_argument("--jitter-ms", type=float, default=20.0, help="разброс задержки")
+    parser.add_argument("--rate-limit", type=float, default=0.02, help="доля запросов с ответом 429")
+    parser.add_argument("--retry-after", type=float, default=0.3, help="retry_after в ответе 429, с")
+    parser.add_argument("--max-ratelimit-wait", type=float, default=bot.MAX_RATELIMIT_WAIT, help="дольше этого 429 не пережидается внутри и уходит в планировщик бота (не меньше 30 с, как в discord.py)")
+    parser.add_argument("--think-ms", type=float, default=100.0, help="время ответа игрока на вопрос в ЛС")
+    parser.add_argument("--member-cache-hit", type=float, default=1.0, help="доля заявителей в кэше участников")
+    parser.add_argument("--timeout", type=float, default=120.0, help="ожидание завершения опросов, с")
+    parser.add_argument("--state-backend", choices=["sqlite", "memory", "redis"], default="sqlite", help="хранилище состояния бота")
+    parser.add_argument("--redis-url", help="настоящий Redis вместо встроенной заглушки (для --state-backend redis)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="сохранить результаты в JSON")
+    parser.add_argument("--fail-p99-ms", type=float, help="код возврата 1, если p99 любого сценария выше порога")
+    parser.add_argument("--verbose", action="store_true", help="выводить журнал бота")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    # Журнал идет через ту же очередь, что и в боте, поэтому его стоимость входит в замеры
+    bot.setup_logging()
+    if not args.verbose:
+        bot.logger.setLevel(logging.WARNING)
+
+    try:
+        results = asyncio.run(run(args))
+    finally:
+        bot.shutdown_logging()
+    print_results(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump([result.to_dict() for result in results], f, ensure_ascii=False, indent=2)
+
+    if args.fail_p99_ms is not None:
+        slow = [result.name for result in results if result.percentile(99) * 1000 > args.fail_p99_ms]
+        if slow:
+            print(f"p99 выше {args.fail_p99_ms} мс: {', '.join(slow)}", file=sys.stderr)
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    exit(main())
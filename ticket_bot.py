@@ -2,56 +2,1305 @@ import discord
 from discord import app_commands
 from discord.ui import Button, View, Modal, TextInput
 import asyncio
+import csv
 import os
+import io
+import gzip
+import signal
+import json
+import functools
+import hashlib
+import heapq
+import itertools
+import math
+import socket
+import string
+import tempfile
+import sqlite3
+import time
+import urllib.parse
 import logging
+import logging.handlers
+import queue
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Optional
 
 # Настройка логгирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s [%(levelname)s] %(name)s: %(message)s',
-    handlers=[
-        logging.StreamHandler()
-    ]
-)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # json - одна строка JSON на запись, text - обычный текст
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))  # При переполнении очереди записи отбрасываются
+# Выборка частых событий: в журнал попадает каждая N-я запись события (предупреждения и ошибки - всегда).
+# Переопределяется переменной LOG_SAMPLING, например "interview_answer=1,ticket_create=5"
+LOG_SAMPLING_DEFAULT = {"interview_answer": 10, "application_step": 10, "ticket_create": 10, "info_button": 10}
+
+def parse_sampling(value):
+    rates = dict(LOG_SAMPLING_DEFAULT)
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        event, _, rate = item.partition("=")
+        rates[event.strip()] = max(1, int(rate))
+    return rates
+
+LOG_SAMPLING = parse_sampling(os.getenv("LOG_SAMPLING", ""))
+
+# Стандартные атрибуты записи; все остальные (переданные через extra) становятся полями JSON
+LOG_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+# Запись журнала одной строкой JSON: время, уровень, текст и поля события (event, applicant_id, ticket_id...)
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in LOG_RECORD_ATTRS:
+                payload[key] = value
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+# Выборка по полю event: из N записей частого события пропускается одна
+class SamplingFilter(logging.Filter):
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+        self.seen = {}
+    
+    def filter(self, record):
+        event = getattr(record, "event", None)
+        rate = self.rates.get(event, 1)
+        if rate <= 1 or record.levelno >= logging.WARNING:
+            return True
+        count = self.seen.get(event, 0)
+        self.seen[event] = count + 1
+        return count % rate == 0
+
+# Обработчик-очередь: запись кладется в очередь без форматирования, текст собирается в потоке-слушателе.
+# Очередь ограничена и не ждет: при переполнении запись отбрасывается, цикл событий не блокируется
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+    
+    def prepare(self, record):
+        return record
+    
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+log_handler = LazyQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+log_handler.addFilter(SamplingFilter(LOG_SAMPLING))
+log_listener = None
+
+# Корневой логгер пишет в очередь, поток-слушатель выводит записи в stderr
+def setup_logging():
+    global log_listener
+    stream = logging.StreamHandler()
+    if LOG_FORMAT == "json":
+        stream.setFormatter(JsonFormatter())
+    else:
+        stream.setFormatter(logging.Formatter('%(asctime)s [%(levelname)s] %(name)s: %(message)s'))
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+    root.addHandler(log_handler)
+    log_listener = logging.handlers.QueueListener(log_handler.queue, stream, respect_handler_level=True)
+    log_listener.start()
+
+# Остановка слушателя дописывает оставшиеся в очереди записи
+def shutdown_logging():
+    global log_listener
+    if log_listener is not None:
+        log_listener.stop()
+        log_listener = None
 
 logger = logging.getLogger('ticket_bot')
 
-# Получаем токен напрямую из переменной окружения
+# Получаем токен напрямую из переменной окружения (проверяется в main)
 TOKEN = os.getenv("TOKEN")
 
-if not TOKEN:
-    logger.error("ОШИБКА: Токен бота не указан в переменных окружения!")
-    logger.error("Добавьте переменную TOKEN в настройках платформы Railway")
-    exit(1)
+# Файл конфигурации (JSON): каналы, роли и адреса сервера. Перечитывается по SIGHUP и командой /reload
+CONFIG_PATH = os.getenv("CONFIG_PATH", "bot_config.json")
+
+# Значения по умолчанию; переопределяются файлом, а файл - переменными окружения (TICKET_CHANNEL_ID, SERVER_IP, ...)
+CONFIG_DEFAULTS = {
+    "ticket_channel_id": 1359611434862120960,  # Channel where ticket button will be displayed
+    "staff_channel_id": 1362471645922463794,  # Channel where completed tickets will be sent
+    "report_channel_id": 1362794547012436158,  # Channel where report button will be displayed
+    "approved_channel_id": 1365696815403630726,  # Channel where approved applications will be sent
+    "info_channel_id": 1361046702404145193,  # Channel where info message with buttons will be displayed
+    "player_role_id": 1376274807284301824,  # "Игрок" role ID
+    "server_ip": "mstory.sos-al.net",  # IP в сообщении об одобрении заявки
+    "join_address": "minestoryvanilla.imba.land",  # Адрес в инструкции по подключению
+}
+CONFIG_ID_KEYS = tuple(key for key in CONFIG_DEFAULTS if key.endswith("_id"))
+# Каналы с панелями: при их изменении панели восстанавливаются в новых каналах
+CONFIG_PANEL_KEYS = ("ticket_channel_id", "report_channel_id", "info_channel_id")
+
+# Ошибка в файле конфигурации или переменных окружения
+class ConfigError(Exception):
+    pass
+
+# Снимок конфигурации. Не изменяется после создания: перезагрузка создает новый снимок
+# и подменяет глобальный config одним присваиванием
+class BotConfig:
+    __slots__ = tuple(CONFIG_DEFAULTS)
+    
+    def __init__(self, values):
+        for key in CONFIG_DEFAULTS:
+            setattr(self, key, values[key])
+    
+    @classmethod
+    def load(cls, path):
+        values = dict(CONFIG_DEFAULTS)
+        if os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError) as e:
+                raise ConfigError(f"не удалось прочитать {path}: {e}")
+            if not isinstance(data, dict):
+                raise ConfigError(f"{path}: ожидается объект JSON")
+            unknown = sorted(set(data) - set(CONFIG_DEFAULTS))
+            if unknown:
+                raise ConfigError(f"{path}: неизвестные параметры {', '.join(unknown)}")
+            values.update(data)
+        
+        for key in CONFIG_DEFAULTS:
+            value = os.getenv(key.upper())
+            if value is not None:
+                values[key] = value
+        return cls(validate_config(values))
+    
+    def changes(self, other):
+        return [key for key in CONFIG_DEFAULTS if getattr(self, key) != getattr(other, key)]
+
+def validate_config(values):
+    errors = []
+    for key in CONFIG_ID_KEYS:
+        value = values[key]
+        try:
+            if isinstance(value, bool):
+                raise ValueError
+            values[key] = int(value)
+            if values[key] <= 0:
+                raise ValueError
+        except (TypeError, ValueError):
+            errors.append(f"{key}: ожидается ID Discord, получено {value!r}")
+    for key in ("server_ip", "join_address"):
+        value = values[key]
+        if not isinstance(value, str) or not value.strip():
+            errors.append(f"{key}: ожидается непустая строка, получено {value!r}")
+        else:
+            values[key] = value.strip()
+    if errors:
+        raise ConfigError("; ".join(errors))
+    return values
+
+config = BotConfig.load(CONFIG_PATH)
+
+# Вопросы, которые бот задает в личных сообщениях после заполнения формы: (поле эмбеда, вопрос)
+INTERVIEW_QUESTIONS = [
+    ("Отношение к грифу", "Как вы относитесь к грифу?"),
+    ("Источник информации о сервере", "Откуда узнали о сервере?"),
+]
+INTERVIEW_TIMEOUT = 600  # Время на ответ на каждый вопрос (10 минут)
+
+# Путь к локальной базе состояния бота
+DB_PATH = os.getenv("DB_PATH", "bot_state.db")
+
+# Хранилище состояния (опросы, заявки, тикеты, панели): sqlite, redis или memory.
+# Для нескольких процессов-шардов нужно общее хранилище - redis
+STATE_BACKEND = os.getenv("STATE_BACKEND", "sqlite")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+REDIS_PREFIX = os.getenv("REDIS_PREFIX", "ticket_bot")
+REDIS_TIMEOUT = float(os.getenv("REDIS_TIMEOUT", "1.0"))  # Таймаут подключения и ответа Redis (секунды)
+REDIS_RETRY_INTERVAL = float(os.getenv("REDIS_RETRY_INTERVAL", "5.0"))  # Пауза между попытками переподключения (секунды)
 
-# Define channel IDs
-TICKET_CHANNEL_ID = 1359611434862120960  # Channel where ticket button will be displayed
-STAFF_CHANNEL_ID = 1362471645922463794   # Channel where completed tickets will be sent
-REPORT_CHANNEL_ID = 1362794547012436158  # Channel where report button will be displayed
-APPROVED_CHANNEL_ID = 1365696815403630726  # Channel where approved applications will be sent
-INFO_CHANNEL_ID = 1361046702404145193  # Channel where info message with buttons will be displayed
+# Шардирование: SHARDING=1 включает AutoShardedClient.
+# SHARD_COUNT - общее число шардов (0 - по рекомендации Discord), SHARD_IDS - шарды этого процесса (пусто - все)
+SHARDING = os.getenv("SHARDING", "0") == "1"
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "0"))
+SHARD_IDS = [int(shard_id) for shard_id in os.getenv("SHARD_IDS", "").split(",") if shard_id.strip()]
 
-# Define role IDs
-PLAYER_ROLE_ID = 1376274807284301824  # "Игрок" role ID 
+# Ограничения исходящих запросов к Discord
+# Ответ 429 с ожиданием до MAX_RATELIMIT_WAIT discord.py пережидает внутри запроса, более долгий возвращает как RateLimited.
+# discord.py 2.x не принимает значения меньше 30 с: меньшее значение он сам повышает до 30
+MAX_RATELIMIT_WAIT = max(30.0, float(os.getenv("MAX_RATELIMIT_WAIT", "30")))
+REST_QUEUE_DEPTH = int(os.getenv("REST_QUEUE_DEPTH", "1000"))  # Максимум запросов в очереди
+REST_COSMETIC_DEPTH = int(os.getenv("REST_COSMETIC_DEPTH", "300"))  # Выше этой глубины косметические запросы отбрасываются
+
+# Ограничения на открытые тикеты
+MAX_TICKETS_PER_USER = int(os.getenv("MAX_TICKETS_PER_USER", "3"))
+MAX_OPEN_TICKETS = int(os.getenv("MAX_OPEN_TICKETS", "200"))
+
+# Ограничение подачи заявок (корзина токенов): запас нажатий кнопки и пополнение в минуту,
+# отдельно для каждого пользователя и общее для процесса
+APPLICATION_USER_BURST = int(os.getenv("APPLICATION_USER_BURST", "3"))
+APPLICATION_USER_PER_MINUTE = float(os.getenv("APPLICATION_USER_PER_MINUTE", "2"))
+APPLICATION_GLOBAL_BURST = int(os.getenv("APPLICATION_GLOBAL_BURST", "30"))
+APPLICATION_GLOBAL_PER_MINUTE = float(os.getenv("APPLICATION_GLOBAL_PER_MINUTE", "120"))
+
+# Количество заранее созданных каналов каждого типа тикета (0 - режим пула выключен)
+TICKET_POOL_SIZE = int(os.getenv("TICKET_POOL_SIZE", "0"))
+
+# Каталог для сжатых расшифровок закрытых тикетов
+TRANSCRIPT_DIR = os.getenv("TRANSCRIPT_DIR", "transcripts")
+
+# Порт HTTP-эндпоинта метрик в формате Prometheus (0 - выключен) и адрес, на котором он слушает
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+
+# Опрос Minecraft-сервера по протоколу Server List Ping для кнопки статистики
+SERVER_STATUS_INTERVAL = float(os.getenv("SERVER_STATUS_INTERVAL", "60"))  # Период опроса, с (0 - выключен)
+SERVER_STATUS_TTL = float(os.getenv("SERVER_STATUS_TTL", "180"))  # Дольше результат опроса не показывается
+SERVER_STATUS_TIMEOUT = float(os.getenv("SERVER_STATUS_TIMEOUT", "5"))  # Время на один опрос, с
+SERVER_STATUS_FAILURES = int(os.getenv("SERVER_STATUS_FAILURES", "3"))  # Неудачных опросов подряд до паузы
+SERVER_STATUS_COOLDOWN = float(os.getenv("SERVER_STATUS_COOLDOWN", "300"))  # Пауза опросов недоступного сервера, с
+
+# Кэш участников: полная загрузка списка участников при подключении выключена,
+# серверы загружаются по одному в фоне после on_ready
+CHUNK_GUILDS_AT_STARTUP = os.getenv("CHUNK_GUILDS_AT_STARTUP", "0") == "1"
+MEMBER_CHUNK_LIMIT = int(os.getenv("MEMBER_CHUNK_LIMIT", "5000"))  # Серверы крупнее не загружаются целиком (0 - не загружать)
+MEMBER_LRU_SIZE = int(os.getenv("MEMBER_LRU_SIZE", "1000"))  # Участники, полученные через API, вне кэша сервера
+MEMBER_LRU_TTL = float(os.getenv("MEMBER_LRU_TTL", "900"))  # Секунды до повторного запроса участника
 
 # Define intents
 intents = discord.Intents.default()
 intents.message_content = True
 intents.members = True  # Добавляем интент для работы с участниками сервера
 
+# Клиент бота: постоянные View и синхронизация команд выполняются в setup_hook до подключения к шлюзу
+class TicketBot(discord.AutoShardedClient if SHARDING else discord.Client):
+    metrics_runner = None
+    
+    async def setup_hook(self):
+        # Регистрируем все постоянные View: кнопки работают для сообщений, отправленных до перезапуска
+        self.add_view(ApplicationActionView())
+        self.add_view(TicketView())
+        self.add_view(ReportTypeView())
+        self.add_view(CloseTicketView())
+        self.add_view(InfoView())
+        
+        # Запускаем колесо таймеров опросов в ЛС, фоновую выгрузку расшифровок тикетов и опрос Minecraft-сервера
+        interview_dispatcher.start()
+        transcript_exporter.start()
+        server_status.start()
+        
+        if METRICS_PORT:
+            self.metrics_runner = await start_metrics_server(METRICS_HOST, METRICS_PORT)
+        
+        # Sync commands
+        await sync_commands()
+    
+    async def close(self):
+        if self.metrics_runner is not None:
+            await self.metrics_runner.cleanup()
+            self.metrics_runner = None
+        await super().close()
+
 # Create bot client
-client = discord.Client(intents=intents)
+def client_options():
+    options = {"intents": intents, "max_ratelimit_timeout": MAX_RATELIMIT_WAIT, "chunk_guilds_at_startup": CHUNK_GUILDS_AT_STARTUP}
+    if SHARDING:
+        if SHARD_COUNT:
+            options["shard_count"] = SHARD_COUNT
+        if SHARD_IDS:
+            options["shard_ids"] = SHARD_IDS
+    return options
+
+client = TicketBot(**client_options())
 tree = app_commands.CommandTree(client)
 
+# Границы корзин гистограмм задержек (секунды)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 600.0)
+
+# Гистограмма с накопительными корзинами, как в Prometheus
+class Histogram:
+    __slots__ = ("counts", "total", "count")
+    
+    def __init__(self):
+        self.counts = [0] * len(LATENCY_BUCKETS)
+        self.total = 0.0
+        self.count = 0
+    
+    def observe(self, value):
+        self.total += value
+        self.count += 1
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+
+# Метрики бота: счетчики, гистограммы и значения, вычисляемые в момент выгрузки
+class Metrics:
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.gauges = {}
+        self.help = {}
+    
+    def describe(self, name, text):
+        self.help[name] = text
+    
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + value
+    
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(value)
+    
+    def gauge(self, name, callback):
+        self.gauges[name] = ("gauge", callback)
+    
+    # Монотонный счетчик, который ведет другой объект (очередь журнала, планировщик запросов)
+    def counter(self, name, callback):
+        self.gauges[name] = ("counter", callback)
+    
+    @staticmethod
+    def _labels(labels, extra=None):
+        items = list(labels) + ([extra] if extra else [])
+        if not items:
+            return ""
+        return "{" + ",".join(f'{key}="{value}"' for key, value in items) + "}"
+    
+    def render(self):
+        lines = []
+        typed = set()
+        
+        def header(name, kind):
+            if name not in typed:
+                typed.add(name)
+                if name in self.help:
+                    lines.append(f"# HELP {name} {self.help[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+        
+        for (name, labels), value in sorted(self.counters.items()):
+            header(name, "counter")
+            lines.append(f"{name}{self._labels(labels)} {value}")
+        for (name, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+            header(name, "histogram")
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, histogram.counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{self._labels(labels, ('le', bound))} {cumulative}")
+            lines.append(f"{name}_bucket{self._labels(labels, ('le', '+Inf'))} {histogram.count}")
+            lines.append(f"{name}_sum{self._labels(labels)} {histogram.total}")
+            lines.append(f"{name}_count{self._labels(labels)} {histogram.count}")
+        for name, (kind, callback) in sorted(self.gauges.items()):
+            header(name, kind)
+            lines.append(f"{name} {callback()}")
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+metrics.describe("bot_handler_seconds", "Время выполнения обработчиков взаимодействий")
+metrics.describe("bot_handler_errors_total", "Необработанные исключения в обработчиках")
+metrics.describe("bot_rest_seconds", "Время выполнения исходящих запросов к Discord")
+metrics.describe("bot_rest_queue_seconds", "Время ожидания запроса в очереди планировщика")
+metrics.describe("bot_member_lookups_total", "Поиск участников по источнику: кэш сервера, LRU, запрос к API")
+metrics.describe("bot_interview_answer_seconds", "Время ответа пользователя на вопрос опроса в ЛС")
+metrics.describe("bot_server_ping_seconds", "Время ответа Minecraft-сервера на пинг")
+metrics.describe("bot_server_polls_total", "Опросы Minecraft-сервера по результату: ok, error, skipped (пауза после отказов)")
+metrics.describe("bot_applications_refused_total", "Заявки, отклоненные до обращения к API: лимит нажатий, повторная заявка, занятый ник")
+metrics.gauge("bot_log_queue_depth", lambda: log_handler.queue.qsize())
+metrics.counter("bot_log_dropped_total", lambda: log_handler.dropped)
+
+# Замер времени обработчика взаимодействия
+def timed(handler):
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                metrics.inc("bot_handler_errors_total", handler=handler)
+                raise
+            finally:
+                metrics.observe("bot_handler_seconds", time.perf_counter() - started, handler=handler)
+        return wrapper
+    return decorator
+
+# HTTP-эндпоинт /metrics на aiohttp (зависимость discord.py)
+async def start_metrics_server(host, port):
+    from aiohttp import web
+    
+    async def handle_metrics(request):
+        return web.Response(text=metrics.render(), content_type="text/plain", charset="utf-8")
+    
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info("Метрики доступны на %s:%s: /metrics", host, port)
+    return runner
+
+# Приоритеты исходящих запросов: ответы пользователям, затем уведомления, затем косметика
+PRIORITY_INTERACTION = 0
+PRIORITY_STAFF = 1
+PRIORITY_COSMETIC = 2
+PRIORITY_NAMES = {PRIORITY_INTERACTION: "interaction", PRIORITY_STAFF: "staff", PRIORITY_COSMETIC: "cosmetic"}
+
+# Очередь исходящих запросов переполнена
+class RestQueueFull(Exception):
+    pass
+
+# Очередь одного маршрута (канал, ЛС, сервер): куча (приоритет, порядковый номер, ...)
+class RestBucket:
+    __slots__ = ("heap", "workers", "paused_until")
+    
+    def __init__(self):
+        self.heap = []
+        self.workers = 0
+        self.paused_until = 0.0
+
+# Планировщик исходящих запросов: очереди по маршрутам с приоритетами и ограниченной глубиной.
+# Каждый маршрут обслуживают не больше bucket_concurrency обработчиков, остальные запросы ждут в очереди по приоритету.
+# Паузы по 429 до MAX_RATELIMIT_WAIT (не меньше 30 с) discord.py выдерживает внутри запроса, и обработчик маршрута ждет вместе с ним.
+# Более долгий 429 приходит как RateLimited: маршрут приостанавливается, а запрос возвращается в очередь
+class RestScheduler:
+    def __init__(self, max_depth, cosmetic_depth, bucket_concurrency=2, max_retries=3):
+        self.max_depth = max_depth
+        self.cosmetic_depth = cosmetic_depth
+        self.bucket_concurrency = bucket_concurrency
+        self.max_retries = max_retries
+        self.buckets = {}
+        self.depth = 0
+        self.sequence = itertools.count()
+        self.tasks = set()
+        self.counters = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "rejected": 0,
+            "retried": 0,
+            "rate_limited": 0,
+            "http_429": 0,
+        }
+    
+    async def submit(self, bucket, priority, factory):
+        if self.depth >= self.max_depth or (priority >= PRIORITY_COSMETIC and self.depth >= self.cosmetic_depth):
+            self.counters["rejected"] += 1
+            raise RestQueueFull(f"Очередь исходящих запросов переполнена ({self.depth})")
+        
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        state = self.buckets.get(bucket)
+        if state is None:
+            state = self.buckets[bucket] = RestBucket()
+        heapq.heappush(state.heap, (priority, next(self.sequence), loop.time(), factory, future, 0))
+        self.depth += 1
+        self.counters["submitted"] += 1
+        
+        if state.workers < self.bucket_concurrency:
+            state.workers += 1
+            task = asyncio.create_task(self.worker(bucket, state))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+        return await future
+    
+    async def worker(self, bucket, state):
+        loop = asyncio.get_running_loop()
+        try:
+            while state.heap:
+                delay = state.paused_until - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                    continue
+                
+                priority, sequence, queued_at, factory, future, attempt = heapq.heappop(state.heap)
+                self.depth -= 1
+                if future.done():
+                    # Вызывающая сторона уже отменила ожидание
+                    continue
+                waited = loop.time() - queued_at
+                route = bucket.split(":", 1)[0]
+                metrics.observe("bot_rest_queue_seconds", waited, priority=PRIORITY_NAMES[priority])
+                
+                started = loop.time()
+                try:
+                    result = await factory()
+                except discord.RateLimited as e:
+                    metrics.observe("bot_rest_seconds", loop.time() - started, route=route, outcome="rate_limited")
+                    self.counters["rate_limited"] += 1
+                    state.paused_until = loop.time() + e.retry_after
+                    if attempt < self.max_retries:
+                        self.counters["retried"] += 1
+                        heapq.heappush(state.heap, (priority, sequence, loop.time(), factory, future, attempt + 1))
+                        self.depth += 1
+                    else:
+                        self.counters["failed"] += 1
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+                except Exception as e:
+                    metrics.observe("bot_rest_seconds", loop.time() - started, route=route, outcome="error")
+                    self.counters["failed"] += 1
+                    if not future.done():
+                        future.set_exception(e)
+                    continue
+                
+                metrics.observe("bot_rest_seconds", loop.time() - started, route=route, outcome="ok")
+                self.counters["completed"] += 1
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            state.workers -= 1
+            if state.workers == 0 and not state.heap and self.buckets.get(bucket) is state:
+                del self.buckets[bucket]
+
+rest_scheduler = RestScheduler(REST_QUEUE_DEPTH, REST_COSMETIC_DEPTH)
+
+# Подсчет всех ответов 429, включая те, которые discord.py переждал сам
+class RateLimitCounter(logging.Filter):
+    def filter(self, record):
+        if isinstance(record.msg, str) and record.msg.startswith("We are being rate limited"):
+            rest_scheduler.counters["http_429"] += 1
+        return True
+
+logging.getLogger("discord.http").addFilter(RateLimitCounter())
+
+metrics.gauge("bot_rest_queue_depth", lambda: rest_scheduler.depth)
+metrics.gauge("bot_rest_buckets", lambda: len(rest_scheduler.buckets))
+metrics.counter("bot_rest_http_429_total", lambda: rest_scheduler.counters["http_429"])
+metrics.counter("bot_rest_rate_limited_total", lambda: rest_scheduler.counters["rate_limited"])
+metrics.counter("bot_rest_rejected_total", lambda: rest_scheduler.counters["rejected"])
+
+def rest(bucket, priority, factory):
+    return rest_scheduler.submit(bucket, priority, factory)
+
+def followup(interaction, *args, **kwargs):
+    return rest(f"interaction:{interaction.id}", PRIORITY_INTERACTION, lambda: interaction.followup.send(*args, **kwargs))
+
+def send_dm(user, *args, priority=PRIORITY_INTERACTION, **kwargs):
+    return rest(f"dm:{user.id}", priority, lambda: user.send(*args, **kwargs))
+
+def send_to(channel, *args, priority=PRIORITY_STAFF, **kwargs):
+    return rest(f"channel:{channel.id}", priority, lambda: channel.send(*args, **kwargs))
+
+def edit_message(message, priority=PRIORITY_COSMETIC, **kwargs):
+    return rest(f"channel:{message.channel.id}", priority, lambda: message.edit(**kwargs))
+
+# Хранилища состояния с общим интерфейсом: open, close, get, put, delete, load(namespace).
+# shared=True - состояние видят другие процессы (шарды), поэтому локальные кэши поверх него не используются
+
+# Ошибка хранилища состояния (ответ об ошибке от сервера и т.п.)
+class StateStoreError(Exception):
+    pass
+
+# Хранилище в памяти процесса: для разработки и нагрузочных прогонов, при перезапуске все теряется.
+# Значения хранятся сериализованными, чтобы поведение совпадало с остальными хранилищами
+class MemoryStateStore:
+    shared = False
+    
+    def __init__(self):
+        self.data = {}
+    
+    def open(self):
+        logger.info("Хранилище состояния в памяти процесса")
+    
+    def close(self):
+        pass
+    
+    def get(self, namespace, key):
+        value = self.data.get(namespace, {}).get(str(key))
+        return json.loads(value) if value is not None else None
+    
+    def put(self, namespace, key, value):
+        self.data.setdefault(namespace, {})[str(key)] = json.dumps(value, ensure_ascii=False)
+    
+    def delete(self, namespace, key):
+        self.data.get(namespace, {}).pop(str(key), None)
+    
+    def load(self, namespace):
+        return {key: json.loads(value) for key, value in self.data.get(namespace, {}).items()}
+
+# Локальное хранилище состояния бота (SQLite в режиме WAL)
+class SqliteStateStore:
+    shared = False
+    
+    def __init__(self, path):
+        self.path = path
+        self.db = None
+    
+    def open(self):
+        self.db = sqlite3.connect(self.path)
+        # WAL позволяет читать без блокировок и делает коммиты дешевыми
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS state ("
+            "namespace TEXT NOT NULL, "
+            "key TEXT NOT NULL, "
+            "value TEXT NOT NULL, "
+            "PRIMARY KEY (namespace, key)) WITHOUT ROWID"
+        )
+        self.db.commit()
+        logger.info("Хранилище состояния открыто: %s", self.path)
+    
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+    
+    def get(self, namespace, key):
+        row = self.db.execute(
+            "SELECT value FROM state WHERE namespace = ? AND key = ?",
+            (namespace, str(key))
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+    
+    def put(self, namespace, key, value):
+        self.db.execute(
+            "INSERT OR REPLACE INTO state (namespace, key, value) VALUES (?, ?, ?)",
+            (namespace, str(key), json.dumps(value, ensure_ascii=False))
+        )
+        self.db.commit()
+    
+    def delete(self, namespace, key):
+        self.db.execute("DELETE FROM state WHERE namespace = ? AND key = ?", (namespace, str(key)))
+        self.db.commit()
+    
+    def load(self, namespace):
+        # Загружаем все записи пространства имен одним запросом
+        rows = self.db.execute("SELECT key, value FROM state WHERE namespace = ?", (namespace,))
+        return {key: json.loads(value) for key, value in rows}
+
+# Общее хранилище в Redis (или совместимом сервере) по протоколу RESP: пространство имен - хэш "<префикс>:<namespace>".
+# Клиент синхронный, как и SQLite: рассчитан на сервер рядом с ботом, где запрос занимает доли миллисекунды
+class RedisStateStore:
+    shared = True
+    
+    def __init__(self, url, prefix, timeout=REDIS_TIMEOUT, retry_interval=REDIS_RETRY_INTERVAL):
+        self.url = url
+        self.prefix = prefix
+        self.timeout = timeout
+        self.retry_interval = retry_interval
+        self.retry_at = 0.0
+        self.sock = None
+        self.reader = None
+    
+    def open(self):
+        parsed = urllib.parse.urlparse(self.url)
+        host, port = parsed.hostname or "localhost", parsed.port or 6379
+        self.sock = socket.create_connection((host, port), timeout=self.timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile("rb")
+        if parsed.password:
+            self._call("AUTH", *([parsed.username] if parsed.username else []), parsed.password)
+        if parsed.path.strip("/"):
+            self._call("SELECT", parsed.path.strip("/"))
+        self._call("PING")
+        logger.info("Хранилище состояния Redis: %s:%s", host, port)
+    
+    def close(self):
+        if self.sock is not None:
+            self.reader.close()
+            self.sock.close()
+            self.sock = self.reader = None
+    
+    def command(self, *args):
+        # Команды синхронные и блокируют цикл событий не дольше таймаута сокета.
+        # Обрыв постоянного соединения: одно переподключение и повтор команды (все команды идемпотентны).
+        # Если Redis недоступен, до следующей попытки через retry_interval вызовы сразу завершаются ошибкой
+        if self.sock is not None:
+            try:
+                return self._call(*args)
+            except OSError as e:
+                # После таймаута ответ мог быть прочитан не полностью - соединение больше не используется
+                logger.warning("Соединение с Redis потеряно (%s), переподключение", e)
+                self.close()
+        if time.monotonic() < self.retry_at:
+            raise StateStoreError("Redis недоступен")
+        try:
+            self.open()
+            return self._call(*args)
+        except OSError as e:
+            self.close()
+            self.retry_at = time.monotonic() + self.retry_interval
+            logger.error("Redis недоступен (%s), следующая попытка через %s с", e, self.retry_interval, extra={"event": "redis_unavailable"})
+            raise StateStoreError(f"Redis недоступен: {e}") from e
+    
+    def _call(self, *args):
+        payload = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            data = str(arg).encode("utf-8")
+            payload.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        self.sock.sendall(b"".join(payload))
+        return self._reply()
+    
+    def _reply(self):
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionError("Redis закрыл соединение")
+        kind, body = line[:1], line[1:-2]
+        if kind == b"+":
+            return body.decode("utf-8")
+        if kind == b"-":
+            raise StateStoreError(body.decode("utf-8"))
+        if kind == b":":
+            return int(body)
+        if kind == b"$":
+            length = int(body)
+            return None if length < 0 else self.reader.read(length + 2)[:-2].decode("utf-8")
+        if kind == b"*":
+            length = int(body)
+            return None if length < 0 else [self._reply() for _ in range(length)]
+        raise StateStoreError(f"Неизвестный ответ Redis: {line!r}")
+    
+    def _key(self, namespace):
+        return f"{self.prefix}:{namespace}"
+    
+    def get(self, namespace, key):
+        value = self.command("HGET", self._key(namespace), key)
+        return json.loads(value) if value is not None else None
+    
+    def put(self, namespace, key, value):
+        self.command("HSET", self._key(namespace), key, json.dumps(value, ensure_ascii=False))
+    
+    def delete(self, namespace, key):
+        self.command("HDEL", self._key(namespace), key)
+    
+    def load(self, namespace):
+        items = self.command("HGETALL", self._key(namespace))
+        return {items[i]: json.loads(items[i + 1]) for i in range(0, len(items), 2)}
+
+def make_state_store(backend):
+    if backend == "sqlite":
+        return SqliteStateStore(DB_PATH)
+    if backend == "redis":
+        return RedisStateStore(REDIS_URL, REDIS_PREFIX)
+    if backend == "memory":
+        return MemoryStateStore()
+    raise ValueError(f"Неизвестное хранилище состояния: {backend}")
+
+# Индекс заявителей для отсева повторов без запросов к API, отдельно по каждому серверу:
+# пользователи с заявкой на рассмотрении или незавершенным опросом и занятые ники без учета регистра.
+# Ник остается занятым, пока заявка на рассмотрении, и после ее одобрения
+class ApplicantIndex:
+    def __init__(self):
+        self.pending = {}
+        self.nicknames = {}
+    
+    @staticmethod
+    def nickname_key(nickname):
+        return " ".join(str(nickname).split()).casefold()
+    
+    def rebuild(self, records):
+        self.pending = {}
+        self.nicknames = {}
+        for record in records:
+            if record["status"] in ("pending", "accepted"):
+                self.claim(record.get("guild_id"), record["applicant_id"], record["nickname"], pending=record["status"] == "pending")
+    
+    def conflict(self, guild_id, user_id, nickname=None):
+        if (guild_id, user_id) in self.pending:
+            return "pending"
+        if nickname is not None:
+            owner = self.nicknames.get((guild_id, self.nickname_key(nickname)))
+            if owner is not None and owner != user_id:
+                return "nickname"
+        return None
+    
+    def claim(self, guild_id, user_id, nickname, pending=True):
+        key = self.nickname_key(nickname)
+        if pending:
+            self.pending[(guild_id, user_id)] = key
+        self.nicknames.setdefault((guild_id, key), user_id)
+    
+    def release(self, guild_id, user_id):
+        key = self.pending.pop((guild_id, user_id), None)
+        if key is not None and self.nicknames.get((guild_id, key)) == user_id:
+            del self.nicknames[(guild_id, key)]
+
+# Хранилище заявок, ключ - ID сообщения в канале администрации
+class ApplicationStore:
+    NAMESPACE = "applications"
+    
+    def __init__(self, state):
+        self.state = state
+        self.cache = {}
+        self.applicants = ApplicantIndex()
+        self.deciding = set()  # Заявки, решение по которым выполняется этим процессом
+    
+    def load(self):
+        records = {int(key): record for key, record in self.state.load(self.NAMESPACE).items()}
+        self.applicants.rebuild(records.values())
+        # Общее хранилище могут менять другие шарды, поэтому заявки всегда читаются из него.
+        # Индекс заявителей строится при запуске и дополняется заявками этого процесса
+        if self.state.shared:
+            logger.info("Заявки читаются из общего хранилища без локального кэша")
+            return
+        self.cache = records
+        logger.info("Загружено заявок из хранилища: %s", len(self.cache))
+    
+    def add(self, message_id, channel_id, applicant_id, nickname, age, status="pending", created_at=None, guild_id=None):
+        record = {
+            "guild_id": guild_id,
+            "channel_id": channel_id,
+            "applicant_id": applicant_id,
+            "nickname": nickname,
+            "age": age,
+            "status": status,
+            "created_at": created_at if created_at is not None else time.time(),
+        }
+        if not self.state.shared:
+            self.cache[message_id] = record
+        self.state.put(self.NAMESPACE, message_id, record)
+        if status == "pending":
+            self.applicants.claim(guild_id, applicant_id, nickname)
+        return record
+    
+    def get(self, message_id):
+        if self.state.shared:
+            return self.state.get(self.NAMESPACE, message_id)
+        record = self.cache.get(message_id)
+        if record is None:
+            record = self.state.get(self.NAMESPACE, message_id)
+            if record is not None:
+                self.cache[message_id] = record
+        return record
+    
+    def records(self):
+        if self.state.shared:
+            return {int(key): record for key, record in self.state.load(self.NAMESPACE).items()}
+        return self.cache
+    
+    def set_status(self, message_id, status, moderator_id):
+        record = self.get(message_id)
+        if record is None:
+            return None
+        record["status"] = status
+        record["moderator_id"] = moderator_id
+        record["decided_at"] = time.time()
+        self.state.put(self.NAMESPACE, message_id, record)
+        self.applicants.release(record.get("guild_id"), record["applicant_id"])
+        if status == "accepted":
+            self.applicants.claim(record.get("guild_id"), record["applicant_id"], record["nickname"], pending=False)
+        return record
+    
+    def select(self, status, created_after=None, created_before=None, guild=None):
+        # Выборка из загруженного в память кэша (или общего хранилища), отсортированная от старых к новым
+        selected = [
+            (message_id, record) for message_id, record in self.records().items()
+            if record["status"] == status
+            and (created_after is None or record["created_at"] >= created_after)
+            and (created_before is None or record["created_at"] <= created_before)
+            and (guild is None or application_in_guild(record, guild))
+        ]
+        selected.sort(key=lambda item: item[1]["created_at"])
+        return selected
+
+# Заявки, сохраненные до поддержки нескольких серверов, относятся к серверу своего канала администрации
+def application_in_guild(record, guild):
+    if record.get("guild_id") is not None:
+        return record["guild_id"] == guild.id
+    return guild.get_channel(record["channel_id"]) is not None
+
+state_store = make_state_store(STATE_BACKEND)
+application_store = ApplicationStore(state_store)
+
+# Настройки отдельного сервера: каналы, роль игрока, вопросы опроса и тексты уведомлений.
+# Все, что не задано для сервера командой /settings, берется из общей конфигурации
+GUILD_SETTING_LABELS = {
+    "ticket_channel_id": "Канал панели заявок",
+    "staff_channel_id": "Канал заявок для администрации",
+    "report_channel_id": "Канал панели жалоб",
+    "approved_channel_id": "Канал одобренных заявок",
+    "info_channel_id": "Информационный канал",
+    "player_role_id": "Роль игрока",
+    "server_ip": "IP сервера",
+    "questions": "Вопросы опроса",
+    "approve_template": "Сообщение об одобрении",
+    "reject_template": "Сообщение об отклонении",
+}
+GUILD_SETTING_KEYS = tuple(GUILD_SETTING_LABELS)
+GUILD_TEMPLATE_DEFAULTS = {
+    "approve_template": "Ваша заявка на сервер была одобрена администратором! Добро пожаловать!\n\nIP сервера: **{server_ip}**\nДобро пожаловать в наше сообщество!",
+    "reject_template": "Ваша заявка на сервер была отклонена. Вы можете попробовать подать заявку повторно через некоторое время.",
+}
+# Подстановки, доступные в текстах уведомлений
+GUILD_TEMPLATE_FIELDS = ("server_ip", "nickname", "guild")
+GUILD_TEMPLATE_MAX_LENGTH = 1000
+# Форма заявки занимает 5 полей эмбеда из 25, вопросы из ЛС добавляются к ним
+GUILD_MAX_QUESTIONS = 10
+
+# Проверка значения настройки сервера перед сохранением; возвращает нормализованное значение
+def validate_guild_setting(key, value):
+    if key in CONFIG_ID_KEYS:
+        try:
+            if isinstance(value, bool) or int(value) <= 0:
+                raise ValueError
+            return int(value)
+        except (TypeError, ValueError):
+            raise ConfigError(f"{key}: ожидается ID Discord, получено {value!r}")
+    
+    if key == "server_ip":
+        if not isinstance(value, str) or not value.strip():
+            raise ConfigError("IP сервера не может быть пустым")
+        return value.strip()
+    
+    if key == "questions":
+        if not value or len(value) > GUILD_MAX_QUESTIONS:
+            raise ConfigError(f"нужно от 1 до {GUILD_MAX_QUESTIONS} вопросов")
+        questions = []
+        for field_name, question in value:
+            field_name, question = field_name.strip(), question.strip()
+            if not field_name or not question:
+                raise ConfigError("у каждого вопроса должны быть название поля и текст")
+            if len(field_name) > 256 or len(question) > 1000:
+                raise ConfigError(f"слишком длинный вопрос: {field_name[:50]}")
+            questions.append([field_name, question])
+        return questions
+    
+    if key in GUILD_TEMPLATE_DEFAULTS:
+        if not isinstance(value, str) or not value.strip():
+            raise ConfigError("текст сообщения не может быть пустым")
+        if len(value) > GUILD_TEMPLATE_MAX_LENGTH:
+            raise ConfigError(f"текст сообщения длиннее {GUILD_TEMPLATE_MAX_LENGTH} символов")
+        try:
+            names = {name for _, name, _, _ in string.Formatter().parse(value) if name is not None}
+        except ValueError as e:
+            raise ConfigError(f"ошибка в тексте сообщения: {e}")
+        unknown = sorted(names - set(GUILD_TEMPLATE_FIELDS))
+        if unknown:
+            raise ConfigError("неизвестные подстановки: " + ", ".join("{" + name + "}" for name in unknown))
+        return value
+    
+    raise ConfigError(f"неизвестная настройка {key}")
+
+# Снимок настроек сервера. Не изменяется после создания: изменение настройки создает новый снимок,
+# поэтому обработчик, получивший снимок в начале, работает с согласованными значениями
+class GuildSettings:
+    __slots__ = ("guild_id",) + GUILD_SETTING_KEYS
+    
+    def __init__(self, guild_id, values):
+        self.guild_id = guild_id
+        for key in GUILD_SETTING_KEYS:
+            setattr(self, key, values[key])
+    
+    def render(self, key, **fields):
+        return getattr(self, key).format_map({"server_ip": self.server_ip, **fields})
+
+# Настройки серверов: в хранилище лежат только переопределенные значения, в памяти - готовые снимки
+# по ID сервера. Изменения сначала записываются в хранилище, затем в память
+class GuildSettingsStore:
+    NAMESPACE = "guild_settings"
+    
+    def __init__(self, state):
+        self.state = state
+        self.overrides = {}
+        self.settings = {}
+        self.rebuild()
+    
+    def base_values(self):
+        values = {key: getattr(config, key) for key in GUILD_SETTING_KEYS if key in CONFIG_DEFAULTS}
+        values["questions"] = INTERVIEW_QUESTIONS
+        values.update(GUILD_TEMPLATE_DEFAULTS)
+        return values
+    
+    def load(self):
+        self.overrides = {int(key): values for key, values in self.state.load(self.NAMESPACE).items()}
+        self.rebuild()
+        logger.info("Загружены настройки серверов: %s", len(self.overrides))
+    
+    def rebuild(self):
+        # Значения по умолчанию зависят от общей конфигурации, поэтому снимки пересоздаются после /reload
+        base = self.base_values()
+        self.default = GuildSettings(None, base)
+        self.settings = {guild_id: GuildSettings(guild_id, {**base, **values}) for guild_id, values in self.overrides.items()}
+    
+    def get(self, guild_id):
+        return self.settings.get(guild_id, self.default)
+    
+    def overridden(self, guild_id):
+        return self.overrides.get(guild_id, {})
+    
+    def update(self, guild_id, key, value):
+        values = {**self.overridden(guild_id), key: validate_guild_setting(key, value)}
+        self.state.put(self.NAMESPACE, guild_id, values)
+        self.overrides[guild_id] = values
+        self.settings[guild_id] = GuildSettings(guild_id, {**self.base_values(), **values})
+        return self.settings[guild_id]
+    
+    def reset(self, guild_id, key=None):
+        values = {name: value for name, value in self.overridden(guild_id).items() if key is not None and name != key}
+        if values:
+            self.state.put(self.NAMESPACE, guild_id, values)
+            self.overrides[guild_id] = values
+            self.settings[guild_id] = GuildSettings(guild_id, {**self.base_values(), **values})
+        else:
+            self.state.delete(self.NAMESPACE, guild_id)
+            self.overrides.pop(guild_id, None)
+            self.settings.pop(guild_id, None)
+        return self.get(guild_id)
+
+guild_settings = GuildSettingsStore(state_store)
+
+# Восстановление данных заявки из эмбеда (для сообщений, отправленных до появления хранилища)
+def parse_application_message(message):
+    if not message.embeds:
+        return None
+    embed = message.embeds[0]
+    footer = embed.footer.text if embed.footer else None
+    if not footer or not footer.startswith("ID пользователя: "):
+        return None
+    try:
+        applicant_id = int(footer[len("ID пользователя: "):].split(" ", 1)[0])
+    except ValueError:
+        return None
+    fields = {field.name: field.value for field in embed.fields}
+    return applicant_id, fields.get("Ник", "Неизвестно"), fields.get("Возраст", "Неизвестно")
+
+# Поиск заявки по сообщению: сначала хранилище, затем разбор эмбеда
+def resolve_application(message):
+    record = application_store.get(message.id)
+    if record is not None:
+        return record
+    
+    parsed = parse_application_message(message)
+    if parsed is None:
+        return None
+    
+    applicant_id, nickname, age = parsed
+    logger.info("Заявка %s восстановлена из эмбеда и сохранена в хранилище", message.id, extra={"event": "application_recovered", "message_id": message.id, "applicant_id": applicant_id})
+    return application_store.add(message.id, message.channel.id, applicant_id, nickname, age, created_at=message.created_at.timestamp(), guild_id=message.guild.id if message.guild else None)
+
+# Кэш участников вне кэша сервера: ограниченный LRU с временем жизни записи,
+# и фоновая загрузка списков участников серверов после on_ready
+class MemberCache:
+    def __init__(self, size, ttl, chunk_limit):
+        self.size = size
+        self.ttl = ttl
+        self.chunk_limit = chunk_limit
+        self.entries = OrderedDict()
+        self.chunk_task = None
+    
+    def get(self, guild_id, user_id):
+        key = (guild_id, user_id)
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        member, stored_at = entry
+        if time.monotonic() - stored_at > self.ttl:
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return member
+    
+    def put(self, member):
+        if self.size <= 0:
+            return
+        key = (member.guild.id, member.id)
+        self.entries[key] = (member, time.monotonic())
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+    
+    def update(self, member):
+        if (member.guild.id, member.id) in self.entries:
+            self.put(member)
+    
+    def discard(self, guild_id, user_id):
+        self.entries.pop((guild_id, user_id), None)
+    
+    def forget_guild(self, guild_id):
+        for key in [key for key in self.entries if key[0] == guild_id]:
+            del self.entries[key]
+    
+    def should_chunk(self, guild):
+        return self.chunk_limit > 0 and not guild.chunked and (guild.member_count or 0) <= self.chunk_limit
+    
+    def schedule_chunking(self, guilds):
+        if self.chunk_task is None or self.chunk_task.done():
+            self.chunk_task = asyncio.create_task(self.chunk([guild for guild in guilds if self.should_chunk(guild)]))
+    
+    async def chunk(self, guilds):
+        # Серверы загружаются по очереди, чтобы не нагружать шлюз сразу после подключения
+        for guild in guilds:
+            started = time.perf_counter()
+            try:
+                await guild.chunk(cache=True)
+            except Exception as e:
+                logger.error("Ошибка при загрузке участников сервера %s: %s", guild.name, e)
+                continue
+            # Загруженный сервер отвечает из своего кэша, записи LRU больше не нужны
+            self.forget_guild(guild.id)
+            logger.info("Участники сервера %s загружены: %s за %.1f с", guild.name, len(guild.members), time.perf_counter() - started)
+
+member_cache = MemberCache(MEMBER_LRU_SIZE, MEMBER_LRU_TTL, MEMBER_CHUNK_LIMIT)
+metrics.gauge("bot_member_lru_size", lambda: len(member_cache.entries))
+
+# Поиск участника: кэш сервера, затем LRU, запрос к API - только при промахе обоих.
+# Если список участников сервера загружен целиком, промах кэша означает, что пользователь ушел
+async def get_member(guild, user_id):
+    member = guild.get_member(user_id)
+    if member is not None:
+        metrics.inc("bot_member_lookups_total", source="guild")
+        return member
+    member = member_cache.get(guild.id, user_id)
+    if member is not None:
+        metrics.inc("bot_member_lookups_total", source="lru")
+        return member
+    if guild.chunked:
+        metrics.inc("bot_member_lookups_total", source="absent")
+        return None
+    
+    metrics.inc("bot_member_lookups_total", source="rest")
+    try:
+        member = await guild.fetch_member(user_id)
+    except discord.NotFound:
+        return None
+    member_cache.put(member)
+    return member
+
+# Параллельное выполнение независимых действий; возвращает описания неудавшихся шагов
+async def run_steps(steps):
+    names = list(steps)
+    results = await asyncio.gather(*steps.values(), return_exceptions=True)
+    failures = []
+    for name, result in zip(names, results):
+        if isinstance(result, discord.Forbidden):
+            failures.append(f"{name}: недостаточно прав или закрыты личные сообщения")
+        elif isinstance(result, Exception):
+            failures.append(f"{name}: {result}")
+    for failure in failures:
+        logger.error("Ошибка при обработке заявки - %s", failure, extra={"event": "application_step_failed"})
+    return failures
+
+# Ошибка, из-за которой решение по заявке не может быть применено
+class ApplicationError(Exception):
+    pass
+
+# Сервер, которому принадлежит канал: ID каналов из общей конфигурации относятся к одному серверу,
+# и сервер без своих настроек не должен отправлять заявки в чужие каналы. Канал не меняет сервер, поэтому ответ кэшируется
+channel_guilds = {}
+
+# Канал сервера guild_id для отправки или None, если канал не найден или принадлежит другому серверу.
+# Канал из кэша, иначе частичный канал - сервер может обслуживаться другим шардом, а отправка через REST от шарда не зависит
+async def guild_channel(guild_id, channel_id):
+    channel = client.get_channel(channel_id)
+    if channel is not None:
+        return channel if channel.guild is not None and channel.guild.id == guild_id else None
+    # Сервер в кэше этого процесса: его каналы тоже в кэше, значит канал чужой
+    if client.get_guild(guild_id) is not None:
+        return None
+    # Сервер обслуживается другим шардом: принадлежность канала проверяется одним запросом
+    owner = channel_guilds.get(channel_id)
+    if owner is None:
+        try:
+            fetched = await rest(f"channel:{channel_id}", PRIORITY_STAFF, lambda: client.fetch_channel(channel_id))
+        except (discord.NotFound, discord.Forbidden):
+            return None
+        guild = getattr(fetched, "guild", None)
+        owner = channel_guilds[channel_id] = guild.id if guild is not None else None
+    return client.get_partial_messageable(channel_id, guild_id=owner) if owner == guild_id else None
+
+# Сообщение заявки в канале администрации; содержимое восстанавливается без запроса к API
+def application_message(message_id, record):
+    channel = client.get_partial_messageable(record.get("channel_id", config.staff_channel_id))
+    return channel.get_partial_message(message_id)
+
+def application_content(record):
+    return f"<@{record['applicant_id']}> подал заявку:"
+
+# Решение по заявке принимается один раз: повторное нажатие или массовая обработка не изменят уже решенную заявку.
+# Статус перечитывается из хранилища, заявка занимается до первого await и освобождается после решения
+def start_decision(message_id, guild):
+    record = application_store.get(message_id)
+    if record is None:
+        raise ApplicationError("Заявка не найдена в хранилище.")
+    if record.get("guild_id") is not None and record["guild_id"] != guild.id:
+        raise ApplicationError("Заявка подана на другом сервере.")
+    if record["status"] != "pending":
+        raise ApplicationError(f"Заявка уже {APPLICATION_STATUS_LABELS.get(record['status'], record['status'])}.")
+    if message_id in application_store.deciding:
+        raise ApplicationError("Заявка уже обрабатывается другим администратором.")
+    application_store.deciding.add(message_id)
+    return record
+
+# Одобрение заявки: выдача роли, затем параллельные уведомления. Возвращает (участник, неудавшиеся шаги)
+async def approve_application(guild, message_id, moderator):
+    record = start_decision(message_id, guild)
+    try:
+        applicant_id = record["applicant_id"]
+        # Один снимок настроек сервера на всю обработку, даже если во время нее выполнится /reload или /settings
+        settings = guild_settings.get(guild.id)
+        
+        # Получаем пользователя
+        applicant = await get_member(guild, applicant_id)
+        if not applicant:
+            raise ApplicationError("Пользователь не найден на сервере.")
+        
+        # Выдаем роль "Игрок"
+        player_role = guild.get_role(settings.player_role_id)
+        if not player_role:
+            raise ApplicationError("Роль игрока не найдена.")
+        
+        await rest(f"guild:{guild.id}", PRIORITY_INTERACTION, lambda: applicant.add_roles(player_role, reason="Заявка одобрена администратором"))
+        application_store.set_status(message_id, "accepted", moderator.id)
+        application_history.decide(message_id, record, guild.id, "accepted", moderator.id)
+        
+        # Остальные действия не зависят друг от друга и выполняются параллельно
+        steps = {
+            "личное сообщение": send_dm(applicant, priority=PRIORITY_STAFF, content=settings.render("approve_template", nickname=record["nickname"], guild=guild.name)),
+            "обновление заявки": edit_message(application_message(message_id, record), content=f"{application_content(record)}\n\n**Заявка ОДОБРЕНА администратором {moderator.mention}**", view=None),
+        }
+        
+        # Отправляем сообщение в канал одобренных заявок
+        approved_channel = await guild_channel(guild.id, settings.approved_channel_id)
+        if approved_channel:
+            approved_embed = discord.Embed(
+                title="Новый игрок одобрен",
+                color=discord.Color.green()
+            )
+            approved_embed.add_field(name="Ник в Minecraft", value=record["nickname"], inline=True)
+            approved_embed.add_field(name="Возраст", value=record["age"], inline=True)
+            approved_embed.set_footer(text=f"Заявка одобрена {moderator.display_name}")
+            steps["канал одобренных заявок"] = send_to(approved_channel, content=f"Заявка от <@{applicant_id}> принята:", embed=approved_embed)
+        
+        return applicant, await run_steps(steps)
+    finally:
+        application_store.deciding.discard(message_id)
+
+# Отклонение заявки: обновление сообщения и уведомление пользователя параллельно
+async def reject_application(guild, message_id, moderator):
+    record = start_decision(message_id, guild)
+    try:
+        settings = guild_settings.get(guild.id)
+        applicant = await get_member(guild, record["applicant_id"])
+        application_store.set_status(message_id, "rejected", moderator.id)
+        application_history.decide(message_id, record, guild.id, "rejected", moderator.id)
+        
+        steps = {
+            "обновление заявки": edit_message(application_message(message_id, record), content=f"{application_content(record)}\n\n**Заявка ОТКЛОНЕНА администратором {moderator.mention}**", view=None),
+        }
+        if applicant:
+            steps["личное сообщение"] = send_dm(applicant, settings.render("reject_template", nickname=record["nickname"], guild=guild.name), priority=PRIORITY_STAFF)
+        
+        return applicant, await run_steps(steps)
+    finally:
+        application_store.deciding.discard(message_id)
+
 # Button View class для кнопок "Принять" и "Отклонить"
+# View не хранит состояние: заявка определяется по ID сообщения, поэтому
+# один экземпляр регистрируется через client.add_view и работает после перезапуска
 class ApplicationActionView(View):
-    def __init__(self, applicant_id, applicant_nickname, applicant_age):
+    def __init__(self):
         super().__init__(timeout=None)
-        self.applicant_id = applicant_id
-        self.applicant_nickname = applicant_nickname
-        self.applicant_age = applicant_age
     
     @discord.ui.button(label="Принять", style=discord.ButtonStyle.success, custom_id="accept_application")
+    @timed("accept_application")
     async def accept_application_button(self, interaction: discord.Interaction, button: Button):
         # Проверяем, имеет ли пользователь права администратора
         is_admin = interaction.user.guild_permissions.administrator
@@ -62,73 +1311,53 @@ class ApplicationActionView(View):
         
         await interaction.response.defer(ephemeral=True)
         
+        record = resolve_application(interaction.message)
+        if record is None:
+            await followup(interaction, "Ошибка: заявка не найдена в хранилище.", ephemeral=True)
+            return
+        
         try:
-            # Получаем сервер и пользователя
-            guild = interaction.guild
-            applicant = await guild.fetch_member(self.applicant_id)
-            
-            if not applicant:
-                await interaction.followup.send(f"Ошибка: Пользователь не найден на сервере.", ephemeral=True)
-                return
-            
-            # Выдаем роль "Игрок"
-            player_role = guild.get_role(PLAYER_ROLE_ID)
-            if player_role:
-                await applicant.add_roles(player_role, reason="Заявка одобрена администратором")
-                
-                # Отправляем сообщение в канал одобренных заявок
-                approved_channel = client.get_channel(APPROVED_CHANNEL_ID)
-                if approved_channel:
-                    approved_embed = discord.Embed(
-                        title="Новый игрок одобрен",
-                        color=discord.Color.green()
-                    )
-                    approved_embed.add_field(name="Ник в Minecraft", value=self.applicant_nickname, inline=True)
-                    approved_embed.add_field(name="Возраст", value=self.applicant_age, inline=True)
-                    approved_embed.set_footer(text=f"Заявка одобрена {interaction.user.display_name}")
-                    
-                    await approved_channel.send(content=f"Заявка от <@{self.applicant_id}> принята:", embed=approved_embed)
-                
-                # Отправляем сообщение пользователю в личку
-                try:
-                    server_ip = "mstory.sos-al.net"
-                    await applicant.send(f"Ваша заявка на сервер была одобрена администратором! Добро пожаловать!\n\nIP сервера: **{server_ip}**\nДобро пожаловать в наше сообщество!")
-                except discord.Forbidden:
-                    await interaction.followup.send("Заявка одобрена, но не удалось отправить личное сообщение пользователю.", ephemeral=True)
-                
-                # Обновляем сообщение с заявкой
-                await interaction.message.edit(content=f"{interaction.message.content}\n\n**Заявка ОДОБРЕНА администратором {interaction.user.mention}**", view=None)
-                
-                await interaction.followup.send(f"Заявка пользователя {applicant.mention} успешно одобрена.", ephemeral=True)
+            applicant, failures = await approve_application(interaction.guild, interaction.message.id, interaction.user)
+            if failures:
+                details = "\n".join(f"• {failure}" for failure in failures)
+                await followup(interaction, f"Заявка пользователя {applicant.mention} одобрена, но не все действия выполнены:\n{details}", ephemeral=True)
             else:
-                await interaction.followup.send(f"Ошибка: Роль игрока не найдена.", ephemeral=True)
+                await followup(interaction, f"Заявка пользователя {applicant.mention} успешно одобрена.", ephemeral=True)
         
+        except ApplicationError as e:
+            await followup(interaction, f"Ошибка: {e}", ephemeral=True)
         except Exception as e:
-            await interaction.followup.send(f"Произошла ошибка при обработке заявки: {e}", ephemeral=True)
+            await followup(interaction, f"Произошла ошибка при обработке заявки: {e}", ephemeral=True)
     
     @discord.ui.button(label="Отклонить", style=discord.ButtonStyle.danger, custom_id="reject_application")
+    @timed("reject_application")
     async def reject_application_button(self, interaction: discord.Interaction, button: Button):
+        # Проверяем, имеет ли пользователь права администратора
+        is_admin = interaction.user.guild_permissions.administrator
+        
+        if not is_admin:
+            await interaction.response.send_message("Только администраторы могут отклонять заявки.", ephemeral=True)
+            return
+        
         await interaction.response.defer(ephemeral=True)
         
+        record = resolve_application(interaction.message)
+        if record is None:
+            await followup(interaction, "Ошибка: заявка не найдена в хранилище.", ephemeral=True)
+            return
+        
         try:
-            # Получаем пользователя
-            guild = interaction.guild
-            applicant = await guild.fetch_member(self.applicant_id)
-            
-            if applicant:
-                # Отправляем сообщение пользователю в личку
-                try:
-                    await applicant.send("Ваша заявка на сервер была отклонена. Вы можете попробовать подать заявку повторно через некоторое время.")
-                except discord.Forbidden:
-                    await interaction.followup.send("Заявка отклонена, но не удалось отправить личное сообщение пользователю.", ephemeral=True)
-            
-            # Обновляем сообщение с заявкой
-            await interaction.message.edit(content=f"{interaction.message.content}\n\n**Заявка ОТКЛОНЕНА администратором {interaction.user.mention}**", view=None)
-            
-            await interaction.followup.send("Заявка успешно отклонена.", ephemeral=True)
+            applicant, failures = await reject_application(interaction.guild, interaction.message.id, interaction.user)
+            if failures:
+                details = "\n".join(f"• {failure}" for failure in failures)
+                await followup(interaction, f"Заявка отклонена, но не все действия выполнены:\n{details}", ephemeral=True)
+            else:
+                await followup(interaction, "Заявка успешно отклонена.", ephemeral=True)
         
+        except ApplicationError as e:
+            await followup(interaction, f"Ошибка: {e}", ephemeral=True)
         except Exception as e:
-            await interaction.followup.send(f"Произошла ошибка при отклонении заявки: {e}", ephemeral=True)
+            await followup(interaction, f"Произошла ошибка при отклонении заявки: {e}", ephemeral=True)
 
 # Ticket Modal class
 class TicketModal(Modal, title="Заявка на сервер"):
@@ -166,151 +1395,456 @@ class TicketModal(Modal, title="Заявка на сервер"):
     def __init__(self):
         super().__init__(title="Заявка на сервер")
         
+    @timed("ticket_modal_submit")
     async def on_submit(self, interaction: discord.Interaction):
-        # Сначала отправляем начальное сообщение
-        await interaction.response.send_message("Ваша заявка принята! Проверьте личные сообщения для завершения заявки.", ephemeral=True)
-        
-        # Get the staff channel
-        staff_channel = client.get_channel(STAFF_CHANNEL_ID)
-        
-        # Создаем эмбед для заявки
-        embed = discord.Embed(
-            title=f"Новая заявка от {self.nickname.value}",
-            description="Информация об игроке:",
-            color=discord.Color.blue()
-        )
-        
-        embed.add_field(name="Ник", value=self.nickname.value, inline=False)
-        embed.add_field(name="Возраст", value=self.age.value, inline=False)
-        embed.add_field(name="Играл на подобных серверах", value=self.experience.value, inline=False)
-        embed.add_field(name="Самооценка адекватности", value=self.adequacy.value, inline=False)
-        embed.add_field(name="Планы на сервере", value=self.plans.value, inline=False)
-        
         # Get user for DM
         user = interaction.user
         
-        # Флаг успешного прохождения ЛС этапа
-        dm_completed = False
+        # Форма могла быть открыта несколько раз: повторы и занятые ники отсеиваются до отправки сообщений
+        conflict = application_store.applicants.conflict(interaction.guild_id, user.id, self.nickname.value)
+        if conflict == "pending":
+            await refuse_application(interaction, conflict, "У вас уже есть заявка на рассмотрении или незавершенный опрос в личных сообщениях. Дождитесь решения администрации.")
+            return
+        if interview_dispatcher.busy(user.id):
+            await refuse_application(interaction, "interview", "У вас уже идет опрос в личных сообщениях по заявке на другом сервере. Завершите его и попробуйте снова.")
+            return
+        if conflict == "nickname":
+            await refuse_application(interaction, conflict, f"Ник **{discord.utils.escape_markdown(self.nickname.value)}** уже указан в другой заявке. Если это ваш ник, свяжитесь с администрацией.")
+            return
+        # Пользователь и ник заняты сразу, до первого await: параллельно отправленная вторая форма получит отказ
+        application_store.applicants.claim(interaction.guild_id, user.id, self.nickname.value)
         
-        # Send an additional DM to get more information
+        # Сначала отправляем начальное сообщение; если взаимодействие уже недействительно, заявка не начата
         try:
-            # Проверяем возможность отправить DM
-            test_dm = await user.send("Пожалуйста, ответьте на дополнительные вопросы (это займет не более минуты). Если вы не ответите, ваша заявка не будет отправлена администрации.")
-            
-            # Ask about griefing
-            griefing_question = await user.send("Как вы относитесь к грифу?")
-            try:
-                # Увеличиваем таймаут до 10 минут для большего комфорта пользователей
-                griefing_response = await client.wait_for(
-                    'message',
-                    check=lambda m: m.author == user and isinstance(m.channel, discord.DMChannel),
-                    timeout=600.0
-                )
-                embed.add_field(name="Отношение к грифу", value=griefing_response.content, inline=False)
-                logger.info(f"Пользователь {user.name} ответил на первый вопрос: {griefing_response.content}")
-            except asyncio.TimeoutError:
-                embed.add_field(name="Отношение к грифу", value="Не ответил в течение 10 минут", inline=False)
-                await user.send("Время ожидания истекло. Ваша заявка отклонена. Повторите попытку и ответьте на все вопросы.")
-                logger.warning(f"Таймаут ожидания ответа на первый вопрос от {user.name}")
-                return  # Завершаем функцию, не выдаем роль
-            except Exception as e:
-                logger.error(f"Ошибка при получении ответа на вопрос о грифе: {e}")
-                embed.add_field(name="Отношение к грифу", value=f"Ошибка: {e}", inline=False)
-                await user.send("Произошла ошибка при обработке вашего ответа. Пожалуйста, попробуйте еще раз.")
-                return
-            
-            # Небольшая задержка между вопросами
-            await asyncio.sleep(1)
-            
-            # Ask about how they found the server
-            await user.send("Откуда узнали о сервере?")
-            try:
-                # Увеличиваем таймаут до 10 минут
-                source_response = await client.wait_for(
-                    'message',
-                    check=lambda m: m.author == user and isinstance(m.channel, discord.DMChannel),
-                    timeout=600.0
-                )
-                embed.add_field(name="Источник информации о сервере", value=source_response.content, inline=False)
-                logger.info(f"Пользователь {user.name} ответил на второй вопрос: {source_response.content}")
-            except asyncio.TimeoutError:
-                embed.add_field(name="Источник информации о сервере", value="Не ответил в течение 10 минут", inline=False)
-                await user.send("Время ожидания истекло. Ваша заявка отклонена. Повторите попытку и ответьте на все вопросы.")
-                logger.warning(f"Таймаут ожидания ответа на второй вопрос от {user.name}")
-                return  # Завершаем функцию, не выдаем роль
-            except Exception as e:
-                logger.error(f"Ошибка при получении ответа на вопрос об источнике: {e}")
-                embed.add_field(name="Источник информации о сервере", value=f"Ошибка: {e}", inline=False)
-                await user.send("Произошла ошибка при обработке вашего ответа. Пожалуйста, попробуйте еще раз.")
-                return
-            
-            # Thank the user
-            try:
-                await user.send("Спасибо за ваши ответы! Ваша заявка полностью отправлена администрации.")
-                logger.info(f"Отправлено благодарственное сообщение пользователю {user.name}")
-                dm_completed = True
-                logger.info(f"Установлен флаг dm_completed = True для {user.name}")
-            except Exception as e:
-                logger.error(f"Ошибка при отправке благодарственного сообщения: {e}")
-                # Даже если не удалось отправить благодарственное сообщение, продолжаем обработку
-                dm_completed = True
-                logger.warning(f"Установлен флаг dm_completed = True для {user.name} несмотря на ошибку")
+            await interaction.response.send_message("Ваша заявка принята! Проверьте личные сообщения для завершения заявки.", ephemeral=True)
+        except Exception:
+            application_store.applicants.release(interaction.guild_id, user.id)
+            raise
+        
+        # Поля эмбеда из формы; ответы из ЛС добавятся к ним по мере прохождения опроса
+        fields = [
+            ["Ник", self.nickname.value],
+            ["Возраст", self.age.value],
+            ["Играл на подобных серверах", self.experience.value],
+            ["Самооценка адекватности", self.adequacy.value],
+            ["Планы на сервере", self.plans.value],
+        ]
+        # Вопросы фиксируются при подаче формы: изменение настроек не влияет на уже начатые опросы
+        questions = guild_settings.get(interaction.guild_id).questions
+        interview = Interview(user.id, self.nickname.value, self.age.value, fields, interaction.created_at.timestamp(), guild_id=interaction.guild_id, questions=questions)
+        interview.interaction = interaction
         
+        # Send an additional DM to get more information
+        try:
+            await send_dm(user, "Пожалуйста, ответьте на дополнительные вопросы (это займет не более минуты). Если вы не ответите, ваша заявка не будет отправлена администрации.")
+            await interview_dispatcher.begin(user, interview)
         except discord.Forbidden:
             # Cannot send DM to the user
+            application_store.applicants.release(interaction.guild_id, user.id)
             try:
-                await interaction.followup.send("Не удалось отправить вам личное сообщение. Пожалуйста, откройте личные сообщения в настройках приватности Discord и попробуйте снова.", ephemeral=True)
-                logger.warning(f"Не удалось отправить DM пользователю {user.name} - сообщения закрыты")
+                await followup(interaction, "Не удалось отправить вам личное сообщение. Пожалуйста, откройте личные сообщения в настройках приватности Discord и попробуйте снова.", ephemeral=True)
+                logger.warning("Не удалось отправить DM пользователю %s - сообщения закрыты", user.name, extra={"event": "application_dm_closed", "applicant_id": user.id})
             except Exception as e:
-                logger.error(f"Ошибка при отправке сообщения о закрытых DM: {e}")
-            return  # Завершаем функцию, не выдаем роль
+                logger.error("Ошибка при отправке сообщения о закрытых DM: %s", e)
         except Exception as e:
             # Other errors
-            logger.error(f"Ошибка при отправке DM: {e}")
+            logger.error("Ошибка при отправке DM: %s", e, extra={"event": "application_dm_failed", "applicant_id": user.id})
+            application_store.applicants.release(interaction.guild_id, user.id)
             try:
-                await interaction.followup.send("Произошла ошибка при обработке заявки. Пожалуйста, попробуйте позже.", ephemeral=True)
+                await followup(interaction, "Произошла ошибка при обработке заявки. Пожалуйста, попробуйте позже.", ephemeral=True)
             except Exception as follow_up_error:
-                logger.error(f"Ошибка при отправке сообщения об ошибке: {follow_up_error}")
-            return  # Завершаем функцию, не выдаем роль
-            
-        # ТОЛЬКО если прошли все проверки ЛС, отправляем заявку администраторам
-        if dm_completed:
-            logger.info(f"Начинаем процесс отправки заявки для {user.name}")
-            success_message = "Ваша заявка успешно отправлена администрации!"
-            
+                logger.error("Ошибка при отправке сообщения об ошибке: %s", follow_up_error)
+
+# Состояние опроса в ЛС: текущий шаг и уже собранные поля эмбеда
+class Interview:
+    __slots__ = ("user_id", "nickname", "age", "fields", "submitted_at", "step", "guild_id", "questions", "interaction", "asked_at")
+    
+    def __init__(self, user_id, nickname, age, fields, submitted_at, step=0, guild_id=None, questions=None):
+        self.user_id = user_id
+        self.nickname = nickname
+        self.age = age
+        self.fields = fields
+        self.submitted_at = submitted_at
+        self.step = step
+        self.guild_id = guild_id
+        self.questions = questions if questions is not None else INTERVIEW_QUESTIONS
+        # Взаимодействие доступно только в процессе, где была отправлена форма
+        self.interaction = None
+        self.asked_at = None
+    
+    def to_dict(self):
+        return {
+            "nickname": self.nickname,
+            "age": self.age,
+            "fields": self.fields,
+            "submitted_at": self.submitted_at,
+            "step": self.step,
+            "guild_id": self.guild_id,
+            "questions": self.questions,
+        }
+    
+    @classmethod
+    def from_dict(cls, user_id, data):
+        # Опросы, сохраненные до появления настроек серверов, продолжаются с вопросами по умолчанию
+        return cls(user_id, data["nickname"], data["age"], data["fields"], data["submitted_at"], data["step"], data.get("guild_id"), data.get("questions"))
+
+# Колесо таймеров: один фоновый тик обслуживает таймауты всех опросов
+class TimerWheel:
+    def __init__(self, slots=64, tick=1.0):
+        self.slots = [{} for _ in range(slots)]
+        self.tick = tick
+        self.cursor = 0
+        self.positions = {}
+    
+    def schedule(self, key, delay):
+        self.cancel(key)
+        ticks = max(1, math.ceil(delay / self.tick))
+        slot = (self.cursor + ticks) % len(self.slots)
+        # Количество полных оборотов колеса до срабатывания
+        self.slots[slot][key] = (ticks - 1) // len(self.slots)
+        self.positions[key] = slot
+    
+    def cancel(self, key):
+        slot = self.positions.pop(key, None)
+        if slot is not None:
+            self.slots[slot].pop(key, None)
+    
+    def advance(self):
+        self.cursor = (self.cursor + 1) % len(self.slots)
+        bucket = self.slots[self.cursor]
+        expired = []
+        for key, rounds in list(bucket.items()):
+            if rounds == 0:
+                del bucket[key]
+                del self.positions[key]
+                expired.append(key)
+            else:
+                bucket[key] = rounds - 1
+        return expired
+    
+    async def run(self, on_expire):
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time() + self.tick
+        while True:
+            await asyncio.sleep(max(0, next_tick - loop.time()))
+            # Догоняем пропущенные тики, если цикл событий был занят
+            while next_tick <= loop.time():
+                next_tick += self.tick
+                for key in self.advance():
+                    # Ошибка одного таймера (например, недоступно хранилище) не должна останавливать колесо
+                    try:
+                        on_expire(key)
+                    except Exception:
+                        logger.exception("Ошибка при обработке таймаута %s", key, extra={"event": "timer_error"})
+
+# Диспетчер опросов в ЛС: сообщения маршрутизируются по ID пользователя за O(1)
+# Прогресс каждого опроса сохраняется в хранилище, поэтому опрос переживает перезапуск бота
+class InterviewDispatcher:
+    NAMESPACE = "interviews"
+    
+    def __init__(self, timeout, state):
+        self.timeout = timeout
+        self.state = state
+        self.active = {}
+        self.wheel = TimerWheel()
+        self.task = None
+        self.resumed = False
+    
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self.wheel.run(self.expire))
+    
+    def busy(self, user_id):
+        # Ответы в ЛС не привязаны к серверу, поэтому у пользователя может идти только один опрос
+        if user_id in self.active:
+            return True
+        if not self.state.shared:
+            return False
+        data = self.state.get(self.NAMESPACE, user_id)
+        return data is not None and time.time() <= data["deadline"]
+    
+    async def begin(self, user, interview):
+        # Регистрируем опрос до отправки вопроса, чтобы не пропустить быстрый ответ
+        replaced = self.active.get(user.id)
+        if replaced is not None and replaced.guild_id != interview.guild_id:
+            application_store.applicants.release(replaced.guild_id, user.id)
+        self.active[user.id] = interview
+        try:
+            await self.ask(user, interview)
+        except Exception:
+            self.discard(user.id)
+            raise
+    
+    async def ask(self, user, interview):
+        interview.asked_at = time.monotonic()
+        self.wheel.schedule(interview.user_id, self.timeout)
+        self.save(interview)
+        await send_dm(user, interview.questions[interview.step][1])
+    
+    def save(self, interview):
+        data = interview.to_dict()
+        data["deadline"] = time.time() + self.timeout
+        self.state.put(self.NAMESPACE, interview.user_id, data)
+    
+    def discard(self, user_id):
+        # Сначала состояние в памяти: при недоступном хранилище пользователь не должен остаться занятым
+        self.wheel.cancel(user_id)
+        interview = self.active.pop(user_id, None)
+        if interview is not None:
+            application_store.applicants.release(interview.guild_id, user_id)
+        self.forget(user_id)
+        return interview
+    
+    def forget(self, user_id):
+        try:
+            self.state.delete(self.NAMESPACE, user_id)
+        except Exception as e:
+            logger.error("Не удалось удалить опрос пользователя %s из хранилища: %s", user_id, e, extra={"event": "interview_state_error", "applicant_id": user_id})
+    
+    async def resume(self):
+        # Восстанавливаем незавершенные опросы один раз за процесс; ответы в ЛС приходят только шарду 0
+        if self.resumed or not handles_direct_messages():
+            return
+        self.resumed = True
+        
+        saved = self.state.load(self.NAMESPACE)
+        if saved:
+            logger.info("Восстановление незавершенных опросов: %s", len(saved))
+        
+        for key, data in saved.items():
+            interview = Interview.from_dict(int(key), data)
             try:
-                await interaction.followup.send(success_message, ephemeral=True)
-                logger.info(f"Отправлено уведомление об успешной подаче заявки для {user.name}")
+                user = client.get_user(interview.user_id) or await client.fetch_user(interview.user_id)
             except Exception as e:
-                logger.error(f"Ошибка при отправке уведомления об успешной подаче заявки: {e}")
+                logger.error("Не удалось получить пользователя %s для восстановления опроса: %s", key, e)
+                self.state.delete(self.NAMESPACE, key)
+                continue
             
-            # Add timestamp and user ID
-            embed.set_footer(text=f"ID пользователя: {interaction.user.id} • {discord.utils.format_dt(interaction.created_at)}")
+            # Индекс заявителей не сохраняется: незавершенный опрос снова занимает пользователя и ник
+            application_store.applicants.claim(interview.guild_id, interview.user_id, interview.nickname)
             
-            # Send the embed to the staff channel with buttons
-            if staff_channel:
-                try:
-                    view = ApplicationActionView(interaction.user.id, self.nickname.value, self.age.value)
-                    await staff_channel.send(content=f"<@{interaction.user.id}> подал заявку:", embed=embed, view=view)
-                    logger.info(f"Заявка для {user.name} успешно отправлена в канал администрации")
-                except Exception as e:
-                    logger.error(f"Ошибка при отправке заявки в канал администрации: {e}")
-                    try:
-                        await user.send("Произошла ошибка при отправке вашей заявки администрации. Пожалуйста, свяжитесь с администратором сервера.")
-                    except:
-                        pass
-            else:
-                logger.error(f"Error: Staff channel with ID {STAFF_CHANNEL_ID} not found")
-                try:
-                    await user.send("Не удалось отправить заявку из-за ошибки конфигурации. Пожалуйста, свяжитесь с администратором сервера.")
-                except:
-                    pass
-        else:
-            logger.warning(f"Пользователь {user.name} не завершил процесс подачи заявки (dm_completed = False)")
+            # Все ответы уже получены, но заявка не успела уйти администрации
+            if interview.step >= len(interview.questions):
+                await submit_application(user, interview)
+                self.state.delete(self.NAMESPACE, key)
+                continue
+            
+            # Бот был недоступен слишком долго - считаем опрос просроченным
+            if time.time() > data["deadline"] + self.timeout:
+                self.state.delete(self.NAMESPACE, key)
+                application_store.applicants.release(interview.guild_id, interview.user_id)
+                await self.notify_timeout(interview.user_id)
+                continue
+            
+            self.active[interview.user_id] = interview
             try:
-                await interaction.followup.send("Ваша заявка не была отправлена из-за проблем с личными сообщениями.", ephemeral=True)
-            except:
-                pass
+                await send_dm(user, "Бот был перезапущен. Ваши ответы сохранены, продолжим с того места, где вы остановились.")
+                await self.ask(user, interview)
+                logger.info("Опрос пользователя %s восстановлен на вопросе %s", user.name, interview.step + 1, extra={"event": "interview_resumed", "applicant_id": user.id, "step": interview.step + 1})
+            except Exception as e:
+                logger.error("Ошибка при восстановлении опроса пользователя %s: %s", user.name, e)
+                self.discard(interview.user_id)
+    
+    def adopt(self, user_id):
+        # Опрос начат другим процессом (форма отправлена на другом шарде): продолжаем его по общему хранилищу
+        if not self.state.shared:
+            return None
+        data = self.state.get(self.NAMESPACE, user_id)
+        if data is None or time.time() > data["deadline"]:
+            return None
+        interview = Interview.from_dict(user_id, data)
+        if interview.step >= len(interview.questions):
+            return None
+        self.active[user_id] = interview
+        application_store.applicants.claim(interview.guild_id, user_id, interview.nickname)
+        logger.info("Опрос пользователя %s продолжен из общего хранилища на вопросе %s", user_id, interview.step + 1, extra={"event": "interview_adopted", "applicant_id": user_id, "step": interview.step + 1})
+        return interview
+    
+    async def handle_message(self, message):
+        interview = self.active.get(message.author.id) or self.adopt(message.author.id)
+        if interview is None:
+            return False
+        
+        user = message.author
+        if interview.asked_at is not None:
+            metrics.observe("bot_interview_answer_seconds", time.monotonic() - interview.asked_at)
+        field_name = interview.questions[interview.step][0]
+        interview.fields.append([field_name, message.content])
+        interview.step += 1
+        # Текст ответа попадает в заявку, в журнал пишется только его длина
+        logger.info("Пользователь %s ответил на вопрос %s (%s символов)", user.name, interview.step, len(message.content), extra={"event": "interview_answer", "applicant_id": user.id, "step": interview.step})
+        
+        if interview.step < len(interview.questions):
+            try:
+                await self.ask(user, interview)
+            except Exception as e:
+                logger.error("Ошибка при отправке вопроса пользователю %s: %s", user.name, e, extra={"event": "interview_failed", "applicant_id": user.id})
+                self.discard(user.id)
+            return True
+        
+        # Сохраняем завершенный опрос до отправки заявки, чтобы не потерять ее при перезапуске
+        self.wheel.cancel(user.id)
+        self.active.pop(user.id, None)
+        self.state.put(self.NAMESPACE, user.id, interview.to_dict() | {"deadline": time.time()})
+        await submit_application(user, interview)
+        self.state.delete(self.NAMESPACE, user.id)
+        return True
+    
+    def expire(self, user_id):
+        interview = self.active.pop(user_id, None)
+        if interview is not None and self.state.shared:
+            try:
+                data = self.state.get(self.NAMESPACE, user_id)
+            except Exception as e:
+                # Хранилище недоступно: опрос этого процесса считается просроченным
+                logger.error("Не удалось проверить опрос пользователя %s в хранилище: %s", user_id, e, extra={"event": "interview_state_error", "applicant_id": user_id})
+            else:
+                if data is None or data["step"] != interview.step:
+                    # Опрос продолжен или завершен другим процессом, таймаут отслеживает он
+                    return
+        self.forget(user_id)
+        if interview is not None:
+            application_store.applicants.release(interview.guild_id, user_id)
+            logger.warning("Таймаут ожидания ответа на вопрос %s от пользователя %s", interview.step + 1, user_id, extra={"event": "interview_timeout", "applicant_id": user_id, "step": interview.step + 1})
+            asyncio.create_task(self.notify_timeout(user_id))
+    
+    async def notify_timeout(self, user_id):
+        try:
+            user = client.get_user(user_id) or await client.fetch_user(user_id)
+            await send_dm(user, "Время ожидания истекло. Ваша заявка отклонена. Повторите попытку и ответьте на все вопросы.")
+        except Exception as e:
+            logger.error("Ошибка при отправке сообщения о таймауте пользователю %s: %s", user_id, e)
+
+# Личные сообщения Discord доставляет только шарду 0
+def handles_direct_messages():
+    return not SHARDING or not SHARD_IDS or 0 in SHARD_IDS
+
+interview_dispatcher = InterviewDispatcher(INTERVIEW_TIMEOUT, state_store)
+metrics.gauge("bot_interviews_in_flight", lambda: len(interview_dispatcher.active))
+
+# Отправка заявки администрации после успешного прохождения опроса в ЛС
+async def submit_application(user, interview):
+    # Канал администрации должен принадлежать серверу заявки: без своего канала заявка не отправляется
+    settings = guild_settings.get(interview.guild_id)
+    staff_channel = await guild_channel(interview.guild_id, settings.staff_channel_id)
+    if staff_channel is None:
+        logger.error("Канал администрации %s не найден на сервере %s", settings.staff_channel_id, interview.guild_id, extra={"event": "application_submit_failed", "applicant_id": user.id})
+        application_store.applicants.release(interview.guild_id, user.id)
+        try:
+            await send_dm(user, "Не удалось отправить заявку: на сервере не настроен канал для заявок. Пожалуйста, свяжитесь с администратором сервера.")
+        except Exception:
+            pass
+        return
+    
+    # Thank the user
+    try:
+        await send_dm(user, "Спасибо за ваши ответы! Ваша заявка полностью отправлена администрации.")
+        logger.info("Отправлено благодарственное сообщение пользователю %s", user.name, extra={"event": "application_step", "applicant_id": user.id})
+    except Exception as e:
+        # Даже если не удалось отправить благодарственное сообщение, продолжаем обработку
+        logger.error("Ошибка при отправке благодарственного сообщения: %s", e)
+    
+    logger.info("Начинаем процесс отправки заявки для %s", user.name, extra={"event": "application_step", "applicant_id": user.id})
+    
+    if interview.interaction is not None:
+        try:
+            await followup(interview.interaction, "Ваша заявка успешно отправлена администрации!", ephemeral=True)
+            logger.info("Отправлено уведомление об успешной подаче заявки для %s", user.name, extra={"event": "application_step", "applicant_id": user.id})
+        except Exception as e:
+            logger.error("Ошибка при отправке уведомления об успешной подаче заявки: %s", e)
+    
+    # Создаем эмбед для заявки
+    embed = discord.Embed(
+        title=f"Новая заявка от {interview.nickname}",
+        description="Информация об игроке:",
+        color=discord.Color.blue()
+    )
+    for name, value in interview.fields:
+        embed.add_field(name=name, value=value, inline=False)
+    
+    # Add timestamp and user ID
+    submitted_at = datetime.fromtimestamp(interview.submitted_at, tz=timezone.utc)
+    embed.set_footer(text=f"ID пользователя: {user.id} • {discord.utils.format_dt(submitted_at)}")
+    
+    # Send the embed to the staff channel with buttons
+    try:
+        view = ApplicationActionView()
+        staff_message = await send_to(staff_channel, content=f"<@{user.id}> подал заявку:", embed=embed, view=view)
+        application_store.add(staff_message.id, staff_channel.id, user.id, interview.nickname, interview.age, guild_id=interview.guild_id)
+        application_history.add(staff_message.id, staff_channel.id, interview.guild_id, user.id, interview.nickname, interview.age, interview.fields, interview.submitted_at)
+        logger.info("Заявка для %s успешно отправлена в канал администрации", user.name, extra={"event": "application_submitted", "applicant_id": user.id, "message_id": staff_message.id})
+    except Exception as e:
+        logger.error("Ошибка при отправке заявки в канал администрации: %s", e, extra={"event": "application_submit_failed", "applicant_id": user.id})
+        application_store.applicants.release(interview.guild_id, user.id)
+        try:
+            await send_dm(user, "Произошла ошибка при отправке вашей заявки администрации. Пожалуйста, свяжитесь с администратором сервера.")
+        except:
+            pass
+
+# Корзина токенов: до capacity действий подряд, затем rate действий в секунду
+class TokenBucket:
+    __slots__ = ("capacity", "rate", "tokens", "updated")
+    
+    def __init__(self, capacity, rate, now):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated = now
+    
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    # Возвращает 0, если токен взят, иначе время в секундах до появления токена
+    def take(self, now):
+        self.refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else math.inf
+    
+    def full_at(self):
+        return self.updated + (self.capacity - self.tokens) / self.rate if self.rate > 0 else math.inf
+
+# Лимит нажатий кнопки заявки: корзина на каждого пользователя и общая корзина процесса.
+# Корзины хранятся в порядке последнего обращения; заполнившиеся снова корзины удаляются с начала
+class SubmissionLimiter:
+    def __init__(self, user_burst, user_per_minute, global_burst, global_per_minute):
+        self.user_burst = user_burst
+        self.user_rate = user_per_minute / 60
+        self.users = OrderedDict()
+        self.global_bucket = TokenBucket(global_burst, global_per_minute / 60, time.monotonic())
+    
+    def prune(self, now):
+        while self.users:
+            user_id, bucket = next(iter(self.users.items()))
+            if bucket.full_at() > now:
+                break
+            del self.users[user_id]
+    
+    # None, если нажатие разрешено, иначе (user|global, секунды до следующей попытки)
+    def acquire(self, user_id):
+        now = time.monotonic()
+        self.prune(now)
+        bucket = self.users.pop(user_id, None) or TokenBucket(self.user_burst, self.user_rate, now)
+        self.users[user_id] = bucket
+        retry_after = bucket.take(now)
+        if retry_after:
+            return "user", retry_after
+        # Общий лимит расходуется только нажатиями, прошедшими личный лимит
+        retry_after = self.global_bucket.take(now)
+        if retry_after:
+            bucket.tokens += 1
+            return "global", retry_after
+        return None
+
+application_limiter = SubmissionLimiter(APPLICATION_USER_BURST, APPLICATION_USER_PER_MINUTE, APPLICATION_GLOBAL_BURST, APPLICATION_GLOBAL_PER_MINUTE)
+
+# Отказ в подаче заявки: единственный ответ на взаимодействие, без других запросов к API
+async def refuse_application(interaction, reason, text):
+    metrics.inc("bot_applications_refused_total", reason=reason)
+    logger.info("Заявка пользователя %s отклонена до отправки: %s", interaction.user.name, reason, extra={"event": "application_refused", "applicant_id": interaction.user.id, "reason": reason})
+    await interaction.response.send_message(text, ephemeral=True)
 
 # Button View class
 class TicketView(View):
@@ -318,37 +1852,357 @@ class TicketView(View):
         super().__init__(timeout=None)
     
     @discord.ui.button(label="Подать заявку", style=discord.ButtonStyle.primary, custom_id="ticket_button")
+    @timed("ticket_button")
     async def ticket_button(self, interaction: discord.Interaction, button: Button):
+        # Повторные заявки и частые нажатия отсеиваются до открытия формы
+        if application_store.applicants.conflict(interaction.guild_id, interaction.user.id) is not None:
+            await refuse_application(interaction, "pending", "У вас уже есть заявка на рассмотрении или незавершенный опрос в личных сообщениях. Дождитесь решения администрации.")
+            return
+        if interview_dispatcher.busy(interaction.user.id):
+            await refuse_application(interaction, "interview", "У вас уже идет опрос в личных сообщениях по заявке на другом сервере. Завершите его и попробуйте снова.")
+            return
+        limited = application_limiter.acquire(interaction.user.id)
+        if limited is not None:
+            scope, retry_after = limited
+            wait = math.ceil(min(retry_after, 3600))
+            if scope == "user":
+                text = f"Слишком много попыток. Попробуйте снова через {wait} с."
+            else:
+                text = f"Сейчас подается слишком много заявок. Попробуйте снова через {wait} с."
+            await refuse_application(interaction, f"rate_{scope}", text)
+            return
+        
         try:
             # Send the modal to the user
             await interaction.response.send_modal(TicketModal())
-            logger.info(f"Пользователь {interaction.user.name} нажал на кнопку 'Подать заявку'")
+            logger.info("Пользователь %s нажал на кнопку 'Подать заявку'", interaction.user.name, extra={"event": "application_form_open", "applicant_id": interaction.user.id})
         except Exception as e:
-            logger.error(f"Ошибка при отправке модального окна: {e}")
+            logger.error("Ошибка при отправке модального окна: %s", e)
             try:
                 await interaction.response.send_message("Произошла ошибка при открытии формы. Пожалуйста, попробуйте еще раз или сообщите администратору.", ephemeral=True)
             except Exception as follow_up_error:
-                logger.error(f"Ошибка при отправке сообщения об ошибке: {follow_up_error}")
+                logger.error("Ошибка при отправке сообщения об ошибке: %s", follow_up_error)
 
-# View с кнопками для выбора типа жалобы
+# Тип тикета: кнопка на панели жалоб, шаблон, права автора и маршрутизация (роль для упоминания)
+class TicketType:
+    __slots__ = ("key", "label", "style", "title", "fields", "user_permissions", "mention_role_id", "embed")
+    
+    def __init__(self, key, label, style, title, fields, user_permissions=None, mention_role_id=None):
+        self.key = key
+        self.label = label
+        self.style = style
+        self.title = title
+        self.fields = fields
+        self.user_permissions = user_permissions or {"read_messages": True, "send_messages": True}
+        self.mention_role_id = mention_role_id
+        self.embed = self.build_embed()
+    
+    def build_embed(self):
+        # Шаблон собирается в эмбед один раз при запуске
+        lines = "\n".join(f"**{field}:** " for field in self.fields)
+        embed = discord.Embed(
+            title=self.title,
+            description=f"Пожалуйста, заполните следующую информацию:\n\n{lines}\n\nПосле заполнения жалобы, ожидайте ответа администрации.",
+            color=discord.Color.red()
+        )
+        embed.set_footer(text="Когда вопрос будет решен, тикет можно закрыть кнопкой ниже.")
+        return embed
+    
+    def user_overwrite(self):
+        return discord.PermissionOverwrite(**self.user_permissions)
+
+# Реестр типов тикетов: новый тип добавляется одной записью, кнопка на панели жалоб появится автоматически
+TICKET_TYPES = {
+    ticket_type.key: ticket_type for ticket_type in (
+        TicketType(
+            "player", "Жалоба на игрока", discord.ButtonStyle.danger, "Жалоба на игрока",
+            ["Ник игрока", "Ваш ник", "Правило, которое нарушил", "Описание ситуации", "Демонстрация (скриншоты/видео)"],
+            user_permissions={"read_messages": True, "send_messages": True, "attach_files": True},
+        ),
+        TicketType(
+            "bug", "Жалоба о баге", discord.ButtonStyle.primary, "Жалоба о баге",
+            ["Ваш ник", "Описание проблемы/бага", "Демонстрация (скриншоты/видео)"],
+            user_permissions={"read_messages": True, "send_messages": True, "attach_files": True},
+        ),
+        TicketType(
+            "issue", "Жалоба о проблеме", discord.ButtonStyle.secondary, "Жалоба о проблеме",
+            ["Ваш ник", "Описание проблемы"],
+        ),
+    )
+}
+
+# View с кнопками для выбора типа жалобы, кнопки строятся по реестру типов
 class ReportTypeView(View):
     def __init__(self):
         super().__init__(timeout=None)
+        for ticket_type in TICKET_TYPES.values():
+            button = Button(label=ticket_type.label, style=ticket_type.style, custom_id=f"report_{ticket_type.key}")
+            button.callback = self.make_callback(ticket_type.key)
+            self.add_item(button)
     
-    @discord.ui.button(label="Жалоба на игрока", style=discord.ButtonStyle.danger, custom_id="report_player")
-    async def report_player_button(self, interaction: discord.Interaction, button: Button):
-        await interaction.response.defer(ephemeral=True)
-        await create_ticket_channel(interaction, "player")
+    @staticmethod
+    def make_callback(ticket_type):
+        @timed(f"report_{ticket_type}")
+        async def callback(interaction: discord.Interaction):
+            await interaction.response.defer(ephemeral=True)
+            await create_ticket_channel(interaction, ticket_type)
+        return callback
+
+TICKET_CATEGORY_NAME = "Тикеты"
+
+# Закэшированные данные сервера для создания тикетов
+class TicketGuildEntry:
+    __slots__ = ("category_id", "admin_role_ids", "overwrites")
     
-    @discord.ui.button(label="Жалоба о баге", style=discord.ButtonStyle.primary, custom_id="report_bug")
-    async def report_bug_button(self, interaction: discord.Interaction, button: Button):
-        await interaction.response.defer(ephemeral=True)
-        await create_ticket_channel(interaction, "bug")
+    def __init__(self, category_id, admin_role_ids, overwrites):
+        self.category_id = category_id
+        self.admin_role_ids = admin_role_ids
+        self.overwrites = overwrites
+
+# Кэш категории тикетов, ролей администраторов и шаблона прав по серверам.
+# Сбрасывается событиями изменения ролей и категорий; создание категории защищено блокировкой
+class TicketGuildCache:
+    def __init__(self):
+        self.entries = {}
+        self.locks = {}
     
-    @discord.ui.button(label="Жалоба о проблеме", style=discord.ButtonStyle.secondary, custom_id="report_issue")
-    async def report_issue_button(self, interaction: discord.Interaction, button: Button):
-        await interaction.response.defer(ephemeral=True)
-        await create_ticket_channel(interaction, "issue")
+    def resolve(self, guild):
+        entry = self.entries.get(guild.id)
+        if entry is None:
+            admin_roles = [role for role in guild.roles if role.permissions.administrator]
+            overwrites = {guild.default_role: discord.PermissionOverwrite(read_messages=False, send_messages=False)}
+            for role in admin_roles:
+                overwrites[role] = discord.PermissionOverwrite(read_messages=True, send_messages=True)
+            category = discord.utils.get(guild.categories, name=TICKET_CATEGORY_NAME)
+            entry = TicketGuildEntry(category.id if category else None, {role.id for role in admin_roles}, overwrites)
+            self.entries[guild.id] = entry
+        return entry
+    
+    def invalidate(self, guild_id):
+        if self.entries.pop(guild_id, None) is not None:
+            logger.info("Кэш тикетов сервера %s сброшен", guild_id)
+    
+    def overwrites_for(self, guild, user, user_overwrite):
+        overwrites = dict(self.resolve(guild).overwrites)
+        overwrites[user] = user_overwrite
+        return overwrites
+    
+    def cached_category(self, guild):
+        category_id = self.resolve(guild).category_id
+        return guild.get_channel(category_id) if category_id else None
+    
+    async def get_category(self, guild):
+        category = self.cached_category(guild)
+        if category is not None:
+            return category
+        
+        # Одновременные тикеты ждут одного создания категории вместо создания дублей
+        lock = self.locks.setdefault(guild.id, asyncio.Lock())
+        async with lock:
+            category = self.cached_category(guild)
+            if category is None:
+                category = await rest(f"guild:{guild.id}", PRIORITY_INTERACTION, lambda: guild.create_category(TICKET_CATEGORY_NAME))
+                self.resolve(guild).category_id = category.id
+                logger.info("Создана категория %s на сервере %s", TICKET_CATEGORY_NAME, guild.name)
+        return category
+
+ticket_guild_cache = TicketGuildCache()
+
+# Метка тикета в теме канала: по ней индекс восстанавливается при запуске
+TICKET_TOPIC_PREFIX = "ticket:"
+
+def ticket_topic(ticket_type, user_id):
+    return f"{TICKET_TOPIC_PREFIX}{ticket_type}:{user_id}"
+
+def parse_ticket_topic(topic):
+    if not topic or not topic.startswith(TICKET_TOPIC_PREFIX):
+        return None
+    try:
+        ticket_type, user_id = topic[len(TICKET_TOPIC_PREFIX):].rsplit(":", 1)
+        return ticket_type, int(user_id)
+    except ValueError:
+        return None
+
+# Индекс открытых тикетов: (сервер, пользователь, тип) -> канал, с сохранением в хранилище.
+# Лимит тикетов на пользователя считается отдельно на каждом сервере
+class OpenTicketIndex:
+    NAMESPACE = "open_tickets"
+    
+    def __init__(self, state):
+        self.state = state
+        self.by_key = {}
+        self.by_channel = {}
+        self.per_user = {}
+        # Тикеты, которые создаются прямо сейчас (защита от двойного нажатия)
+        self.creating = set()
+    
+    def load(self):
+        for channel_id, record in self.state.load(self.NAMESPACE).items():
+            self._index(int(channel_id), record)
+        logger.info("Загружено открытых тикетов из хранилища: %s", len(self.by_channel))
+    
+    def _index(self, channel_id, record):
+        self.by_channel[channel_id] = record
+        self.by_key[(record["guild_id"], record["user_id"], record["type"])] = channel_id
+        user_key = (record["guild_id"], record["user_id"])
+        self.per_user[user_key] = self.per_user.get(user_key, 0) + 1
+    
+    def get(self, guild_id, user_id, ticket_type):
+        return self.by_key.get((guild_id, user_id, ticket_type))
+    
+    def count_for(self, guild_id, user_id):
+        return self.per_user.get((guild_id, user_id), 0)
+    
+    def add(self, channel_id, guild_id, user_id, ticket_type):
+        record = {"guild_id": guild_id, "user_id": user_id, "type": ticket_type}
+        self.remove(channel_id)
+        self._index(channel_id, record)
+        self.state.put(self.NAMESPACE, channel_id, record)
+    
+    def remove(self, channel_id):
+        record = self._unindex(channel_id)
+        if record is not None:
+            self.state.delete(self.NAMESPACE, channel_id)
+        return record
+    
+    def _unindex(self, channel_id):
+        record = self.by_channel.pop(channel_id, None)
+        if record is None:
+            return None
+        key = (record["guild_id"], record["user_id"], record["type"])
+        if self.by_key.get(key) == channel_id:
+            del self.by_key[key]
+        user_key = (record["guild_id"], record["user_id"])
+        remaining = self.per_user.get(user_key, 1) - 1
+        if remaining > 0:
+            self.per_user[user_key] = remaining
+        else:
+            self.per_user.pop(user_key, None)
+        return record
+    
+    def retain_guilds(self, guild_ids):
+        # Тикеты серверов других шардов остаются в общем хранилище, но не учитываются этим процессом
+        foreign = [channel_id for channel_id, record in self.by_channel.items() if record["guild_id"] not in guild_ids]
+        for channel_id in foreign:
+            self._unindex(channel_id)
+    
+    def rebuild(self, guild, category):
+        # Один проход по каналам категории: тема канала содержит тип тикета и ID пользователя
+        found = {}
+        present = set()
+        members_by_name = None
+        for channel in category.text_channels:
+            present.add(channel.id)
+            parsed = parse_ticket_topic(channel.topic)
+            if parsed is None and channel.name.startswith("тикет-"):
+                # Тикеты, созданные до появления метки в теме: тип и имя пользователя из названия канала
+                parts = channel.name.split("-", 2)
+                if len(parts) == 3:
+                    if members_by_name is None:
+                        members_by_name = {member.name.lower(): member.id for member in guild.members}
+                    member_id = members_by_name.get(parts[2])
+                    if member_id is not None:
+                        parsed = (parts[1], member_id)
+            if parsed is not None:
+                found[channel.id] = parsed
+        
+        # Устаревшими считаются только удаленные каналы: старый тикет, автор которого еще не в кэше, сохраняется
+        stale = [channel_id for channel_id, record in self.by_channel.items() if record["guild_id"] == guild.id and channel_id not in present]
+        for channel_id in stale:
+            self.remove(channel_id)
+        for channel_id, (ticket_type, user_id) in found.items():
+            if channel_id not in self.by_channel:
+                self.add(channel_id, guild.id, user_id, ticket_type)
+        logger.info("Индекс тикетов сервера %s восстановлен: открыто %s, удалено устаревших %s", guild.name, len(found), len(stale))
+
+open_tickets = OpenTicketIndex(state_store)
+
+# Начальное сообщение тикета: упоминание, шаблон и кнопка закрытия одним сообщением.
+# Без пользователя - для каналов пула, которые заполняются заранее
+async def post_ticket_bootstrap(channel, ticket_type, user=None, priority=PRIORITY_STAFF):
+    ticket = TICKET_TYPES[ticket_type]
+    content = None
+    if user is not None:
+        content = ticket_mention(ticket, user)
+    await send_to(channel, content=content, embed=ticket.embed, view=CloseTicketView(), priority=priority)
+
+def ticket_mention(ticket, user):
+    content = f"{user.mention}, ваш тикет создан! Пожалуйста, заполните информацию ниже:"
+    if ticket.mention_role_id:
+        content += f" <@&{ticket.mention_role_id}>"
+    return content
+
+POOL_TOPIC_PREFIX = "pool:"
+
+# Пул скрытых заранее созданных каналов для мгновенной выдачи тикетов.
+# Каналы видны только администраторам и уже содержат шаблон и кнопку закрытия
+class TicketChannelPool:
+    def __init__(self, size, ticket_types):
+        self.size = size
+        self.ticket_types = ticket_types
+        self.available = {}
+        self.refills = {}
+    
+    @property
+    def enabled(self):
+        return self.size > 0
+    
+    def _slots(self, guild_id):
+        return self.available.setdefault(guild_id, {ticket_type: [] for ticket_type in self.ticket_types})
+    
+    def rebuild(self, guild, category):
+        slots = self._slots(guild.id)
+        for channel in category.text_channels:
+            if channel.topic and channel.topic.startswith(POOL_TOPIC_PREFIX):
+                ticket_type = channel.topic[len(POOL_TOPIC_PREFIX):]
+                if ticket_type in slots and channel.id not in slots[ticket_type]:
+                    slots[ticket_type].append(channel.id)
+        logger.info("Пул тикетов сервера %s: %s", guild.name, ", ".join(f"{t}={len(ids)}" for t, ids in slots.items()))
+    
+    def take(self, guild, ticket_type):
+        if not self.enabled:
+            return None
+        channel_ids = self._slots(guild.id).get(ticket_type, [])
+        while channel_ids:
+            channel = guild.get_channel(channel_ids.pop())
+            if channel is not None:
+                return channel
+        self.schedule_refill(guild)
+        return None
+    
+    def discard(self, guild_id, channel_id):
+        for channel_ids in self.available.get(guild_id, {}).values():
+            if channel_id in channel_ids:
+                channel_ids.remove(channel_id)
+    
+    def schedule_refill(self, guild):
+        if not self.enabled:
+            return
+        task = self.refills.get(guild.id)
+        if task is None or task.done():
+            self.refills[guild.id] = asyncio.create_task(self.refill(guild))
+    
+    async def refill(self, guild):
+        try:
+            category = await ticket_guild_cache.get_category(guild)
+            slots = self._slots(guild.id)
+            for ticket_type in self.ticket_types:
+                while len(slots[ticket_type]) < self.size:
+                    overwrites = dict(ticket_guild_cache.resolve(guild).overwrites)
+                    channel = await rest(f"guild:{guild.id}", PRIORITY_COSMETIC, lambda: guild.create_text_channel(
+                        name=f"свободный-тикет-{ticket_type}",
+                        overwrites=overwrites,
+                        category=category,
+                        topic=f"{POOL_TOPIC_PREFIX}{ticket_type}"
+                    ))
+                    await post_ticket_bootstrap(channel, ticket_type, priority=PRIORITY_COSMETIC)
+                    slots[ticket_type].append(channel.id)
+            logger.info("Пул тикетов сервера %s пополнен", guild.name)
+        except Exception as e:
+            # Пополнение повторится при следующей выдаче тикета
+            logger.error("Ошибка при пополнении пула тикетов: %s", e)
+
+ticket_pool = TicketChannelPool(TICKET_POOL_SIZE, TICKET_TYPES)
 
 # Создание приватного канала для тикета
 async def create_ticket_channel(interaction: discord.Interaction, ticket_type):
@@ -356,94 +2210,356 @@ async def create_ticket_channel(interaction: discord.Interaction, ticket_type):
     guild = interaction.guild
     
     if not guild:
-        await interaction.followup.send("Ошибка: не удалось получить информацию о сервере", ephemeral=True)
+        await followup(interaction, "Ошибка: не удалось получить информацию о сервере", ephemeral=True)
+        return
+    
+    # Повторное нажатие возвращает уже открытый тикет без запросов к API
+    # Индекс разделен по серверам: найденный канал принадлежит этому серверу, и если его нет в кэше
+    # сервера, значит он удален
+    key = (guild.id, user.id, ticket_type)
+    existing_id = open_tickets.get(guild.id, user.id, ticket_type)
+    if existing_id is not None:
+        existing = guild.get_channel(existing_id)
+        if existing is not None:
+            await followup(interaction, f"У вас уже есть открытый тикет: {existing.mention}", ephemeral=True)
+            return
+        open_tickets.remove(existing_id)
+    
+    if key in open_tickets.creating:
+        await followup(interaction, "Ваш тикет уже создается, подождите несколько секунд.", ephemeral=True)
+        return
+    if open_tickets.count_for(guild.id, user.id) >= MAX_TICKETS_PER_USER:
+        await followup(interaction, f"У вас уже открыто максимальное количество тикетов ({MAX_TICKETS_PER_USER}). Дождитесь закрытия существующих.", ephemeral=True)
+        return
+    if len(open_tickets.by_channel) >= MAX_OPEN_TICKETS:
+        await followup(interaction, "Сейчас открыто слишком много тикетов. Пожалуйста, попробуйте позже.", ephemeral=True)
         return
     
     # Определение названия канала
     channel_name = f"тикет-{ticket_type}-{user.name}"
-    logger.info(f"Создание тикета {channel_name} для пользователя {user.name}")
+    logger.info("Создание тикета %s для пользователя %s", channel_name, user.name, extra={"event": "ticket_create", "user_id": user.id, "ticket_type": ticket_type})
     
+    open_tickets.creating.add(key)
     try:
-        # Получение роли администратора
-        admin_roles = [role for role in guild.roles if role.permissions.administrator]
+        # Права доступа из готового шаблона сервера и категория "Тикеты" (создается при необходимости)
+        ticket = TICKET_TYPES[ticket_type]
+        overwrites = ticket_guild_cache.overwrites_for(guild, user, ticket.user_overwrite())
         
-        # Создание прав доступа (overwrites)
-        overwrites = {
-            guild.default_role: discord.PermissionOverwrite(read_messages=False, send_messages=False),
-            user: discord.PermissionOverwrite(read_messages=True, send_messages=True)
-        }
-        
-        # Добавление прав для админов
-        for role in admin_roles:
-            overwrites[role] = discord.PermissionOverwrite(read_messages=True, send_messages=True)
-        
-        # Создание категории "Тикеты" если её нет
-        ticket_category = None
-        for category in guild.categories:
-            if category.name == "Тикеты":
-                ticket_category = category
-                break
+        # Режим пула: занимаем готовый канал одним запросом (название, права и тема)
+        pooled_channel = ticket_pool.take(guild, ticket_type)
+        if pooled_channel is not None:
+            await rest(f"channel:{pooled_channel.id}", PRIORITY_INTERACTION, lambda: pooled_channel.edit(
+                name=channel_name,
+                overwrites=overwrites,
+                topic=ticket_topic(ticket_type, user.id)
+            ))
+            open_tickets.add(pooled_channel.id, guild.id, user.id, ticket_type)
+            ticket_pool.schedule_refill(guild)
+            
+            await followup(interaction, f"Тикет создан! Перейдите в канал {pooled_channel.mention}", ephemeral=True)
+            logger.info("Тикет %s выдан из пула", channel_name, extra={"event": "ticket_opened", "ticket_id": pooled_channel.id, "user_id": user.id, "ticket_type": ticket_type, "pooled": True})
+            
+            # Шаблон уже в канале, остается упомянуть пользователя
+            try:
+                await send_to(pooled_channel, ticket_mention(ticket, user))
+            except Exception as e:
+                logger.error("Ошибка при упоминании пользователя в тикете из пула: %s", e)
+            return
         
-        if not ticket_category:
-            ticket_category = await guild.create_category("Тикеты")
+        ticket_category = await ticket_guild_cache.get_category(guild)
         
         # Создание текстового канала
-        ticket_channel = await guild.create_text_channel(
+        ticket_channel = await rest(f"guild:{guild.id}", PRIORITY_INTERACTION, lambda: guild.create_text_channel(
             name=channel_name,
             overwrites=overwrites,
-            category=ticket_category
-        )
+            category=ticket_category,
+            topic=ticket_topic(ticket_type, user.id)
+        ))
+        open_tickets.add(ticket_channel.id, guild.id, user.id, ticket_type)
         
-        # Отправка сообщения в новый канал с шаблоном жалобы
-        if ticket_type == "player":
-            template = """**Жалоба на игрока**
-
-Пожалуйста, заполните следующую информацию:
-
-**Ник игрока:** 
-**Ваш ник:** 
-**Правило, которое нарушил:** 
-**Описание ситуации:** 
-**Демонстрация (скриншоты/видео):** 
-
-После заполнения жалобы, ожидайте ответа администрации."""
+        # Отправка шаблона жалобы и кнопки закрытия одним сообщением
+        await post_ticket_bootstrap(ticket_channel, ticket_type, user, priority=PRIORITY_INTERACTION)
         
-        elif ticket_type == "bug":
-            template = """**Жалоба о баге**
-
-Пожалуйста, заполните следующую информацию:
+        # Ответ пользователю
+        await followup(interaction, f"Тикет создан! Перейдите в канал {ticket_channel.mention}", ephemeral=True)
+        logger.info("Тикет %s успешно создан", channel_name, extra={"event": "ticket_opened", "ticket_id": ticket_channel.id, "user_id": user.id, "ticket_type": ticket_type, "pooled": False})
+        
+    except Exception as e:
+        logger.error("Ошибка при создании тикета: %s", e, extra={"event": "ticket_create_failed", "user_id": user.id, "ticket_type": ticket_type})
+        await followup(interaction, f"Произошла ошибка при создании тикета: {e}", ephemeral=True)
+    finally:
+        open_tickets.creating.discard(key)
 
-**Ваш ник:** 
-**Описание проблемы/бага:** 
-**Демонстрация (скриншоты/видео):** 
+# Индекс расшифровок тикетов в SQLite: поиск по пользователю и типу без перебора файлов
+class TranscriptIndex:
+    def __init__(self, path):
+        self.path = path
+        self.db = None
+    
+    def open(self):
+        self.db = sqlite3.connect(self.path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS transcripts ("
+            "channel_id INTEGER PRIMARY KEY, "
+            "guild_id INTEGER NOT NULL, "
+            "user_id INTEGER, "
+            "ticket_type TEXT, "
+            "channel_name TEXT NOT NULL, "
+            "closed_by INTEGER NOT NULL, "
+            "closed_at REAL NOT NULL, "
+            "message_count INTEGER NOT NULL, "
+            "path TEXT NOT NULL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS transcripts_user ON transcripts (user_id, closed_at)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS transcripts_type ON transcripts (ticket_type, closed_at)")
+        self.db.commit()
+    
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+    
+    def add(self, channel_id, guild_id, user_id, ticket_type, channel_name, closed_by, message_count, path):
+        self.db.execute(
+            "INSERT OR REPLACE INTO transcripts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (channel_id, guild_id, user_id, ticket_type, channel_name, closed_by, time.time(), message_count, path)
+        )
+        self.db.commit()
+    
+    def search(self, guild_id, user_id=None, ticket_type=None, limit=10):
+        query = "SELECT channel_id, user_id, ticket_type, channel_name, closed_by, closed_at, message_count FROM transcripts WHERE guild_id = ?"
+        params = [guild_id]
+        if user_id is not None:
+            query += " AND user_id = ?"
+            params.append(user_id)
+        if ticket_type is not None:
+            query += " AND ticket_type = ?"
+            params.append(ticket_type)
+        query += " ORDER BY closed_at DESC LIMIT ?"
+        params.append(limit)
+        return self.db.execute(query, params).fetchall()
+    
+    def path_for(self, guild_id, channel_id):
+        row = self.db.execute("SELECT path FROM transcripts WHERE guild_id = ? AND channel_id = ?", (guild_id, channel_id)).fetchone()
+        return row[0] if row else None
 
-После заполнения жалобы, ожидайте ответа администрации."""
-        
-        else:  # issue
-            template = """**Жалоба о проблеме**
+transcript_index = TranscriptIndex(DB_PATH)
 
-Пожалуйста, заполните следующую информацию:
+# История заявок в SQLite: поля формы и ответы из ЛС, решение, модератор и время.
+# Индексы по пользователю, нику (без учета регистра) и статусу в пределах сервера, поэтому поиск не просматривает таблицу целиком
+class ApplicationHistory:
+    SEARCH_COLUMNS = ("message_id", "channel_id", "user_id", "nickname", "age", "status", "created_at", "moderator_id", "decided_at")
+    EXPORT_COLUMNS = ("message_id", "guild_id", "channel_id", "user_id", "nickname", "age", "status", "submitted_at", "created_at", "moderator_id", "decided_at", "fields")
+    
+    def __init__(self, path):
+        self.path = path
+        self.db = None
+    
+    def open(self):
+        self.db = sqlite3.connect(self.path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS application_history ("
+            "message_id INTEGER PRIMARY KEY, "
+            "guild_id INTEGER, "
+            "channel_id INTEGER NOT NULL, "
+            "user_id INTEGER NOT NULL, "
+            "nickname TEXT NOT NULL, "
+            "nickname_key TEXT NOT NULL, "
+            "age TEXT, "
+            "status TEXT NOT NULL, "
+            "submitted_at REAL, "
+            "created_at REAL NOT NULL, "
+            "moderator_id INTEGER, "
+            "decided_at REAL, "
+            "fields TEXT)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS application_history_user ON application_history (guild_id, user_id, created_at)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS application_history_nickname ON application_history (guild_id, nickname_key, created_at)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS application_history_status ON application_history (guild_id, status, created_at)")
+        self.db.commit()
+    
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+    
+    # История - вспомогательные данные: ошибка записи не прерывает обработку заявки
+    def add(self, message_id, channel_id, guild_id, user_id, nickname, age, fields, submitted_at):
+        try:
+            self.db.execute(
+                "INSERT OR REPLACE INTO application_history "
+                "(message_id, guild_id, channel_id, user_id, nickname, nickname_key, age, status, submitted_at, created_at, fields) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, 'pending', ?, ?, ?)",
+                (message_id, guild_id, channel_id, user_id, nickname, ApplicantIndex.nickname_key(nickname), age, submitted_at, time.time(), json.dumps(fields, ensure_ascii=False))
+            )
+            self.db.commit()
+        except Exception as e:
+            logger.error("Ошибка записи заявки %s в историю: %s", message_id, e)
+    
+    def decide(self, message_id, record, guild_id, status, moderator_id):
+        # Заявки, поданные до появления истории, добавляются при первом решении - без полей формы
+        try:
+            self.db.execute(
+                "INSERT INTO application_history "
+                "(message_id, guild_id, channel_id, user_id, nickname, nickname_key, age, status, created_at, moderator_id, decided_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (message_id) DO UPDATE SET status = excluded.status, moderator_id = excluded.moderator_id, decided_at = excluded.decided_at",
+                (message_id, guild_id, record["channel_id"], record["applicant_id"], record["nickname"], ApplicantIndex.nickname_key(record["nickname"]),
+                 record["age"], status, record["created_at"], moderator_id, time.time())
+            )
+            self.db.commit()
+        except Exception as e:
+            logger.error("Ошибка записи решения по заявке %s в историю: %s", message_id, e)
+    
+    @staticmethod
+    def where(guild_id, user_id=None, nickname=None, status=None):
+        clause = "guild_id = ?"
+        params = [guild_id]
+        if user_id is not None:
+            clause += " AND user_id = ?"
+            params.append(user_id)
+        if nickname:
+            # Поиск по началу ника: диапазон по индексу вместо LIKE
+            key = ApplicantIndex.nickname_key(nickname)
+            clause += " AND nickname_key >= ? AND nickname_key < ?"
+            params.extend([key, key + "\U0010ffff"])
+        if status is not None:
+            clause += " AND status = ?"
+            params.append(status)
+        return clause, params
+    
+    # Страница результатов от новых к старым. before - курсор (created_at, message_id) последней строки
+    # предыдущей страницы: выборка начинается сразу с нужного места индекса, без OFFSET
+    def search(self, guild_id, user_id=None, nickname=None, status=None, before=None, limit=10):
+        clause, params = self.where(guild_id, user_id, nickname, status)
+        if before is not None:
+            clause += " AND (created_at, message_id) < (?, ?)"
+            params.extend(before)
+        query = f"SELECT {', '.join(self.SEARCH_COLUMNS)} FROM application_history WHERE {clause} ORDER BY created_at DESC, message_id DESC LIMIT ?"
+        params.append(limit + 1)
+        rows = self.db.execute(query, params).fetchall()
+        return rows[:limit], len(rows) > limit
+    
+    # Выгрузка в CSV или JSONL со сжатием gzip. Выполняется в отдельном потоке со своим соединением;
+    # строки читаются курсором и сразу пишутся в файл, таблица целиком в память не загружается
+    def export(self, out, fmt, guild_id, user_id=None, nickname=None, status=None):
+        clause, params = self.where(guild_id, user_id, nickname, status)
+        query = f"SELECT {', '.join(self.EXPORT_COLUMNS)} FROM application_history WHERE {clause} ORDER BY created_at, message_id"
+        db = sqlite3.connect(self.path)
+        count = 0
+        try:
+            with gzip.GzipFile(fileobj=out, mode="wb") as compressed:
+                text = io.TextIOWrapper(compressed, encoding="utf-8", newline="")
+                writer = csv.writer(text) if fmt == "csv" else None
+                if writer is not None:
+                    writer.writerow(self.EXPORT_COLUMNS)
+                for row in db.execute(query, params):
+                    row = dict(zip(self.EXPORT_COLUMNS, row))
+                    for key in ("submitted_at", "created_at", "decided_at"):
+                        if row[key] is not None:
+                            row[key] = datetime.fromtimestamp(row[key], tz=timezone.utc).isoformat()
+                    if writer is not None:
+                        writer.writerow(row.values())
+                    else:
+                        row["fields"] = json.loads(row["fields"]) if row["fields"] else None
+                        text.write(json.dumps(row, ensure_ascii=False) + "\n")
+                    count += 1
+                text.flush()
+                text.detach()
+        finally:
+            db.close()
+        return count
 
-**Ваш ник:** 
-**Описание проблемы:** 
+application_history = ApplicationHistory(DB_PATH)
 
-После заполнения жалобы, ожидайте ответа администрации."""
-        
-        # Отправка сообщения с шаблоном
-        await ticket_channel.send(f"{user.mention}, ваш тикет создан! Пожалуйста, заполните информацию ниже:")
-        await ticket_channel.send(template)
+# Фоновая выгрузка истории закрываемых тикетов в JSONL + gzip и удаление канала после выгрузки
+class TranscriptExporter:
+    def __init__(self, directory):
+        self.directory = directory
+        self.queue = asyncio.Queue()
+        # Каналы в очереди или в процессе выгрузки: повторное закрытие того же тикета игнорируется
+        self.pending = set()
+        self.task = None
+    
+    def start(self):
+        if self.task is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self.task = asyncio.create_task(self.run())
+    
+    # Возвращает False, если тикет уже закрывается
+    def enqueue(self, channel, closed_by):
+        if channel.id in self.pending:
+            return False
+        self.pending.add(channel.id)
+        self.queue.put_nowait((channel, closed_by))
+        return True
+    
+    async def run(self):
+        while True:
+            channel, closed_by = await self.queue.get()
+            try:
+                await self.archive(channel, closed_by)
+            except Exception as e:
+                logger.error("Ошибка при архивации тикета %s: %s", channel.name, e, extra={"event": "ticket_archive_failed", "ticket_id": channel.id})
+                try:
+                    await send_to(channel, f"Ошибка при закрытии тикета: {e}")
+                except Exception:
+                    pass
+            finally:
+                self.pending.discard(channel.id)
+                self.queue.task_done()
+    
+    async def archive(self, channel, closed_by):
+        path = os.path.join(self.directory, f"{channel.id}.jsonl.gz")
+        temp_path = path + ".tmp"
+        count = 0
         
-        # Кнопка для закрытия тикета
-        close_view = CloseTicketView()
-        await ticket_channel.send("Когда вопрос будет решен, тикет можно закрыть:", view=close_view)
+        # История читается постранично (по 100 сообщений за запрос) и сразу пишется во временный файл.
+        # Готовая расшифровка заменяется только после чтения всей истории, поэтому сбой ее не затрет
+        try:
+            with gzip.open(temp_path, "wt", encoding="utf-8") as f:
+                async for message in channel.history(limit=None, oldest_first=True):
+                    record = {
+                        "id": message.id,
+                        "author_id": message.author.id,
+                        "author": message.author.name,
+                        "created_at": message.created_at.isoformat(),
+                        "content": message.content,
+                        "attachments": [attachment.url for attachment in message.attachments],
+                        "embeds": [embed.to_dict() for embed in message.embeds],
+                    }
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    count += 1
+            os.replace(temp_path, path)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
         
-        # Ответ пользователю
-        await interaction.followup.send(f"Тикет создан! Перейдите в канал {ticket_channel.mention}", ephemeral=True)
-        logger.info(f"Тикет {channel_name} успешно создан")
+        # Автор и тип тикета из индекса открытых тикетов или из темы канала
+        ticket = open_tickets.by_channel.get(channel.id)
+        parsed = parse_ticket_topic(channel.topic)
+        if ticket is not None:
+            user_id, ticket_type = ticket["user_id"], ticket["type"]
+        elif parsed is not None:
+            ticket_type, user_id = parsed
+        else:
+            user_id = ticket_type = None
+        transcript_index.add(channel.id, channel.guild.id, user_id, ticket_type, channel.name, closed_by.id, count, path)
+        logger.info("Расшифровка тикета %s сохранена: %s сообщений", channel.name, count, extra={"event": "ticket_archived", "ticket_id": channel.id, "user_id": user_id, "messages": count})
         
-    except Exception as e:
-        logger.error(f"Ошибка при создании тикета: {e}")
-        await interaction.followup.send(f"Произошла ошибка при создании тикета: {e}", ephemeral=True)
+        # Удаление канала только после успешной выгрузки
+        await rest(f"channel:{channel.id}", PRIORITY_STAFF, lambda: channel.delete())
+        open_tickets.remove(channel.id)
+        logger.info("Тикет %s успешно закрыт", channel.name, extra={"event": "ticket_closed", "ticket_id": channel.id, "closed_by": closed_by.id})
+
+transcript_exporter = TranscriptExporter(TRANSCRIPT_DIR)
 
 # View с кнопкой для закрытия тикета
 class CloseTicketView(View):
@@ -451,6 +2567,7 @@ class CloseTicketView(View):
         super().__init__(timeout=None)
     
     @discord.ui.button(label="Закрыть тикет", style=discord.ButtonStyle.danger, custom_id="close_ticket")
+    @timed("close_ticket")
     async def close_ticket_button(self, interaction: discord.Interaction, button: Button):
         # Проверка, является ли пользователь администратором
         is_admin = interaction.user.guild_permissions.administrator
@@ -460,119 +2577,163 @@ class CloseTicketView(View):
             await interaction.response.send_message("Только администраторы могут закрывать тикеты.", ephemeral=True)
             return
         
-        await interaction.response.defer()
-        
-        # Отправка сообщения перед закрытием
-        await interaction.channel.send("Тикет закрывается...")
-        logger.info(f"Закрытие тикета {interaction.channel.name} администратором {interaction.user.name}")
-        
-        # Задержка для чтения сообщения
-        await asyncio.sleep(3)
-        
-        # Удаление канала
+        # Отвечаем сразу, сохранение истории и удаление канала выполняются в фоне
+        if not transcript_exporter.enqueue(interaction.channel, interaction.user):
+            await interaction.response.send_message("Тикет уже закрывается.", ephemeral=True)
+            return
+        await interaction.response.send_message("Тикет закрывается, история сохраняется...")
+        logger.info("Закрытие тикета %s администратором %s", interaction.channel.name, interaction.user.name, extra={"event": "ticket_close", "ticket_id": interaction.channel.id, "closed_by": interaction.user.id})
+
+# Сообщения-панели с кнопками сохраняются по ключу, чтобы не искать их в истории канала
+PANEL_NAMESPACE = "panels"
+
+# Ключ панели включает ID сервера: у каждого сервера свои панели
+def panel_key(kind, guild_id):
+    return f"{kind}:{guild_id}"
+
+def remember_panel(key, message):
+    state_store.put(PANEL_NAMESPACE, key, {"channel_id": message.channel.id, "message_id": message.id})
+
+# Поиск панели: сначала по сохраненному ID, просмотр истории - только если ID нет или сообщение удалено
+async def find_panel_message(channel, key):
+    stored = state_store.get(PANEL_NAMESPACE, key)
+    if stored and stored["channel_id"] == channel.id:
         try:
-            await interaction.channel.delete()
-            logger.info(f"Тикет {interaction.channel.name} успешно закрыт")
-        except Exception as e:
-            logger.error(f"Ошибка при удалении канала тикета: {e}")
-            await interaction.channel.send(f"Ошибка при закрытии тикета: {e}")
+            return await channel.fetch_message(stored["message_id"])
+        except discord.NotFound:
+            logger.warning("Сохраненное сообщение панели '%s' не найдено, ищем в истории канала", key)
+            state_store.delete(PANEL_NAMESPACE, key)
+    
+    async for message in channel.history(limit=20):
+        if message.author.id == client.user.id and len(message.components) > 0:
+            remember_panel(key, message)
+            return message
+    return None
+
+# Служебные значения (хэш дерева команд и т.п.)
+META_NAMESPACE = "meta"
+
+# Стабильный хэш дерева слэш-команд: меняется только при изменении самих команд
+def command_tree_hash():
+    payload = sorted((command.to_dict() for command in tree.get_commands()), key=lambda c: c["name"])
+    data = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+# Синхронизация команд выполняется только если хэш отличается от сохраненного
+async def sync_commands():
+    started = time.perf_counter()
+    current_hash = command_tree_hash()
+    stored = state_store.get(META_NAMESPACE, "command_tree") or {}
+    
+    if stored.get("hash") == current_hash:
+        elapsed = time.perf_counter() - started
+        saved = stored.get("sync_seconds", 0)
+        logger.info("Команды не изменились, синхронизация пропущена за %.1f мс (сэкономлено ~%.2f с)", elapsed * 1000, saved)
+        return
+    
+    try:
+        await tree.sync()
+        elapsed = time.perf_counter() - started
+        state_store.put(META_NAMESPACE, "command_tree", {"hash": current_hash, "sync_seconds": elapsed})
+        logger.info("Команды успешно синхронизированы за %.2f с", elapsed)
+    except Exception as e:
+        logger.error("Ошибка при синхронизации команд: %s", e)
+
+# Флаг запуска: on_ready вызывается при каждом переподключении
+panels_restored = False
+
+# Bot ready event
+@client.event
+async def on_ready():
+    global panels_restored
+    logger.info("Бот %s запущен и готов к работе!", client.user)
+    
+    if panels_restored:
+        logger.info("Опросы и панели уже восстановлены в этом процессе, пропускаем")
+        return
+    panels_restored = True
+    
+    # Восстанавливаем индекс открытых тикетов и пул свободных каналов по каналам категории
+    open_tickets.retain_guilds({guild.id for guild in client.guilds})
+    for guild in client.guilds:
+        category = ticket_guild_cache.cached_category(guild)
+        if category is not None:
+            open_tickets.rebuild(guild, category)
+            if ticket_pool.enabled:
+                ticket_pool.rebuild(guild, category)
+        # Пул создается только на серверах с панелью жалоб или своими настройками, а не на всех серверах бота
+        if guild_settings.overridden(guild.id) or guild.get_channel(guild_settings.get(guild.id).report_channel_id) is not None:
+            ticket_pool.schedule_refill(guild)
+    
+    # Продолжаем опросы, прерванные перезапуском, и восстанавливаем панели
+    await interview_dispatcher.resume()
+    await restore_panels()
+    
+    # Списки участников загружаются в фоне, после восстановления панелей
+    member_cache.schedule_chunking(client.guilds)
 
-# Bot ready event
-@client.event
-async def on_ready():
-    logger.info(f'Бот {client.user} запущен и готов к работе!')
+# Восстановление сообщений с кнопками в каналах заявок, жалоб и информации на всех серверах
+async def restore_panels():
+    for guild in client.guilds:
+        await restore_guild_panels(guild)
+
+# Кнопки панелей постоянные (см. setup_hook), поэтому найденные сообщения не редактируются
+async def restore_guild_panels(guild):
+    settings = guild_settings.get(guild.id)
     
-    # Sync commands
-    try:
-        await tree.sync()
-        logger.info("Команды успешно синхронизированы")
-    except Exception as e:
-        logger.error(f"Ошибка при синхронизации команд: {e}")
+    # Сервер без своих настроек, на котором нет каналов по умолчанию, еще не настроен
+    if not guild_settings.overridden(guild.id) and not any(guild.get_channel(getattr(settings, key)) for key in CONFIG_PANEL_KEYS):
+        logger.info("Сервер %s не настроен (/settings), панели не восстанавливаются", guild.name, extra={"event": "guild_not_configured", "guild_id": guild.id})
+        return
     
     # Get the ticket channel
-    ticket_channel = client.get_channel(TICKET_CHANNEL_ID)
+    ticket_channel = guild.get_channel(settings.ticket_channel_id)
     
     if ticket_channel:
-        logger.info(f"Канал для заявок найден: {ticket_channel.name}")
-        # Проверяем, есть ли уже сообщение с кнопкой от этого бота
-        has_message = False
-        try:
-            # Проверяем больше сообщений, чтобы точно найти существующее
-            async for message in ticket_channel.history(limit=20):
-                if message.author.id == client.user.id and len(message.components) > 0:
-                    # Проверяем работоспособности кнопки - если она интерактивная, оставляем
-                    has_message = True
-                    view = TicketView()
-                    message = await message.edit(view=view)
-                    logger.info(f"Обновлено существующее сообщение с кнопкой")
-                    break
-            
-            # Если нет рабочего сообщения с кнопкой, создаем новое
-            if not has_message:
-                # Create an embed for the ticket message
-                embed = discord.Embed(
-                    title="Заявка на сервер",
-                    description="Нажмите на кнопку ниже, чтобы подать заявку на вступление на наш Minecraft сервер!",
-                    color=discord.Color.green()
-                )
-                
-                # Create a view with the ticket button
-                view = TicketView()
-                
+        logger.info("Канал для заявок найден: %s", ticket_channel.name)
+        try:
+            # Проверяем, есть ли уже сообщение с кнопкой от этого бота
+            message = await find_panel_message(ticket_channel, panel_key("ticket", guild.id))
+            if message:
+                logger.info("Найдено существующее сообщение с кнопкой")
+            else:
                 # Send the embed with the view
-                await ticket_channel.send(embed=embed, view=view)
-                logger.info(f"Отправлено новое сообщение с кнопкой в канал {TICKET_CHANNEL_ID}")
+                message = await send_to(ticket_channel, embed=EMBEDS["ticket_panel"], view=TicketView(), priority=PRIORITY_COSMETIC)
+                remember_panel(panel_key("ticket", guild.id), message)
+                logger.info("Отправлено новое сообщение с кнопкой в канал %s", ticket_channel.id)
         except Exception as e:
-            logger.error(f"Ошибка при обновлении сообщения с кнопкой: {e}")
+            logger.error("Ошибка при обновлении сообщения с кнопкой: %s", e)
             # Не создаем новое сообщение при ошибке во избежание дублей
-            logger.info(f"Пропущено создание нового сообщения для предотвращения дублирования")
+            logger.info("Пропущено создание нового сообщения для предотвращения дублирования")
     else:
-        logger.error(f"Error: Ticket channel with ID {TICKET_CHANNEL_ID} not found")
+        logger.error("Error: Ticket channel with ID %s not found", settings.ticket_channel_id)
     
     # Получение канала для жалоб
-    report_channel = client.get_channel(REPORT_CHANNEL_ID)
+    report_channel = guild.get_channel(settings.report_channel_id)
     
     if report_channel:
-        logger.info(f"Канал для жалоб найден: {report_channel.name}")
-        # Проверяем, есть ли уже сообщение с кнопками жалоб от этого бота
-        has_report_message = False
-        try:
-            # Проверяем сообщения в канале
-            async for message in report_channel.history(limit=20):
-                if message.author.id == client.user.id and len(message.components) > 0:
-                    # Проверяем работоспособности кнопок - если они интерактивные, оставляем
-                    has_report_message = True
-                    view = ReportTypeView()
-                    message = await message.edit(view=view)
-                    logger.info(f"Обновлено существующее сообщение с кнопками для жалоб")
-                    break
-            
-            # Если нет рабочего сообщения с кнопками, создаем новое
-            if not has_report_message:
-                # Create an embed for the report message
-                embed = discord.Embed(
-                    title="Система жалоб",
-                    description="Нажмите на одну из кнопок ниже, чтобы создать тикет с жалобой.",
-                    color=discord.Color.red()
-                )
-                
-                # Create a view with the report buttons
-                view = ReportTypeView()
-                
+        logger.info("Канал для жалоб найден: %s", report_channel.name)
+        try:
+            # Проверяем, есть ли уже сообщение с кнопками жалоб от этого бота
+            message = await find_panel_message(report_channel, panel_key("report", guild.id))
+            if message:
+                logger.info("Найдено существующее сообщение с кнопками для жалоб")
+            else:
                 # Send the embed with the view
-                await report_channel.send(embed=embed, view=view)
-                logger.info(f"Отправлено новое сообщение с кнопками жалоб в канал {REPORT_CHANNEL_ID}")
+                message = await send_to(report_channel, embed=EMBEDS["report_panel"], view=ReportTypeView(), priority=PRIORITY_COSMETIC)
+                remember_panel(panel_key("report", guild.id), message)
+                logger.info("Отправлено новое сообщение с кнопками жалоб в канал %s", report_channel.id)
         except Exception as e:
-            logger.error(f"Ошибка при обновлении сообщения с кнопками жалоб: {e}")
-            logger.info(f"Пропущено создание нового сообщения для предотвращения дублирования")
+            logger.error("Ошибка при обновлении сообщения с кнопками жалоб: %s", e)
+            logger.info("Пропущено создание нового сообщения для предотвращения дублирования")
     else:
-        logger.error(f"Error: Report channel with ID {REPORT_CHANNEL_ID} not found")
+        logger.error("Error: Report channel with ID %s not found", settings.report_channel_id)
     
     # Получение информационного канала
-    info_channel = client.get_channel(INFO_CHANNEL_ID)
+    info_channel = guild.get_channel(settings.info_channel_id)
     
     if info_channel:
-        logger.info(f"Информационный канал найден: {info_channel.name}")
+        logger.info("Информационный канал найден: %s", info_channel.name)
         # Отправляем или обновляем информационное сообщение
         success = await send_or_update_info_message(info_channel)
         if success:
@@ -580,9 +2741,70 @@ async def on_ready():
         else:
             logger.error("Ошибка при отправке/обновлении информационного сообщения при запуске бота")
     else:
-        logger.error(f"Error: Info channel with ID {INFO_CHANNEL_ID} not found")
+        logger.error("Error: Info channel with ID %s not found", settings.info_channel_id)
+
+# Ответы на вопросы опроса приходят в ЛС и маршрутизируются диспетчером
+@client.event
+async def on_message(message):
+    if message.author.bot or not isinstance(message.channel, discord.DMChannel):
+        return
+    await interview_dispatcher.handle_message(message)
+
+# Новый сервер: панели появляются сразу, если для него уже есть настройки
+@client.event
+async def on_guild_join(guild):
+    logger.info("Бот добавлен на сервер %s", guild.name, extra={"event": "guild_join", "guild_id": guild.id})
+    await restore_guild_panels(guild)
+
+# Изменения ролей и категорий сбрасывают кэш тикетов сервера
+@client.event
+async def on_guild_role_create(role):
+    if role.permissions.administrator:
+        ticket_guild_cache.invalidate(role.guild.id)
+
+@client.event
+async def on_guild_role_update(before, after):
+    if before.permissions.administrator != after.permissions.administrator:
+        ticket_guild_cache.invalidate(after.guild.id)
+
+@client.event
+async def on_guild_role_delete(role):
+    entry = ticket_guild_cache.entries.get(role.guild.id)
+    if entry is not None and role.id in entry.admin_role_ids:
+        ticket_guild_cache.invalidate(role.guild.id)
+
+@client.event
+async def on_guild_channel_create(channel):
+    if isinstance(channel, discord.CategoryChannel) and channel.name == TICKET_CATEGORY_NAME:
+        ticket_guild_cache.invalidate(channel.guild.id)
+
+@client.event
+async def on_guild_channel_update(before, after):
+    if isinstance(after, discord.CategoryChannel) and TICKET_CATEGORY_NAME in (before.name, after.name):
+        ticket_guild_cache.invalidate(after.guild.id)
+
+@client.event
+async def on_guild_channel_delete(channel):
+    if isinstance(channel, discord.CategoryChannel):
+        ticket_guild_cache.invalidate(channel.guild.id)
+    # Канал тикета удален вручную
+    open_tickets.remove(channel.id)
+    ticket_pool.discard(channel.guild.id, channel.id)
+
+# Участники из LRU обновляются и удаляются по событиям шлюза
+@client.event
+async def on_member_update(before, after):
+    member_cache.update(after)
+
+@client.event
+async def on_raw_member_remove(payload):
+    member_cache.discard(payload.guild_id, payload.user.id)
 
 # Добавляем обработчики для мониторинга соединения
+@client.event
+async def on_shard_ready(shard_id):
+    logger.info("Шард %s готов", shard_id, extra={"event": "shard_ready", "shard_id": shard_id})
+
 @client.event
 async def on_connect():
     logger.info("Бот подключился к Discord")
@@ -597,28 +2819,28 @@ async def on_resumed():
 
 @client.event
 async def on_error(event, *args, **kwargs):
-    logger.error(f"Произошла ошибка в событии {event}: {args}, {kwargs}")
-    import traceback
-    traceback.print_exc()
+    # Обработчик вызывается внутри except: трассировка попадает в журнал вместе с записью
+    logger.exception("Произошла ошибка в событии %s: %s, %s", event, args, kwargs, extra={"event": "event_error"})
 
 @client.event 
 async def on_application_command_error(interaction, error):
-    logger.error(f"Ошибка при выполнении команды: {error}")
-    import traceback
-    traceback.print_exc()
+    logger.error("Ошибка при выполнении команды: %s", error, exc_info=error, extra={"event": "command_error"})
     try:
         await interaction.response.send_message(f"Произошла ошибка: {error}", ephemeral=True)
     except discord.errors.InteractionResponded:
-        await interaction.followup.send(f"Произошла ошибка: {error}", ephemeral=True)
+        await followup(interaction, f"Произошла ошибка: {error}", ephemeral=True)
     except Exception as e:
-        logger.error(f"Не удалось отправить сообщение об ошибке: {e}")
+        logger.error("Не удалось отправить сообщение об ошибке: %s", e)
 
 # Команда для отправки информационного сообщения с кнопками
 @tree.command(name="send_info", description="Отправить информационное сообщение с кнопками")
 @app_commands.default_permissions(administrator=True)
+@app_commands.guild_only()
+@timed("send_info")
 async def send_info(interaction: discord.Interaction):
     # Get the info channel
-    info_channel = client.get_channel(INFO_CHANNEL_ID)
+    settings = guild_settings.get(interaction.guild_id)
+    info_channel = interaction.guild.get_channel(settings.info_channel_id)
     
     if info_channel:
         # Отправляем или обновляем информационное сообщение
@@ -630,301 +2852,926 @@ async def send_info(interaction: discord.Interaction):
             await interaction.response.send_message("Произошла ошибка при отправке/обновлении информационного сообщения.", ephemeral=True)
     else:
         # Respond with an error
-        await interaction.response.send_message(f"Ошибка: канал с ID {INFO_CHANNEL_ID} не найден", ephemeral=True)
+        await interaction.response.send_message(f"Ошибка: канал с ID {settings.info_channel_id} не найден", ephemeral=True)
 
 # Command to send a new ticket message - для заявок на вступление на сервер
 @tree.command(name="send_ticket", description="Отправить сообщение с кнопкой заявки на вступление")
 @app_commands.default_permissions(administrator=True)
+@app_commands.guild_only()
+@timed("send_ticket")
 async def send_ticket(interaction: discord.Interaction):
     # Get the ticket channel
-    ticket_channel = client.get_channel(TICKET_CHANNEL_ID)
+    settings = guild_settings.get(interaction.guild_id)
+    ticket_channel = interaction.guild.get_channel(settings.ticket_channel_id)
     
     if ticket_channel:
-        # Проверяем, есть ли уже сообщение с кнопкой
-        has_message = False
-        try:
-            # Проверяем сообщения в канале
-            async for message in ticket_channel.history(limit=20):
-                if message.author.id == client.user.id and len(message.components) > 0:
-                    # Если нашли сообщение с кнопкой, обновляем его
-                    has_message = True
-                    view = TicketView()
-                    await message.edit(view=view, embed=message.embeds[0] if message.embeds else None)
-                    await interaction.response.send_message("Существующее сообщение с кнопкой обновлено!", ephemeral=True)
-                    break
+        try:
+            # Проверяем, есть ли уже сообщение с кнопкой
+            message = await find_panel_message(ticket_channel, panel_key("ticket", interaction.guild_id))
+            if message:
+                # Если нашли сообщение с кнопкой, обновляем его
+                view = TicketView()
+                await edit_message(message, view=view, embed=message.embeds[0] if message.embeds else None)
+                await interaction.response.send_message("Существующее сообщение с кнопкой обновлено!", ephemeral=True)
             
             # Если сообщение не найдено, создаем новое
-            if not has_message:
-                # Create an embed for the ticket message
-                embed = discord.Embed(
-                    title="Заявка на сервер",
-                    description="Нажмите на кнопку ниже, чтобы подать заявку на вступление на наш Minecraft сервер!",
-                    color=discord.Color.green()
-                )
-                
+            else:
                 # Create a view with the ticket button
                 view = TicketView()
                 
                 # Send the embed with the view
-                await ticket_channel.send(embed=embed, view=view)
+                message = await send_to(ticket_channel, embed=EMBEDS["ticket_panel"], view=view, priority=PRIORITY_COSMETIC)
+                remember_panel(panel_key("ticket", interaction.guild_id), message)
                 await interaction.response.send_message("Новое сообщение с кнопкой заявки отправлено!", ephemeral=True)
             
         except Exception as e:
-            logger.error(f"Ошибка при отправке сообщения с кнопкой: {e}")
+            logger.error("Ошибка при отправке сообщения с кнопкой: %s", e)
             await interaction.response.send_message(f"Произошла ошибка: {e}", ephemeral=True)
     else:
         # Respond with an error
-        await interaction.response.send_message(f"Ошибка: канал с ID {TICKET_CHANNEL_ID} не найден", ephemeral=True)
-
-# Start the bot
-try:
-    client.run(TOKEN, reconnect=True, log_handler=None)
-except discord.errors.LoginFailure:
-    logger.critical("Неправильный токен бота! Пожалуйста, проверьте токен и перезапустите бота.")
-except Exception as e:
-    logger.critical(f"Критическая ошибка при запуске бота: {e}")
-    import traceback
-    traceback.print_exc()
+        await interaction.response.send_message(f"Ошибка: канал с ID {settings.ticket_channel_id} не найден", ephemeral=True)
+
+# Перезагрузка конфигурации без переподключения к шлюзу: новый снимок и зависящие от него эмбеды
+# подменяются вместе, без await между присваиваниями. При ошибке остается прежняя конфигурация
+config_lock = asyncio.Lock()
+
+async def reload_config(source):
+    global config, EMBEDS
+    async with config_lock:
+        new_config = BotConfig.load(CONFIG_PATH)
+        changed = config.changes(new_config)
+        if not changed:
+            # Настройки серверов перечитываются всегда: в общем хранилище их могли изменить другие процессы
+            guild_settings.load()
+            logger.info("Конфигурация перечитана (%s): изменений нет", source, extra={"event": "config_reload", "changed": []})
+            return changed
+        
+        new_embeds = build_embeds(new_config) if "join_address" in changed else EMBEDS
+        config, EMBEDS = new_config, new_embeds
+        # Снимки настроек серверов строятся поверх новой конфигурации
+        guild_settings.load()
+        logger.info("Конфигурация перезагружена (%s): %s", source, ", ".join(changed), extra={"event": "config_reload", "changed": changed})
+        
+        # Панели в новых каналах восстанавливаются так же, как при запуске
+        if client.is_ready() and any(key in changed for key in CONFIG_PANEL_KEYS):
+            await restore_panels()
+        return changed
+
+async def reload_config_on_signal():
+    try:
+        await reload_config("SIGHUP")
+    except ConfigError as e:
+        logger.error("Конфигурация не применена: %s", e, extra={"event": "config_reload_failed"})
+
+@tree.command(name="reload", description="Перечитать конфигурацию бота без перезапуска")
+@app_commands.default_permissions(administrator=True)
+@app_commands.guild_only()
+@timed("reload")
+async def reload_command(interaction: discord.Interaction):
+    await interaction.response.defer(ephemeral=True)
+    try:
+        changed = await reload_config(f"/reload, {interaction.user.name}")
+    except ConfigError as e:
+        logger.error("Конфигурация не применена: %s", e, extra={"event": "config_reload_failed"})
+        await followup(interaction, f"Конфигурация не применена, действует прежняя: {e}", ephemeral=True)
+        return
+    if changed:
+        await followup(interaction, "Конфигурация перезагружена. Изменено: " + ", ".join(changed), ephemeral=True)
+    else:
+        await followup(interaction, "Конфигурация перечитана, изменений нет.", ephemeral=True)
+
+# Настройки бота для отдельного сервера. Изменения сохраняются в хранилище и действуют сразу, без /reload
+settings_group = app_commands.Group(
+    name="settings",
+    description="Настройки бота на этом сервере",
+    default_permissions=discord.Permissions(administrator=True),
+    guild_only=True,
+)
+tree.add_command(settings_group)
+
+SETTINGS_CHANNEL_CHOICES = [app_commands.Choice(name=GUILD_SETTING_LABELS[key], value=key) for key in GUILD_SETTING_KEYS if key.endswith("_channel_id")]
+SETTINGS_TEMPLATE_CHOICES = [app_commands.Choice(name=GUILD_SETTING_LABELS[key], value=key) for key in GUILD_TEMPLATE_DEFAULTS]
+SETTINGS_ALL_CHOICES = [app_commands.Choice(name=label, value=key) for key, label in GUILD_SETTING_LABELS.items()]
+
+def format_guild_setting(key, value):
+    if key == "player_role_id":
+        return f"<@&{value}>"
+    if key in CONFIG_ID_KEYS:
+        return f"<#{value}>"
+    if key == "questions":
+        return "\n".join(f"{i}. **{field_name}**: {question}" for i, (field_name, question) in enumerate(value, 1))
+    if key in GUILD_TEMPLATE_DEFAULTS:
+        return f"```\n{value}\n```"
+    return f"`{value}`"
+
+# Изменение одной настройки: запись в хранилище, затем восстановление панелей, если изменился их канал
+async def apply_guild_setting(interaction, key, value):
+    await interaction.response.defer(ephemeral=True)
+    try:
+        guild_settings.update(interaction.guild_id, key, value)
+    except ConfigError as e:
+        await followup(interaction, f"Настройка не сохранена: {e}", ephemeral=True)
+        return
+    logger.info("%s изменил настройку %s на сервере %s", interaction.user.name, key, interaction.guild.name, extra={"event": "guild_settings_update", "guild_id": interaction.guild_id, "setting": key})
+    if key in CONFIG_PANEL_KEYS:
+        await restore_guild_panels(interaction.guild)
+    await followup(interaction, f"{GUILD_SETTING_LABELS[key]}: сохранено.", ephemeral=True)
+
+@settings_group.command(name="show", description="Показать настройки бота на этом сервере")
+@timed("settings_show")
+async def settings_show(interaction: discord.Interaction):
+    settings = guild_settings.get(interaction.guild_id)
+    overridden = guild_settings.overridden(interaction.guild_id)
+    embed = discord.Embed(
+        title=f"Настройки сервера {interaction.guild.name}",
+        description="Значения «по умолчанию» берутся из общей конфигурации бота.",
+        color=discord.Color.blue()
+    )
+    for key, label in GUILD_SETTING_LABELS.items():
+        name = label if key in overridden else f"{label} (по умолчанию)"
+        inline = key != "questions" and key not in GUILD_TEMPLATE_DEFAULTS
+        embed.add_field(name=name, value=format_guild_setting(key, getattr(settings, key))[:1024], inline=inline)
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+@settings_group.command(name="channel", description="Назначить канал бота на этом сервере")
+@app_commands.describe(kind="Назначение канала", channel="Канал")
+@app_commands.choices(kind=SETTINGS_CHANNEL_CHOICES)
+@timed("settings_channel")
+async def settings_channel(interaction: discord.Interaction, kind: app_commands.Choice[str], channel: discord.TextChannel):
+    await apply_guild_setting(interaction, kind.value, channel.id)
+
+@settings_group.command(name="role", description="Назначить роль, которая выдается после одобрения заявки")
+@app_commands.describe(role="Роль игрока")
+@timed("settings_role")
+async def settings_role(interaction: discord.Interaction, role: discord.Role):
+    await apply_guild_setting(interaction, "player_role_id", role.id)
+
+@settings_group.command(name="questions", description="Задать вопросы, которые бот задает в личных сообщениях")
+@app_commands.describe(questions="Вопросы через |, каждый в виде «Поле: вопрос»")
+@timed("settings_questions")
+async def settings_questions(interaction: discord.Interaction, questions: str):
+    parsed = []
+    for item in questions.split("|"):
+        field_name, separator, question = item.partition(":")
+        if not separator:
+            await interaction.response.send_message(f"Не указано название поля: «{item.strip()[:100]}». Формат: «Поле: вопрос | Поле: вопрос»", ephemeral=True)
+            return
+        parsed.append([field_name, question])
+    await apply_guild_setting(interaction, "questions", parsed)
+
+@settings_group.command(name="template", description="Изменить текст сообщения об одобрении или отклонении заявки")
+@app_commands.describe(kind="Сообщение", text="Текст; \\n - перенос строки, подстановки: {server_ip}, {nickname}, {guild}")
+@app_commands.choices(kind=SETTINGS_TEMPLATE_CHOICES)
+@timed("settings_template")
+async def settings_template(interaction: discord.Interaction, kind: app_commands.Choice[str], text: str):
+    await apply_guild_setting(interaction, kind.value, text.replace("\\n", "\n"))
+
+@settings_group.command(name="server_ip", description="Изменить IP сервера в сообщении об одобрении заявки")
+@app_commands.describe(address="IP или адрес сервера")
+@timed("settings_server_ip")
+async def settings_server_ip(interaction: discord.Interaction, address: str):
+    await apply_guild_setting(interaction, "server_ip", address)
+
+@settings_group.command(name="reset", description="Вернуть значение по умолчанию")
+@app_commands.describe(setting="Настройка (без нее сбрасываются все)")
+@app_commands.choices(setting=SETTINGS_ALL_CHOICES)
+@timed("settings_reset")
+async def settings_reset(interaction: discord.Interaction, setting: Optional[app_commands.Choice[str]] = None):
+    await interaction.response.defer(ephemeral=True)
+    key = setting.value if setting else None
+    guild_settings.reset(interaction.guild_id, key)
+    logger.info("%s сбросил настройку %s на сервере %s", interaction.user.name, key or "все", interaction.guild.name, extra={"event": "guild_settings_reset", "guild_id": interaction.guild_id, "setting": key})
+    if key is None or key in CONFIG_PANEL_KEYS:
+        await restore_guild_panels(interaction.guild)
+    await followup(interaction, f"{setting.name if setting else 'Все настройки'}: восстановлено значение по умолчанию.", ephemeral=True)
+
+# Команды для работы с заявками
+applications_group = app_commands.Group(
+    name="applications",
+    description="Управление заявками на сервер",
+    default_permissions=discord.Permissions(administrator=True),
+    guild_only=True,
+)
+tree.add_command(applications_group)
+
+APPLICATION_STATUS_CHOICES = [
+    app_commands.Choice(name="Ожидают решения", value="pending"),
+    app_commands.Choice(name="Принятые", value="accepted"),
+    app_commands.Choice(name="Отклоненные", value="rejected"),
+]
+APPLICATION_STATUS_LABELS = {"pending": "на рассмотрении", "accepted": "принята", "rejected": "отклонена"}
+
+BULK_WORKERS = 3  # Параллельных обработчиков при массовом решении
+BULK_PROGRESS_INTERVAL = 2.0  # Минимальный интервал между обновлениями сообщения о прогрессе (секунды)
+BULK_MAX_APPLICATIONS = 200
+
+# Очередь массовой обработки заявок: несколько обработчиков; паузы по 429 выдерживают discord.py и планировщик запросов
+async def process_bulk_decision(interaction, decision, targets):
+    handler = approve_application if decision == "accept" else reject_application
+    queue = asyncio.Queue()
+    for target in targets:
+        queue.put_nowait(target)
+    
+    total = len(targets)
+    processed = 0
+    errors = []
+    last_update = 0.0
+    
+    async def report_progress(final=False):
+        nonlocal last_update
+        now = time.monotonic()
+        if not final and now - last_update < BULK_PROGRESS_INTERVAL:
+            return
+        last_update = now
+        status = "Готово" if final else "Обработка"
+        content = f"{status}: {processed}/{total}, ошибок: {len(errors)}"
+        if final and errors:
+            content += "\n" + "\n".join(f"• {error}" for error in errors[:15])
+            if len(errors) > 15:
+                content += f"\n…и еще {len(errors) - 15}"
+        try:
+            await rest(f"interaction:{interaction.id}", PRIORITY_COSMETIC, lambda: interaction.edit_original_response(content=content))
+        except Exception as e:
+            logger.error("Ошибка при обновлении прогресса массовой обработки: %s", e)
+    
+    async def worker():
+        nonlocal processed
+        while True:
+            try:
+                message_id, record = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                _, failures = await handler(interaction.guild, message_id, interaction.user)
+                errors.extend(f"{record['nickname']}: {failure}" for failure in failures)
+            except Exception as e:
+                errors.append(f"{record['nickname']}: {e}")
+            processed += 1
+            await report_progress()
+    
+    await asyncio.gather(*(worker() for _ in range(BULK_WORKERS)))
+    await report_progress(final=True)
+    logger.info("Массовая обработка заявок завершена: %s/%s, ошибок: %s", processed, total, len(errors), extra={"event": "bulk_done", "decision": decision, "processed": processed, "errors": len(errors)})
+
+@applications_group.command(name="bulk", description="Массово принять или отклонить заявки на рассмотрении")
+@app_commands.describe(
+    decision="Решение по выбранным заявкам",
+    older_than_hours="Только заявки старше указанного количества часов",
+    since="Только заявки, поданные начиная с даты (ГГГГ-ММ-ДД)",
+    limit=f"Максимальное количество заявок (не более {BULK_MAX_APPLICATIONS})",
+)
+@app_commands.choices(
+    decision=[
+        app_commands.Choice(name="Принять", value="accept"),
+        app_commands.Choice(name="Отклонить", value="reject"),
+    ],
+)
+@timed("applications_bulk")
+async def applications_bulk(
+    interaction: discord.Interaction,
+    decision: app_commands.Choice[str],
+    older_than_hours: Optional[app_commands.Range[int, 0]] = None,
+    since: Optional[str] = None,
+    limit: app_commands.Range[int, 1, BULK_MAX_APPLICATIONS] = 50,
+):
+    created_after = None
+    if since:
+        try:
+            created_after = datetime.strptime(since, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp()
+        except ValueError:
+            await interaction.response.send_message("Неверный формат даты. Используйте ГГГГ-ММ-ДД.", ephemeral=True)
+            return
+    created_before = time.time() - older_than_hours * 3600 if older_than_hours is not None else None
+    
+    # Решение принимается только по заявкам на рассмотрении: принятые и отклоненные не пересматриваются
+    targets = application_store.select("pending", created_after, created_before, guild=interaction.guild)[:limit]
+    if not targets:
+        await interaction.response.send_message("Заявки по заданным условиям не найдены.", ephemeral=True)
+        return
+    
+    await interaction.response.send_message(f"{decision.name}: найдено заявок {len(targets)}, начинаю обработку...", ephemeral=True)
+    logger.info("%s запустил массовую обработку заявок (%s): %s", interaction.user.name, decision.value, len(targets))
+    await process_bulk_decision(interaction, decision.value, targets)
+
+HISTORY_PAGE_SIZE = 10
+HISTORY_NICKNAME_LENGTH = 32  # Ник и возраст в строке истории обрезаются: описание эмбеда не длиннее 4096 символов
+HISTORY_AGE_LENGTH = 16
+EMBED_DESCRIPTION_LIMIT = 4096
+
+def clip(text, limit):
+    text = str(text)
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+# Страница истории заявок: одна строка на заявку со ссылкой на сообщение в канале администрации
+def history_page_embed(guild_id, rows, page):
+    embed = discord.Embed(title="История заявок", color=discord.Color.blue())
+    if not rows:
+        embed.description = "Заявки не найдены."
+        return embed
+    lines = []
+    for message_id, channel_id, user_id, nickname, age, status, created_at, moderator_id, decided_at in rows:
+        created = discord.utils.format_dt(datetime.fromtimestamp(created_at, tz=timezone.utc), "d")
+        nickname = discord.utils.escape_markdown(clip(nickname, HISTORY_NICKNAME_LENGTH))
+        age = discord.utils.escape_markdown(clip(age, HISTORY_AGE_LENGTH))
+        line = f"{created} [**{nickname}**](https://discord.com/channels/{guild_id}/{channel_id}/{message_id}) <@{user_id}>, возраст {age} — {APPLICATION_STATUS_LABELS.get(status, status)}"
+        if moderator_id:
+            line += f" (<@{moderator_id}>)"
+        lines.append(line)
+    embed.description = clip("\n".join(lines), EMBED_DESCRIPTION_LIMIT)
+    embed.set_footer(text=f"Страница {page}")
+    return embed
+
+# Листание результатов: курсоры начала открытых страниц, каждая страница - один запрос по индексу
+class ApplicationSearchView(View):
+    def __init__(self, guild_id, filters):
+        super().__init__(timeout=600)
+        self.guild_id = guild_id
+        self.filters = filters
+        self.cursors = [None]
+        self.next_cursor = None
+    
+    def render(self):
+        rows, more = application_history.search(self.guild_id, before=self.cursors[-1], limit=HISTORY_PAGE_SIZE, **self.filters)
+        # Курсор следующей страницы - (created_at, message_id) последней строки
+        self.next_cursor = (rows[-1][6], rows[-1][0]) if more else None
+        self.previous_button.disabled = len(self.cursors) == 1
+        self.next_button.disabled = self.next_cursor is None
+        return history_page_embed(self.guild_id, rows, len(self.cursors))
+    
+    @discord.ui.button(label="◀ Назад", style=discord.ButtonStyle.secondary)
+    @timed("applications_search_page")
+    async def previous_button(self, interaction: discord.Interaction, button: Button):
+        self.cursors.pop()
+        await interaction.response.edit_message(embed=self.render(), view=self)
+    
+    @discord.ui.button(label="Далее ▶", style=discord.ButtonStyle.secondary)
+    @timed("applications_search_page")
+    async def next_button(self, interaction: discord.Interaction, button: Button):
+        self.cursors.append(self.next_cursor)
+        await interaction.response.edit_message(embed=self.render(), view=self)
+
+@applications_group.command(name="search", description="Найти заявки в истории по пользователю, нику и статусу")
+@app_commands.describe(user="Автор заявки", nickname="Ник в Minecraft (или его начало)", status="Статус заявки")
+@app_commands.choices(status=APPLICATION_STATUS_CHOICES)
+@timed("applications_search")
+async def applications_search(
+    interaction: discord.Interaction,
+    user: Optional[discord.User] = None,
+    nickname: Optional[str] = None,
+    status: Optional[app_commands.Choice[str]] = None,
+):
+    filters = {"user_id": user.id if user else None, "nickname": nickname, "status": status.value if status else None}
+    view = ApplicationSearchView(interaction.guild_id, filters)
+    await interaction.response.send_message(embed=view.render(), view=view, ephemeral=True)
+
+@applications_group.command(name="export", description="Выгрузить историю заявок в CSV или JSONL")
+@app_commands.describe(format="Формат файла", user="Автор заявки", nickname="Ник в Minecraft (или его начало)", status="Статус заявки")
+@app_commands.choices(
+    format=[
+        app_commands.Choice(name="CSV", value="csv"),
+        app_commands.Choice(name="JSONL", value="jsonl"),
+    ],
+    status=APPLICATION_STATUS_CHOICES,
+)
+@timed("applications_export")
+async def applications_export(
+    interaction: discord.Interaction,
+    format: app_commands.Choice[str],
+    user: Optional[discord.User] = None,
+    nickname: Optional[str] = None,
+    status: Optional[app_commands.Choice[str]] = None,
+):
+    await interaction.response.defer(ephemeral=True)
+    # Файл выгрузки создается на диске, а не в памяти
+    with tempfile.TemporaryFile() as out:
+        count = await asyncio.to_thread(
+            application_history.export, out, format.value, interaction.guild_id,
+            user.id if user else None, nickname, status.value if status else None,
+        )
+        out.seek(0)
+        logger.info("%s выгрузил историю заявок (%s): %s", interaction.user.name, format.value, count, extra={"event": "applications_export", "format": format.value, "count": count})
+        await followup(interaction, f"Выгружено заявок: {count}", file=discord.File(out, filename=f"applications.{format.value}.gz"), ephemeral=True)
+
+# Поиск расшифровок закрытых тикетов
+transcripts_group = app_commands.Group(
+    name="transcripts",
+    description="Архив закрытых тикетов",
+    default_permissions=discord.Permissions(administrator=True),
+    guild_only=True,
+)
+tree.add_command(transcripts_group)
+
+TICKET_TYPE_CHOICES = [app_commands.Choice(name=ticket.label, value=ticket.key) for ticket in TICKET_TYPES.values()]
+
+@transcripts_group.command(name="search", description="Найти расшифровки тикетов по пользователю и типу")
+@app_commands.describe(user="Автор тикета", ticket_type="Тип тикета", limit="Количество результатов")
+@app_commands.choices(ticket_type=TICKET_TYPE_CHOICES)
+@timed("transcripts_search")
+async def transcripts_search(
+    interaction: discord.Interaction,
+    user: Optional[discord.User] = None,
+    ticket_type: Optional[app_commands.Choice[str]] = None,
+    limit: app_commands.Range[int, 1, 25] = 10,
+):
+    rows = transcript_index.search(interaction.guild_id, user.id if user else None, ticket_type.value if ticket_type else None, limit)
+    if not rows:
+        await interaction.response.send_message("Расшифровки не найдены.", ephemeral=True)
+        return
+    
+    lines = []
+    for channel_id, user_id, row_type, channel_name, closed_by, closed_at, message_count in rows:
+        closed = discord.utils.format_dt(datetime.fromtimestamp(closed_at, tz=timezone.utc), "d")
+        author = f"<@{user_id}>" if user_id else "неизвестно"
+        lines.append(f"`{channel_id}` {channel_name} — {author}, сообщений: {message_count}, закрыл <@{closed_by}> {closed}")
+    await interaction.response.send_message("\n".join(lines) + "\n\nФайл расшифровки: `/transcripts get`", ephemeral=True)
+
+@transcripts_group.command(name="get", description="Получить файл расшифровки тикета")
+@app_commands.describe(channel_id="ID канала тикета из результатов поиска")
+@timed("transcripts_get")
+async def transcripts_get(interaction: discord.Interaction, channel_id: str):
+    path = transcript_index.path_for(interaction.guild_id, int(channel_id)) if channel_id.isdigit() else None
+    if path is None or not os.path.exists(path):
+        await interaction.response.send_message("Расшифровка не найдена.", ephemeral=True)
+        return
+    await interaction.response.send_message(file=discord.File(path), ephemeral=True)
+
+# Протокол Server List Ping (Minecraft 1.7+): пакеты с длиной и ID в формате VarInt
+SLP_DEFAULT_PORT = 25565
+SLP_PROTOCOL_VERSION = -1  # Запрос статуса без привязки к версии клиента
+SLP_MAX_PACKET = 1 << 20
+
+class ServerPingError(Exception):
+    pass
+
+def slp_varint(value):
+    value &= 0xFFFFFFFF
+    data = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            data.append(byte | 0x80)
+        else:
+            data.append(byte)
+            return bytes(data)
+
+def slp_string(text):
+    data = text.encode("utf-8")
+    return slp_varint(len(data)) + data
+
+def slp_packet(packet_id, payload=b""):
+    body = slp_varint(packet_id) + payload
+    return slp_varint(len(body)) + body
+
+def slp_decode_varint(data, offset=0):
+    value = 0
+    for shift in range(0, 35, 7):
+        if offset >= len(data):
+            raise ServerPingError("обрезанный VarInt")
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, offset
+    raise ServerPingError("слишком длинный VarInt")
+
+async def slp_read_packet(reader):
+    length = 0
+    for shift in range(0, 35, 7):
+        byte = (await reader.readexactly(1))[0]
+        length |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            break
+    else:
+        raise ServerPingError("слишком длинный VarInt")
+    if not 0 < length <= SLP_MAX_PACKET:
+        raise ServerPingError(f"недопустимая длина пакета: {length}")
+    data = await reader.readexactly(length)
+    packet_id, offset = slp_decode_varint(data)
+    return packet_id, data[offset:]
+
+# Текст из компонента чата Minecraft (строка, объект с text/extra или список) без кодов форматирования §
+def minecraft_text(component):
+    if isinstance(component, str):
+        text = component
+    elif isinstance(component, list):
+        text = "".join(minecraft_text(part) for part in component)
+    elif isinstance(component, dict):
+        extra = component.get("extra")
+        text = str(component.get("text", "")) + "".join(minecraft_text(part) for part in (extra if isinstance(extra, list) else []))
+    else:
+        text = ""
+    parts = text.split("§")
+    return parts[0] + "".join(part[1:] for part in parts[1:])
+
+# Результат успешного опроса
+class ServerStatus:
+    __slots__ = ("players", "max_players", "version", "motd", "latency", "updated")
+    
+    def __init__(self, players, max_players, version, motd, latency):
+        self.players = players
+        self.max_players = max_players
+        self.version = version
+        self.motd = motd
+        self.latency = latency
+        self.updated = time.time()
+
+# Один опрос: рукопожатие, запрос статуса (JSON), затем пинг для измерения задержки
+async def ping_minecraft_server(host, port):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        handshake = slp_varint(SLP_PROTOCOL_VERSION) + slp_string(host) + port.to_bytes(2, "big") + slp_varint(1)
+        writer.write(slp_packet(0x00, handshake) + slp_packet(0x00))
+        await writer.drain()
+        packet_id, payload = await slp_read_packet(reader)
+        if packet_id != 0x00:
+            raise ServerPingError(f"неожиданный пакет {packet_id:#x} вместо статуса")
+        length, offset = slp_decode_varint(payload)
+        try:
+            data = json.loads(payload[offset:offset + length].decode("utf-8"))
+        except ValueError as e:
+            raise ServerPingError(f"некорректный JSON статуса: {e}")
+        
+        # Часть серверов закрывает соединение без ответа на пинг - статус при этом уже получен
+        latency = None
+        token = time.monotonic_ns() & 0x7FFFFFFFFFFFFFFF
+        sent = time.perf_counter()
+        try:
+            writer.write(slp_packet(0x01, token.to_bytes(8, "big")))
+            await writer.drain()
+            packet_id, payload = await slp_read_packet(reader)
+            if packet_id == 0x01:
+                latency = time.perf_counter() - sent
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+    finally:
+        writer.close()
+    
+    return parse_server_status(data, latency)
+
+# Ответ сервера приходит извне: неожиданная структура считается ошибкой опроса, а не падением бота
+def parse_server_status(data, latency):
+    if not isinstance(data, dict):
+        raise ServerPingError("статус сервера не является объектом JSON")
+    players = data.get("players") or {}
+    version = data.get("version") or {}
+    if not isinstance(players, dict) or not isinstance(version, dict):
+        raise ServerPingError("некорректная структура статуса сервера")
+    online = players.get("online", 0)
+    maximum = players.get("max", 0)
+    if type(online) is not int or type(maximum) is not int:
+        raise ServerPingError("некорректное число игроков в статусе сервера")
+    return ServerStatus(online, maximum, minecraft_text(version.get("name", "")), minecraft_text(data.get("description", "")).strip(), latency)
+
+def split_server_address(address):
+    host, separator, port = address.rpartition(":")
+    if separator and port.isdigit():
+        return host, int(port)
+    return address, SLP_DEFAULT_PORT
+
+# Автомат защиты: после threshold неудачных опросов подряд сервер не опрашивается cooldown секунд,
+# затем выполняется одна пробная попытка; ее неудача снова приостанавливает опросы
+class CircuitBreaker:
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+    
+    def allow(self, now):
+        return self.opened_at is None or now - self.opened_at >= self.cooldown
+    
+    def success(self):
+        recovered = self.opened_at is not None
+        self.failures = 0
+        self.opened_at = None
+        return recovered
+    
+    # Возвращает True, если автомат только что разомкнулся
+    def failure(self, now):
+        self.failures += 1
+        if self.failures >= self.threshold:
+            opened = self.opened_at is None
+            self.opened_at = now
+            return opened
+        return False
+
+# Фоновый опрос Minecraft-серверов: адрес из общей конфигурации и адреса, заданные серверам Discord.
+# Последний успешный результат хранится в памяти, кнопка статистики читает только его и не ждет сети
+class ServerStatusPoller:
+    def __init__(self, interval, ttl, timeout, failures, cooldown):
+        self.interval = interval
+        self.ttl = ttl
+        self.timeout = timeout
+        self.failures = failures
+        self.cooldown = cooldown
+        self.results = {}
+        self.breakers = {}
+        self.task = None
+    
+    def start(self):
+        if self.interval > 0 and self.task is None:
+            self.task = asyncio.create_task(self.run())
+    
+    def targets(self):
+        return {config.server_ip} | {settings.server_ip for settings in guild_settings.settings.values()}
+    
+    async def run(self):
+        while True:
+            # Ошибка опроса одного сервера не должна останавливать опрос остальных
+            results = await asyncio.gather(*(self.poll(address) for address in self.targets()), return_exceptions=True)
+            for result in results:
+                if isinstance(result, Exception):
+                    logger.error("Ошибка фонового опроса серверов: %s", result, exc_info=result, extra={"event": "server_status_error"})
+            await asyncio.sleep(self.interval)
+    
+    async def poll(self, address):
+        breaker = self.breakers.get(address)
+        if breaker is None:
+            breaker = self.breakers[address] = CircuitBreaker(self.failures, self.cooldown)
+        if not breaker.allow(time.monotonic()):
+            metrics.inc("bot_server_polls_total", outcome="skipped")
+            return
+        
+        host, port = split_server_address(address)
+        try:
+            status = await asyncio.wait_for(ping_minecraft_server(host, port), self.timeout)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ServerPingError, ValueError) as e:
+            self.fail(breaker, address, e)
+            return
+        except Exception as e:
+            # Непредвиденная ошибка тоже считается неудачным опросом, иначе автомат защиты ее не увидит
+            logger.exception("Непредвиденная ошибка при опросе сервера %s", address, extra={"event": "server_status_error", "address": address})
+            self.fail(breaker, address, e)
+            return
+        
+        metrics.inc("bot_server_polls_total", outcome="ok")
+        if status.latency is not None:
+            metrics.observe("bot_server_ping_seconds", status.latency)
+        self.results[address] = status
+        if breaker.success():
+            logger.info("Сервер %s снова доступен", address, extra={"event": "server_status_up", "address": address})
+    
+    def fail(self, breaker, address, error):
+        metrics.inc("bot_server_polls_total", outcome="error")
+        if breaker.failure(time.monotonic()):
+            logger.warning("Сервер %s не отвечает (%s опросов подряд, последняя ошибка: %s), опрос приостановлен на %s с", address, breaker.failures, str(error) or type(error).__name__, self.cooldown, extra={"event": "server_status_down", "address": address})
+    
+    # (последний успешный результат, свежий ли он, были ли ошибки после него)
+    def snapshot(self, address):
+        status = self.results.get(address)
+        fresh = status is not None and time.time() - status.updated <= self.ttl
+        breaker = self.breakers.get(address)
+        return status, fresh, breaker is not None and breaker.failures > 0
+
+server_status = ServerStatusPoller(SERVER_STATUS_INTERVAL, SERVER_STATUS_TTL, SERVER_STATUS_TIMEOUT, SERVER_STATUS_FAILURES, SERVER_STATUS_COOLDOWN)
+
+# Эмбед статистики: постоянная часть из реестра эмбедов и данные последнего опроса из памяти
+def server_stats_embed(address):
+    status, fresh, failing = server_status.snapshot(address)
+    if fresh:
+        live = [
+            ("🟢 Статус:", "Онлайн"),
+            ("👥 Игроки:", f"{status.players}/{status.max_players}"),
+            ("🔧 Версия:", status.version or "—"),
+            ("📶 Пинг:", f"{round(status.latency * 1000)} мс" if status.latency is not None else "—"),
+        ]
+    elif failing:
+        live = [("🔴 Статус:", "Сервер недоступен")]
+    else:
+        live = [("⚪ Статус:", "Нет данных, попробуйте позже")]
+    # Новый эмбед на каждое нажатие: поля эмбеда из реестра не изменяются
+    base = EMBEDS["server_stats"]
+    embed = discord.Embed(title=base.title, description=base.description, color=base.color)
+    for name, value in live:
+        embed.add_field(name=name, value=value, inline=True)
+    for field in base.fields:
+        embed.add_field(name=field.name, value=field.value, inline=field.inline)
+    if fresh and status.motd:
+        embed.add_field(name="📝 MOTD:", value=discord.utils.escape_markdown(status.motd)[:1024], inline=False)
+    if status is not None:
+        embed.timestamp = datetime.fromtimestamp(status.updated, tz=timezone.utc)
+        embed.set_footer(text="Обновлено" if fresh else "Последний ответ сервера")
+    return embed
+
+# Изображение для информационного сообщения читается с диска один раз
+INFO_IMAGE_NAME = "info.jpg"
+
+def load_info_image():
+    try:
+        with open(INFO_IMAGE_NAME, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        logger.warning("Файл %s не найден, информационное сообщение будет без изображения", INFO_IMAGE_NAME)
+        return None
+
+INFO_IMAGE = load_info_image()
+
+# Реестр готовых эмбедов: строятся при запуске (и при смене адреса сервера в конфигурации) и переиспользуются без изменений.
+# Ключи эмбедов ответов на кнопки совпадают с custom_id кнопок
+def build_embeds(settings):
+    embeds = {}
+    
+    embeds["ticket_panel"] = discord.Embed(
+        title="Заявка на сервер",
+        description="Нажмите на кнопку ниже, чтобы подать заявку на вступление на наш Minecraft сервер!",
+        color=discord.Color.green()
+    )
+    
+    embeds["report_panel"] = discord.Embed(
+        title="Система жалоб",
+        description="Нажмите на одну из кнопок ниже, чтобы создать тикет с жалобой.",
+        color=discord.Color.red()
+    )
+    
+    # Создаем красивый embed для основного сообщения
+    embed = discord.Embed(
+        title="🎮 Добро пожаловать на MineStory!",
+        description="Приватный ванильный сервер для истинных ценителей Minecraft",
+        color=discord.Color.from_rgb(88, 101, 242)  # Discord фиолетовый
+    )
+    embed.add_field(
+        name="🌟 О сервере:",
+        value="MineStory - это уютное место, где можно расслабиться и насладиться классическим выживанием в Minecraft. Здесь царит дружелюбная атмосфера и взаимопомощь!",
+        inline=False
+    )
+    embed.add_field(
+        name="🔧 Технические характеристики:",
+        value="```\n🎯 Версия: 1.21+\n🔌 Плагины: ViaVersion, Plasmovoice\n🌍 Тип: Ванильное выживание\n🛡️ Безопасность: Приватный доступ```",
+        inline=False
+    )
+    embed.add_field(
+        name="🎵 Особенности:",
+        value="• 🎤 Голосовой чат (Plasmovoice)\n• 🔄 Поддержка разных версий\n• 🏠 Уютное сообщество\n• 🛡️ Защищенный мир",
+        inline=True
+    )
+    embed.add_field(
+        name="🚀 Начать играть:",
+        value="Нажмите кнопки ниже, чтобы:\n• Посетить наш сайт\n• Узнать как подключиться\n• Посмотреть статистику\n• Получить помощь",
+        inline=True
+    )
+    embed.set_footer(text="Присоединяйтесь к нашему дружному сообществу! 💙", icon_url="https://cdn.discordapp.com/emojis/123456789.png")
+    if INFO_IMAGE is not None:
+        # Изображение прикреплено к самому сообщению и не загружается повторно при редактировании
+        embed.set_image(url=f"attachment://{INFO_IMAGE_NAME}")
+    else:
+        embed.set_image(url="https://via.placeholder.com/600x200/5865F2/FFFFFF?text=MineStory+Server")  # Можно заменить на реальное изображение
+    embeds["info_panel"] = embed
+    
+    # Создаем красивый embed с инструкцией
+    embed = discord.Embed(
+        title="🎮 Как подключиться к серверу MineStory",
+        description="Следуйте этим простым шагам для подключения:",
+        color=discord.Color.green()
+    )
+    embed.add_field(
+        name="📋 Пошаговая инструкция:",
+        value=f"```\n1️⃣ Запустите Minecraft версии 1.21+\n2️⃣ Перейдите в раздел 'Сетевая игра'\n3️⃣ Нажмите 'Добавить сервер'\n4️⃣ Введите IP: {settings.join_address}\n5️⃣ Нажмите 'Готово' и подключитесь```",
+        inline=False
+    )
+    embed.add_field(name="🌐 IP сервера:", value=f"`{settings.join_address}`", inline=True)
+    embed.add_field(name="🎯 Версия:", value="`1.21+`", inline=True)
+    embed.set_footer(text="Добро пожаловать в MineStory! 🎉")
+    embed.set_thumbnail(url="https://cdn.discordapp.com/attachments/1234567890/minecraft_icon.png")  # Можно заменить на реальную ссылку
+    embeds["how_to_join"] = embed
+    
+    # Создаем embed со статистикой сервера
+    embed = discord.Embed(
+        title="📊 Статистика сервера MineStory",
+        description="Актуальная информация о нашем сервере",
+        color=discord.Color.blue()
+    )
+    embed.add_field(name="🎮 Тип сервера:", value="Ванильный выживание", inline=True)
+    embed.add_field(name="🔌 Плагины:", value="ViaVersion, Plasmovoice", inline=True)
+    embed.add_field(name="🌍 Мир:", value="Приватный мир с уютной атмосферой", inline=False)
+    # Статус, игроки, версия и пинг добавляются из результатов опроса (server_stats_embed)
+    embeds["server_stats"] = embed
+    
+    # Создаем embed с полезной информацией
+    embed = discord.Embed(
+        title="❓ Нужна помощь?",
+        description="Здесь вы найдете ответы на частые вопросы",
+        color=discord.Color.orange()
+    )
+    embed.add_field(name="🎫 Как подать заявку?", value="Найдите канал с заявками и нажмите соответствующую кнопку", inline=False)
+    embed.add_field(name="🛠️ Проблемы с подключением?", value="Убедитесь, что используете версию 1.21+ и правильный IP", inline=False)
+    embed.add_field(name="👥 Нужна поддержка?", value="Обратитесь к администраторам сервера", inline=False)
+    embed.set_footer(text="Мы всегда готовы помочь! 💙")
+    embeds["help_info"] = embed
+    
+    return embeds
+
+EMBEDS = build_embeds(config)
+
 # View с кнопками для информационного канала
 class InfoView(View):
     def __init__(self):
         super().__init__(timeout=None)
-    
-    @discord.ui.button(label="🌐 Официальный сайт", style=discord.ButtonStyle.link, url="https://site20-production.up.railway.app/", emoji="🌐")
-    async def website_button(self, interaction: discord.Interaction, button: Button):
-        # Кнопка с URL автоматически перенаправляет на сайт
-        pass
+        # Кнопка-ссылка не вызывает callback, поэтому добавляется напрямую, а не через декоратор
+        self.add_item(Button(label="🌐 Официальный сайт", style=discord.ButtonStyle.link, url="https://site20-production.up.railway.app/", emoji="🌐"))
     
     @discord.ui.button(label="🎮 Как подключиться", style=discord.ButtonStyle.success, custom_id="how_to_join", emoji="🎮")
+    @timed("how_to_join")
     async def how_to_join_button(self, interaction: discord.Interaction, button: Button):
-        # Создаем красивый embed с инструкцией
-        embed = discord.Embed(
-            title="🎮 Как подключиться к серверу MineStory",
-            description="Следуйте этим простым шагам для подключения:",
-            color=discord.Color.green()
-        )
-        
-        embed.add_field(
-            name="📋 Пошаговая инструкция:",
-            value="```\n1️⃣ Запустите Minecraft версии 1.21+\n2️⃣ Перейдите в раздел 'Сетевая игра'\n3️⃣ Нажмите 'Добавить сервер'\n4️⃣ Введите IP: minestoryvanilla.imba.land\n5️⃣ Нажмите 'Готово' и подключитесь```",
-            inline=False
-        )
-        
-        embed.add_field(
-            name="🌐 IP сервера:",
-            value="`minestoryvanilla.imba.land`",
-            inline=True
-        )
-        
-        embed.add_field(
-            name="🎯 Версия:",
-            value="`1.21+`",
-            inline=True
-        )
-        
-        embed.set_footer(text="Добро пожаловать в MineStory! 🎉")
-        embed.set_thumbnail(url="https://cdn.discordapp.com/attachments/1234567890/minecraft_icon.png")  # Можно заменить на реальную ссылку
-        
-        await interaction.response.send_message(embed=embed, ephemeral=True)
-        logger.info(f"Пользователь {interaction.user.name} нажал на кнопку 'Как подключиться'")
+        await interaction.response.send_message(embed=EMBEDS[button.custom_id], ephemeral=True)
+        logger.info("Пользователь %s нажал на кнопку 'Как подключиться'", interaction.user.name, extra={"event": "info_button", "user_id": interaction.user.id, "button": button.custom_id})
     
     @discord.ui.button(label="📊 Статистика сервера", style=discord.ButtonStyle.secondary, custom_id="server_stats", emoji="📊")
+    @timed("server_stats")
     async def server_stats_button(self, interaction: discord.Interaction, button: Button):
-        # Создаем embed со статистикой сервера
-        embed = discord.Embed(
-            title="📊 Статистика сервера MineStory",
-            description="Актуальная информация о нашем сервере",
-            color=discord.Color.blue()
-        )
-        
-        embed.add_field(
-            name="🎮 Тип сервера:",
-            value="Ванильный выживание",
-            inline=True
-        )
-        
-        embed.add_field(
-            name="🔧 Версия:",
-            value="1.21+",
-            inline=True
-        )
-        
-        embed.add_field(
-            name="🔌 Плагины:",
-            value="ViaVersion, Plasmovoice",
-            inline=True
-        )
-        
-        embed.add_field(
-            name="🌍 Мир:",
-            value="Приватный мир с уютной атмосферой",
-            inline=False
-        )
-        
-        embed.set_footer(text="Обновлено: сегодня")
-        
+        embed = server_stats_embed(guild_settings.get(interaction.guild_id).server_ip)
         await interaction.response.send_message(embed=embed, ephemeral=True)
-        logger.info(f"Пользователь {interaction.user.name} запросил статистику сервера")
+        logger.info("Пользователь %s запросил статистику сервера", interaction.user.name, extra={"event": "info_button", "user_id": interaction.user.id, "button": button.custom_id})
     
     @discord.ui.button(label="❓ Помощь", style=discord.ButtonStyle.secondary, custom_id="help_info", emoji="❓")
+    @timed("help_info")
     async def help_button(self, interaction: discord.Interaction, button: Button):
-        # Создаем embed с полезной информацией
-        embed = discord.Embed(
-            title="❓ Нужна помощь?",
-            description="Здесь вы найдете ответы на частые вопросы",
-            color=discord.Color.orange()
-        )
-        
-        embed.add_field(
-            name="🎫 Как подать заявку?",
-            value="Найдите канал с заявками и нажмите соответствующую кнопку",
-            inline=False
-        )
-        
-        embed.add_field(
-            name="🛠️ Проблемы с подключением?",
-            value="Убедитесь, что используете версию 1.21+ и правильный IP",
-            inline=False
-        )
-        
-        embed.add_field(
-            name="👥 Нужна поддержка?",
-            value="Обратитесь к администраторам сервера",
-            inline=False
-        )
-        
-        embed.set_footer(text="Мы всегда готовы помочь! 💙")
-        
-        await interaction.response.send_message(embed=embed, ephemeral=True)
-        logger.info(f"Пользователь {interaction.user.name} запросил помощь")
+        await interaction.response.send_message(embed=EMBEDS[button.custom_id], ephemeral=True)
+        logger.info("Пользователь %s запросил помощь", interaction.user.name, extra={"event": "info_button", "user_id": interaction.user.id, "button": button.custom_id})
+
+def info_image_file():
+    return discord.File(io.BytesIO(INFO_IMAGE), filename=INFO_IMAGE_NAME)
 
 # Функция для отправки или обновления информационного сообщения
 async def send_or_update_info_message(channel):
     if not channel:
-        logger.error(f"Error: Info channel with ID {INFO_CHANNEL_ID} not found")
+        logger.error("Error: Info channel not found")
         return False
     
-    # Проверяем, есть ли уже сообщение с кнопками
-    has_message = False
     try:
-        # Проверяем сообщения в канале
-        async for message in channel.history(limit=20):
-            if message.author.id == client.user.id and len(message.components) > 0:
-                # Если нашли сообщение с кнопками, обновляем его
-                has_message = True
-                view = InfoView()
-                
-                # Проверяем, есть ли изображение в сообщении
-                has_image = False
-                if message.attachments:
-                    for attachment in message.attachments:
-                        if attachment.filename == "info.jpg":
-                            has_image = True
-                            break
-                
-                # Если нет изображения, добавляем его
-                if not has_image:
-                    with open("info.jpg", "rb") as f:
-                        image = discord.File(f, filename="info.jpg")
-                        new_message = await channel.send(file=image)
-                        await message.delete()
-                        message = new_message
-                
-                # Создаем красивый embed для основного сообщения
-                embed = discord.Embed(
-                    title="🎮 Добро пожаловать на MineStory!",
-                    description="Приватный ванильный сервер для истинных ценителей Minecraft",
-                    color=discord.Color.from_rgb(88, 101, 242)  # Discord фиолетовый
-                )
-                
-                embed.add_field(
-                    name="🌟 О сервере:",
-                    value="MineStory - это уютное место, где можно расслабиться и насладиться классическим выживанием в Minecraft. Здесь царит дружелюбная атмосфера и взаимопомощь!",
-                    inline=False
-                )
-                
-                embed.add_field(
-                    name="🔧 Технические характеристики:",
-                    value="```\n🎯 Версия: 1.21+\n🔌 Плагины: ViaVersion, Plasmovoice\n🌍 Тип: Ванильное выживание\n🛡️ Безопасность: Приватный доступ```",
-                    inline=False
-                )
-                
-                embed.add_field(
-                    name="🎵 Особенности:",
-                    value="• 🎤 Голосовой чат (Plasmovoice)\n• 🔄 Поддержка разных версий\n• 🏠 Уютное сообщество\n• 🛡️ Защищенный мир",
-                    inline=True
-                )
-                
-                embed.add_field(
-                    name="🚀 Начать играть:",
-                    value="Нажмите кнопки ниже, чтобы:\n• Посетить наш сайт\n• Узнать как подключиться\n• Посмотреть статистику\n• Получить помощь",
-                    inline=True
-                )
-                
-                embed.set_footer(text="Присоединяйтесь к нашему дружному сообществу! 💙", icon_url="https://cdn.discordapp.com/emojis/123456789.png")
-                embed.set_image(url="https://via.placeholder.com/600x200/5865F2/FFFFFF?text=MineStory+Server")  # Можно заменить на реальное изображение
-                
-                await message.edit(embed=embed, view=view)
-                logger.info(f"Обновлено существующее информационное сообщение")
-                return True
-        
-        # Если сообщение не найдено, создаем новое
-        if not has_message:
-            # Создаем красивый embed для нового сообщения
-            embed = discord.Embed(
-                title="🎮 Добро пожаловать на MineStory!",
-                description="Приватный ванильный сервер для истинных ценителей Minecraft",
-                color=discord.Color.from_rgb(88, 101, 242)  # Discord фиолетовый
-            )
-            
-            embed.add_field(
-                name="🌟 О сервере:",
-                value="MineStory - это уютное место, где можно расслабиться и насладиться классическим выживанием в Minecraft. Здесь царит дружелюбная атмосфера и взаимопомощь!",
-                inline=False
-            )
-            
-            embed.add_field(
-                name="🔧 Технические характеристики:",
-                value="```\n🎯 Версия: 1.21+\n🔌 Плагины: ViaVersion, Plasmovoice\n🌍 Тип: Ванильное выживание\n🛡️ Безопасность: Приватный доступ```",
-                inline=False
-            )
-            
-            embed.add_field(
-                name="🎵 Особенности:",
-                value="• 🎤 Голосовой чат (Plasmovoice)\n• 🔄 Поддержка разных версий\n• 🏠 Уютное сообщество\n• 🛡️ Защищенный мир",
-                inline=True
-            )
-            
-            embed.add_field(
-                name="🚀 Начать играть:",
-                value="Нажмите кнопки ниже, чтобы:\n• Посетить наш сайт\n• Узнать как подключиться\n• Посмотреть статистику\n• Получить помощь",
-                inline=True
-            )
-            
-            embed.set_footer(text="Присоединяйтесь к нашему дружному сообществу! 💙", icon_url="https://cdn.discordapp.com/emojis/123456789.png")
-            embed.set_image(url="https://via.placeholder.com/600x200/5865F2/FFFFFF?text=MineStory+Server")  # Можно заменить на реальное изображение
-            
-            # Пытаемся отправить изображение, если файл существует
-            try:
-                with open("info.jpg", "rb") as f:
-                    image = discord.File(f, filename="info.jpg")
-                    await channel.send(file=image)
-            except FileNotFoundError:
-                logger.warning("Файл info.jpg не найден, отправляем сообщение без изображения")
+        # Проверяем, есть ли уже сообщение с кнопками
+        message = await find_panel_message(channel, panel_key("info", channel.guild.id))
+        if message:
+            has_image = any(attachment.filename == INFO_IMAGE_NAME for attachment in message.attachments)
             
-            # Отправляем embed с кнопками
-            view = InfoView()
-            await channel.send(embed=embed, view=view)
-            logger.info(f"Отправлено новое информационное сообщение")
+            # Изображение загружается только если его еще нет в сообщении; сообщение не пересоздается
+            if INFO_IMAGE is not None and not has_image:
+                await edit_message(message, embed=EMBEDS["info_panel"], attachments=[info_image_file()], view=InfoView())
+                logger.info("В информационное сообщение добавлено изображение")
+            else:
+                await edit_message(message, embed=EMBEDS["info_panel"], view=InfoView())
+            logger.info("Обновлено существующее информационное сообщение")
             return True
         
+        # Если сообщение не найдено, создаем новое вместе с изображением
+        if INFO_IMAGE is not None:
+            message = await send_to(channel, embed=EMBEDS["info_panel"], file=info_image_file(), view=InfoView(), priority=PRIORITY_COSMETIC)
+        else:
+            message = await send_to(channel, embed=EMBEDS["info_panel"], view=InfoView(), priority=PRIORITY_COSMETIC)
+        remember_panel(panel_key("info", channel.guild.id), message)
+        logger.info("Отправлено новое информационное сообщение")
+        return True
+        
     except Exception as e:
-        logger.error(f"Ошибка при отправке/обновлении информационного сообщения: {e}")
+        logger.error("Ошибка при отправке/обновлении информационного сообщения: %s", e)
         return False
 
+# Единая асинхронная точка входа
+async def main():
+    if not TOKEN:
+        logger.error("ОШИБКА: Токен бота не указан в переменных окружения!")
+        logger.error("Добавьте переменную TOKEN в настройках платформы Railway")
+        return 1
+    
+    # Открываем хранилище и загружаем заявки до подключения к Discord
+    state_store.open()
+    transcript_index.open()
+    application_history.open()
+    application_store.load()
+    guild_settings.load()
+    open_tickets.load()
+    
+    # Платформа останавливает воркер через SIGTERM - закрываем соединение корректно
+    loop = asyncio.get_running_loop()
+    try:
+        loop.add_signal_handler(signal.SIGTERM, lambda: asyncio.create_task(client.close()))
+        # SIGHUP перечитывает конфигурацию без перезапуска
+        loop.add_signal_handler(signal.SIGHUP, lambda: asyncio.create_task(reload_config_on_signal()))
+    except (NotImplementedError, AttributeError):
+        pass
+    
+    try:
+        async with client:
+            await client.start(TOKEN, reconnect=True)
+    except discord.errors.LoginFailure:
+        logger.critical("Неправильный токен бота! Пожалуйста, проверьте токен и перезапустите бота.")
+        return 1
+    except Exception as e:
+        logger.critical("Критическая ошибка при запуске бота: %s", e, exc_info=True)
+        return 1
+    finally:
+        transcript_index.close()
+        application_history.close()
+        state_store.close()
+        logger.info("Бот остановлен")
+    return 0
+
 # Запуск бота
 if __name__ == "__main__":
+    setup_logging()
     try:
-        client.run(TOKEN)
-    except Exception as e:
-        logger.error(f"Критическая ошибка при запуске бота: {e}")
+        exit(asyncio.run(main()))
+    except KeyboardInterrupt:
+        logger.info("Бот остановлен пользователем")
+    finally:
+        shutdown_logging()